@@ -12,7 +12,12 @@ setuptools.setup(
     url="https://data.slub-dresden.de",
     packages=setuptools.find_packages('src', exclude=('tests')),
     package_dir={'': 'src'},
+    package_data={'lod_api': ['contexts/*.jsonld']},
     install_requires=open('requirements.txt').read().split('\n'),
+    extras_require={
+        'fast': ['orjson>=3'],
+        'compression': ['zstandard', 'brotli'],
+    },
     entry_points={
         'console_scripts': [
             'lod-api=lod_api.cli:main',
@@ -0,0 +1,109 @@
+import hmac
+import os
+
+import flask
+from flask_restx import Namespace
+from flask_restx import reqparse
+
+from lod_api.tools import cache
+from lod_api.tools import generations
+from lod_api.tools import resilience
+from lod_api.tools import singleflight
+from lod_api.tools.config_parser import get_config
+from lod_api.tools.helper import ES_wrapper
+from lod_api.tools.resource import LodResource
+
+api = Namespace(name="admin", path="/admin",
+                description="Observability and control of the api caches, "
+                            "protected by the token configured in `admin`")
+
+
+def authorized(request):
+    """ whether the request carries the configured admin token as
+        `Authorization: Bearer <token>`, always false without token """
+    token = get_config("admin", {}).get("token")
+    if not token:
+        return False
+    given = request.headers.get("Authorization", "")
+    if not given.startswith("Bearer "):
+        return False
+    return hmac.compare_digest(given[len("Bearer "):].strip().encode("utf-8"),
+                               str(token).encode("utf-8"))
+
+
+FORBIDDEN = ({'message': 'Forbidden: admin token missing or wrong'}, 403)
+
+
+def cache_stats(lod_cache):
+    """ counters, size and age distribution of `lod_cache` """
+    stats = lod_cache.stats()
+    lookups = stats["hits"] + stats["misses"]
+    stats["hit_ratio"] = round(stats["hits"] / lookups, 4) if lookups else None
+    stats["ages"] = lod_cache.ages()
+    stats["config"] = {name: lod_cache.option(name)
+                       for name in cache.defaults}
+    return stats
+
+
+@api.route('/caches', methods=['GET', 'DELETE'])
+class Caches(LodResource):
+    parser = reqparse.RequestParser()
+    parser.add_argument('cache', type=str, action="append", location="args",
+                        help="name of a cache to flush, all caches if "
+                             "neither cache nor index is given; together "
+                             "with index only the entries read from the "
+                             "index are flushed from the named caches")
+    parser.add_argument('index', type=str, location="args",
+                        help="flush the entries read from this index "
+                             "(comma separated indices) of the caches given "
+                             "by cache, of all caches if none is given")
+
+    @api.response(200, 'Success')
+    @api.response(403, 'Admin token missing or wrong')
+    @api.doc('statistics of all caches of this worker')
+    def get(self):
+        """
+        size, memory estimate, hit/miss/eviction counts and age distribution of all caches, state of the circuit breakers, coalesced elasticsearch reads and version probes
+        """
+        print(type(self).__name__)
+        if not authorized(flask.request):
+            return FORBIDDEN
+        ret = {"pid": os.getpid(),
+               "caches": {name: cache_stats(c)
+                          for name, c in sorted(cache.caches.items())},
+               "refresh": cache.refresher.stats(),
+               "breakers": resilience.breakers.state(),
+               "singleflight": singleflight.flights.stats(),
+               "version_probes": ES_wrapper.info_calls}
+        return self.response.parse(ret, "json", "", flask.request)
+
+    @api.response(200, 'Success')
+    @api.response(403, 'Admin token missing or wrong')
+    @api.response(404, 'Cache not found')
+    @api.expect(parser)
+    @api.doc('flush caches by name or index')
+    def delete(self):
+        """
+        flush caches by name or the entries read from an index
+        """
+        print(type(self).__name__)
+        if not authorized(flask.request):
+            return FORBIDDEN
+        args = self.parser.parse_args()
+        names = args.get("cache") or []
+        for name in names:
+            if name not in cache.caches:
+                return {'message': 'Not Found: no cache ' + name}, 404
+        ret = {}
+        if args.get("index"):
+            ret["dropped"] = generations.invalidate(args["index"],
+                                                    names or None)
+        elif names:
+            for name in names:
+                cache.caches[name].clear()
+            ret["cleared"] = names
+        else:
+            cache.clear_all()
+            ret["cleared"] = sorted(cache.caches)
+        print("admin: flushed {}".format(ret))
+        return self.response.parse(ret, "json", "", flask.request)
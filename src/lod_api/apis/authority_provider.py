@@ -1,16 +1,39 @@
 import flask
 from flask_restx import Namespace
 from flask_restx import reqparse
-from elasticsearch import Elasticsearch
 
 from lod_api import CONFIG
 from lod_api.tools.resource import LodResource
 from lod_api.tools.helper import ES_wrapper
+from lod_api.tools.es_client import PooledClient
+from lod_api.tools.cache import negative_cache
+from lod_api.tools.generations import tags
+from lod_api.tools.negative_lookup import missing_authority
 
 api = Namespace(name="authority_search", path="/",
                 description="Authority Provider Identifier Search")
 
 
+def _negative_key(indices, uri):
+    generation = tags(",".join(indices))
+    return ",".join(generation) + "/" + uri, generation
+
+
+def known_authority(indices, uri):
+    """ whether documents of `indices` might link the authority `uri`,
+        unknown ones are answered with an empty result without
+        elasticsearch (see `lod_api.tools.negative_lookup`) """
+    if missing_authority(indices, uri):
+        return False
+    return negative_cache.get(_negative_key(indices, uri)[0]) is None
+
+
+def forget_authority(indices, uri):
+    """ remember for a short time that no document links `uri` """
+    key, generation = _negative_key(indices, uri)
+    negative_cache.set(key, True, tags=generation)
+
+
 # flaskREST+ BUG, which ignores the last element in <any([…])> list
 #     [see](https://github.com/noirbizarre/flask-restplus/issues/695)
 # quickfix: add whitespace string as element
@@ -31,8 +54,8 @@ class AutSearch(LodResource):
         'size', type=int, help="Configure the maxmimum amount of hits to be returned", location="args", default=100)
     parser.add_argument(
         'from', type=int, help="Configure the offset from the frist result you want to fetch", location="args", default=0)
-    es_host, excludes, indices, authorities, auth_path = CONFIG.get("es_host", "excludes", "indices", "authorities", "authority_path")
-    es = Elasticsearch(es_host, timeout=10)
+    excludes, indices, authorities, auth_path = CONFIG.get("excludes", "indices", "authorities", "authority_path")
+    es = PooledClient()
 
     @api.response(200, 'Success')
     @api.response(404, 'Record(s) not found')
@@ -70,15 +93,18 @@ class AutSearch(LodResource):
                          }
                      }
                  }
-        res = ES_wrapper.call(self.es, action='search',
-                              index=','.join(CONFIG.get("indices_list")),
-                              body=search,
-                              size=args.get("size"), from_=args.get("from"),
-                              _source_excludes=self.excludes)
-
-        if "hits" in res and "hits" in res["hits"]:
-            for hit in res["hits"]["hits"]:
-                retarray.append(hit.get("_source"))
+        indices = CONFIG.get("indices_list")
+        if known_authority(indices, auth_url + name):
+            res = ES_wrapper.call(self.es, action='search',
+                                  index=','.join(indices),
+                                  body=search,
+                                  size=args.get("size"), from_=args.get("from"),
+                                  _source_excludes=self.excludes)
+            if "hits" in res and "hits" in res["hits"]:
+                for hit in res["hits"]["hits"]:
+                    retarray.append(hit.get("_source"))
+            if not retarray and not args.get("from"):
+                forget_authority(indices, auth_url + name)
         return self.response.parse(retarray, args.get("format"), ending, flask.request)
 
 
@@ -104,8 +130,8 @@ class AutEntSearch(LodResource):
         'size', type=int, help="Configure the maxmimum amount of hits to be returned", location="args", default=100)
     parser.add_argument(
         'from', type=int, help="Configure the offset from the frist result you want to fetch", location="args", default=0)
-    es_host, excludes, indices, authorities, auth_path = CONFIG.get("es_host", "excludes", "indices", "authorities", "authority_path")
-    es = Elasticsearch(es_host, timeout=10)
+    excludes, indices, authorities, auth_path = CONFIG.get("excludes", "indices", "authorities", "authority_path")
+    es = PooledClient()
 
     @api.response(200, 'Success')
     @api.response(404, 'Record(s) not found')
@@ -143,12 +169,14 @@ class AutEntSearch(LodResource):
                          }
                      }
                  }
-        res = ES_wrapper.call(self.es, action='search',
-                              index=entity_type, body=search,
-                              size=args.get("size"), from_=args.get("from"),
-                              _source_excludes=self.excludes)
-
-        if "hits" in res and "hits" in res["hits"]:
-            for hit in res["hits"]["hits"]:
-                retarray.append(hit.get("_source"))
+        if known_authority([entity_type], auth_url + name):
+            res = ES_wrapper.call(self.es, action='search',
+                                  index=entity_type, body=search,
+                                  size=args.get("size"), from_=args.get("from"),
+                                  _source_excludes=self.excludes)
+            if "hits" in res and "hits" in res["hits"]:
+                for hit in res["hits"]["hits"]:
+                    retarray.append(hit.get("_source"))
+            if not retarray and not args.get("from"):
+                forget_authority([entity_type], auth_url + name)
         return self.response.parse(retarray, args.get("format"), ending, flask.request)
@@ -11,11 +11,17 @@ from flask_restx import (
         reqparse,
         inputs
         )
-import elasticsearch
 
 
+from lod_api.tools import deadline
+from lod_api.tools.cache import bypass
+from lod_api.tools.cache import explore_cache
+from lod_api.tools.generations import tags
 from lod_api.tools.resource import LodResource
 from lod_api.tools.helper import ES_wrapper
+from lod_api.tools.es_client import get_client
+from lod_api.tools.es_async import es_call
+from lod_api.tools.es_async import run_calls
 from lod_api import CONFIG
 
 from .explore_schema import (
@@ -40,6 +46,25 @@ def translateBackendToWebapp():
     pass
 
 
+def complete(result):
+    """ only complete results are cached, see `explore_cache` """
+    return not result.get("partial")
+
+
+def cached(endpoint, args, compute):
+    """ Answer of `endpoint` for the query `args` out of `explore_cache`.
+        The aggregations are read from the resources index and their
+        entities from the other indices, thus the entries are tagged
+        with the generations of all indices. Outdated answers are served
+        at once and refreshed in the background. """
+    generation = tags(",".join(CONFIG.get("indices_list")))
+    key = json.dumps({"endpoint": endpoint, "args": args,
+                      "generation": generation}, sort_keys=True)
+    return explore_cache.fetch(key, compute, tags=generation,
+                               cacheable=complete,
+                               refresh=bypass(flask.request))
+
+
 class EntityMapper:
     def __init__(self):
         pass
@@ -174,6 +199,8 @@ class AggregationManager():
          "entityPool": {}
        }
 
+    If the time budget of the request (see `lod_api.tools.deadline`)
+    runs out, the results gathered so far are kept and `partial` is set.
     """
     def __init__(self, es, aggregations):
         self.es = es
@@ -197,6 +224,7 @@ class AggregationManager():
                                   #  for matrix aggregation
 
         self.entity_pool = {}
+        self.partial = False     # some requests ran out of time
 
         self.register_agg_methods(aggregations)
 
@@ -227,6 +255,22 @@ class AggregationManager():
         pass
 
 
+    def _check_partial(self, responses):
+        """
+        replace the responses that ran out of time with None and flag the
+        result as partial if any response is missing or incomplete
+        """
+        checked = []
+        for r in responses:
+            if isinstance(r, Exception):
+                if not deadline.is_timeout(r):
+                    raise r
+                r = None
+            if r is None or r.get("timed_out"):
+                self.partial = True
+            checked.append(r)
+        return checked
+
     def _parse_agg(self, agg):
         """
         parse aggregation into a more pythonic form - from
@@ -306,12 +350,28 @@ class AggregationManager():
 
         query = '{}\n' + '\n{}\n'.join(queries)
         print(query)
-        res = ES_wrapper.call(
-                self.es,
-                action="msearch",
-                index="resources",
-                body=query,
-            )
+        try:
+            res = ES_wrapper.call(
+                    self.es,
+                    action="msearch",
+                    index="resources",
+                    body=query,
+                )
+            responses = self._check_partial(res["responses"])
+        except Exception as e:
+            responses = self._check_partial([e])
+        # rerun the queries whose hit count is limited by elasticsearch
+        # to reveal the exact count, these requests run concurrently
+        limited = [i for i, r in enumerate(responses)
+                   if r and r["hits"]["total"]["value"] == es_limit]
+        recounts = self._check_partial(run_calls([
+            es_call(self.es, action="search", index="resources",
+                    scroll="1s", body=json.loads(queries[i]))
+            for i in limited], return_exceptions=True))
+        # keep the limited count if the recount ran out of time
+        doc_counts = {i: r["hits"]["total"]["value"]
+                      for i, r in zip(limited, recounts) if r}
+
         # iterate over responses respective to queries, i.e.:
         #     [method1subj1, method1subj2, method2subj1, method2subj2]
         ctr = 0                            # counter corresponding to queries list
@@ -320,19 +380,15 @@ class AggregationManager():
             for subj in self.agg_subjects:
                 self.result[method]["subjects"][subj] = {"aggs": {}}
                 # extract aggregations
-                r = res["responses"][ctr]
+                r = responses[ctr] if ctr < len(responses) else None
+                if r is None:
+                    # ran out of time, leave the subject empty
+                    self.result[method]["subjects"][subj].update(
+                        {"docCount": 0, "topResources": {}})
+                    ctr += 1
+                    continue
                 # store docCount for found resources
-                # TODO: rerun queries that are limited by elasticsearch (10000)
-                doc_count = r["hits"]["total"]["value"]
-                if doc_count == es_limit:
-                    res2 = ES_wrapper.call(
-                            self.es,
-                            action="search",
-                            index="resources",
-                            scroll="1s",
-                            body = json.loads(queries[ctr])
-                        )
-                    doc_count = res2["hits"]["total"]["value"]
+                doc_count = doc_counts.get(ctr, r["hits"]["total"]["value"])
                 self.result[method]["subjects"][subj]["docCount"] = doc_count
                 # iterate over aggs defines in es-query
                 for agg in r["aggregations"]:
@@ -361,22 +417,21 @@ class AggregationManager():
         """
         if query_templates:
             pass
-        if len(self.magg_query_fcts) > 0:
-            for i, query_matagg_fct in enumerate(self.magg_query_fcts):
-                method = self.agg_methods[i]
-
-                query = query_matagg_fct(subjects)
-                matagg_res = ES_wrapper.call(
-                        self.es,
-                        action="search",
-                        index="resources",
-                        body=query
-                    )
-                # gather matrix aggregation in correlations
-                self.correlations[method] = {}
-                for agg in matagg_res["aggregations"]:
-                    self.correlations[method][agg] = \
-                        self._parse_agg(matagg_res["aggregations"][agg]["buckets"])
+        # the matrix aggregations of all methods run concurrently
+        matagg_responses = self._check_partial(run_calls([
+            es_call(self.es, action="search", index="resources",
+                    body=query_matagg_fct(subjects))
+            for query_matagg_fct in self.magg_query_fcts],
+            return_exceptions=True))
+        for i, matagg_res in enumerate(matagg_responses):
+            if matagg_res is None:
+                continue
+            method = self.agg_methods[i]
+            # gather matrix aggregation in correlations
+            self.correlations[method] = {}
+            for agg in matagg_res["aggregations"]:
+                self.correlations[method][agg] = \
+                    self._parse_agg(matagg_res["aggregations"][agg]["buckets"])
 
     def _add_aggs(self, aggs):
         """
@@ -406,7 +461,8 @@ class AggregationManager():
             for agg in self.agg_names:
                 aggs = []
                 for subj in self.agg_subjects:
-                    aggs.append(self.result[method]["subjects"][subj]["aggs"][agg])
+                    aggs.append(self.result[method]["subjects"][subj]["aggs"]
+                                .get(agg, {}))
                 self.result[method]["superAgg"][agg] = self._add_aggs(aggs)
 
     def resolve_agg_entities(self, prefix="https://data.slub-dresden.de"):
@@ -418,7 +474,8 @@ class AggregationManager():
         for method in self.agg_methods:
             for subj in self.agg_subjects:
                 for agg_name in self.agg_names:
-                    agg = self.result[method]["subjects"][subj]["aggs"][agg_name]
+                    agg = self.result[method]["subjects"][subj]["aggs"].get(
+                            agg_name, {})
                     uris |= set([x for x in agg if x.startswith(prefix)])
         self.query_entities_by_uri(pool_uris=uris)
 
@@ -441,18 +498,18 @@ class AggregationManager():
                 entity_uris[index] = []
                 entity_uris[index].append(_id)
 
-        # TODO: parallelize if too slow
-        for entity, ids in entity_uris.items():
-            # TODO: remove and take from config
-            if entity == "swb":
+        # TODO: remove and take from config
+        entity_uris.pop("swb", None)
+
+        # one mget per entity index, all of them run concurrently
+        entities = list(entity_uris)
+        responses = self._check_partial(run_calls([
+            es_call(self.es, action="mget", index=f"{entity}",
+                    body={"ids": entity_uris[entity]})
+            for entity in entities], return_exceptions=True))
+        for entity, res in zip(entities, responses):
+            if res is None:
                 continue
-
-            res = ES_wrapper.call(
-                self.es,
-                action="mget",
-                index=f"{entity}",
-                body={"ids": ids}
-            )
             # collect and transform docs
             self.result["entityPool"][entity] = {}
             for r in res["docs"]:
@@ -615,8 +672,8 @@ class exploreTopics(LodResource):
         """
         print(type(self).__name__)
 
-        es_host, excludes = CONFIG.get("es_host", "excludes")
-        es = elasticsearch.Elasticsearch(es_host, timeout=10)
+        excludes = CONFIG.get("excludes")
+        es = get_client()
 
         args = self.parser.parse_args()
 
@@ -637,8 +694,8 @@ class exploreTopics(LodResource):
         """
         print(type(self).__name__)
 
-        es_host, excludes = CONFIG.get("es_host", "excludes")
-        es = elasticsearch.Elasticsearch(es_host, timeout=10)
+        excludes = CONFIG.get("excludes")
+        es = get_client()
 
         args = self.parser_post.parse_args()
 
@@ -671,21 +728,26 @@ class aggregateTopics(LodResource):
         """
         print(type(self).__name__)
 
-        es_host = CONFIG.get("es_host")
-        es = elasticsearch.Elasticsearch(es_host, timeout=10)
+        es = get_client()
 
         args = self.parser.parse_args()
 
-        am = AggregationManager(es, aggregations={
-            "topicMatch": (topic_aggs_query_topicMatch,
-                           topic_maggs_query_topicMatch),
-            "phraseMatch": (topic_aggs_query_phraseMatch,
-                           topic_maggs_query_phraseMatch)
-            })
-        am.add_agg_subjects(args.get("topics"), filter1=args.get("contributor"))
-        am.run_aggs(restriction=args.get("restrict"))
-        am.resolve_agg_entities()
-        return self.response.parse(am.result, "json", "", flask.request)
+        def aggregate():
+            am = AggregationManager(es, aggregations={
+                "topicMatch": (topic_aggs_query_topicMatch,
+                               topic_maggs_query_topicMatch),
+                "phraseMatch": (topic_aggs_query_phraseMatch,
+                               topic_maggs_query_phraseMatch)
+                })
+            am.add_agg_subjects(args.get("topics"), filter1=args.get("contributor"))
+            am.run_aggs(restriction=args.get("restrict"))
+            am.resolve_agg_entities()
+            if am.partial:
+                am.result["partial"] = True
+            return am.result
+
+        result = cached(type(self).__name__, args, aggregate)
+        return self.response.parse(result, "json", "", flask.request)
 
     parser_post = reqparse.RequestParser()
     parser_post.add_argument('queryTemplate', type=dict, required=True,
@@ -706,8 +768,7 @@ class aggregateTopics(LodResource):
         """
         print(type(self).__name__)
 
-        es_host = CONFIG.get("es_host")
-        es = elasticsearch.Elasticsearch(es_host, timeout=10)
+        es = get_client()
 
         args = self.parser_post.parse_args()
 
@@ -724,6 +785,8 @@ class aggregateTopics(LodResource):
 
         am.run_aggs(query_template=query_template)
         am.resolve_agg_entities()
+        if am.partial:
+            am.result["partial"] = True
         return self.response.parse(am.result, "json", "", flask.request)
 
 @api.route('/explore/correlations', methods=['GET'])
@@ -746,16 +809,21 @@ class correlateTopics(LodResource):
         """
         print(type(self).__name__)
 
-        es_host = CONFIG.get("es_host")
-        es = elasticsearch.Elasticsearch(es_host, timeout=10)
+        es = get_client()
 
         args = self.parser.parse_args()
 
-        am = AggregationManager(es, aggregations={
-            "topicMatch": (topic_aggs_query_topicMatch,
-                           topic_maggs_query_topicMatch),
-            "phraseMatch": (topic_aggs_query_phraseMatch,
-                           topic_maggs_query_phraseMatch)
-            })
-        am.run_correlations(args.get("topics"))
-        return self.response.parse(am.correlations, "json", "", flask.request)
+        def correlate():
+            am = AggregationManager(es, aggregations={
+                "topicMatch": (topic_aggs_query_topicMatch,
+                               topic_maggs_query_topicMatch),
+                "phraseMatch": (topic_aggs_query_phraseMatch,
+                               topic_maggs_query_phraseMatch)
+                })
+            am.run_correlations(args.get("topics"))
+            if am.partial:
+                am.correlations["partial"] = True
+            return am.correlations
+
+        result = cached(type(self).__name__, args, correlate)
+        return self.response.parse(result, "json", "", flask.request)
@@ -1,16 +1,16 @@
 import json
-from elasticsearch import Elasticsearch
 import flask
 from flask_restx import reqparse
 from flask_restx import Resource
 from flask_restx import Namespace
-from flask_jsonpify import jsonpify
 
 from lod_api import CONFIG
-from lod_api.tools.helper import get_fields_with_subfields
 from lod_api.tools.helper import isint
+from lod_api.tools.json_encoder import jsonpify
 from lod_api.tools.helper import ES_wrapper
 from lod_api.tools.helper import getNestedJsonObject
+from lod_api.tools.es_client import PooledClient
+from lod_api.tools.field_catalog import catalog
 
 api = Namespace("reconcile", path="/reconcile/",
                 description="Openrefine Reconcilation and Data Extension Operations")
@@ -82,10 +82,7 @@ class ProposeProperties(Resource):
     parser.add_argument('limit', type=str,
                         help="how many properties shall be returned")
 
-    es_host, excludes, indices = CONFIG.get(
-        "es_host", "excludes", "indices")
-
-    es = Elasticsearch(es_host, timeout=10)
+    excludes, indices = CONFIG.get("excludes", "indices")
 
     @api.response(200, 'Success')
     @api.response(400, 'Check your Limit')
@@ -100,7 +97,6 @@ class ProposeProperties(Resource):
         """
         print(type(self).__name__)
         args = self.parser.parse_args()
-        fields = set()
         limit = 256
         # some python magic to get the first element of the dictionary in indices[typ]
         typ = next(iter(self.indices))
@@ -112,18 +108,12 @@ class ProposeProperties(Resource):
             else:
                 flask.abort(400)
         if typ in self.indices:
-            fields = set()
             retDict = {}
             entity = self.indices[typ]["index"]
-            mapping = self.es.indices.get_mapping(index=entity)
-            if entity in mapping:
+            fields = catalog.propose(entity, limit)
+            if fields is not None:
                 retDict["type"] = typ
                 retDict["properties"] = []
-                enum_fields = get_fields_with_subfields("", ES_wrapper.get_mapping_props(self.es, entity, doc_type=self.indices[typ]["type"]))
-
-                for n, fld in enumerate(enum_fields):
-                    if n < limit:
-                        fields.add(fld)
                 for fld in fields:
                     retDict["properties"].append({"id": fld, "name": fld})
             return jsonpify(retDict)
@@ -134,9 +124,8 @@ class ProposeProperties(Resource):
 class SuggestEntityEntryPoint(Resource):
     parser = reqparse.RequestParser()
     parser.add_argument('prefix', type=str, help='a string the user has typed')
-    es_host, indices, indices_list = CONFIG.get(
-        "es_host", "indices", "indices_list")
-    es = Elasticsearch(es_host, timeout=10)
+    indices, indices_list = CONFIG.get("indices", "indices_list")
+    es = PooledClient()
 
     @api.response(200, 'Success')
     @api.response(400, 'Check your Limit')
@@ -206,9 +195,8 @@ class SuggestTypeEntryPoint(Resource):
 class SuggestPropertyEntryPoint(Resource):
     parser = reqparse.RequestParser()
     parser.add_argument('prefix', type=str, help='a string the user has typed')
-    es_host, excludes, indices, indices_list = CONFIG.get(
-        "es_host", "excludes", "indices", "indices_list")
-    es = Elasticsearch(es_host, timeout=10)
+    excludes, indices, indices_list = CONFIG.get(
+        "excludes", "indices", "indices_list")
     @api.response(200, 'Success')
     @api.response(400, 'Check your Limit')
     @api.response(404, 'Type not found')
@@ -220,24 +208,8 @@ class SuggestPropertyEntryPoint(Resource):
         """
         args = self.parser.parse_args()
         result = {"result": []}
-        # some python magic to get the first element of the dictionary in indices[typ]
-        mapping = self.es.indices.get_mapping(index=self.indices_list)
-        for index in mapping:
-            fields = set()
-            for doc_type in mapping[index]["mappings"]:
-                enum_fields = get_fields_with_subfields("", ES_wrapper.get_mapping_props(self.es, index, doc_type=doc_type))
-                for fld in enum_fields:
-                    fields.add(fld)
-        for fld in fields:
-            if args["prefix"] and fld.startswith(args["prefix"]) or not args["prefix"]:
-                result["result"].append({"id": fld, "name": fld})
-        return jsonpify(result)
-
-        for k, v in self.indices.items():
-            if v["description"].startswith(args["prefix"]):
-                result["result"].append({"id": k,
-                                         "name": v["index"],
-                                         "description": v["description"]})
+        for fld in catalog.suggest(args["prefix"]):
+            result["result"].append({"id": fld, "name": fld})
         return jsonpify(result)
 
 
@@ -246,8 +218,8 @@ class FlyoutEntityEntryPoint(Resource):
     parser = reqparse.RequestParser()
     parser.add_argument(
         'id', type=str, help='the identifier of the entity to render')
-    es_host, indices = CONFIG.get("es_host", "indices")
-    es = Elasticsearch(es_host, timeout=10)
+    indices = CONFIG.get("indices")
+    es = PooledClient()
 
     @api.response(200, 'Success')
     @api.response(400, 'Check your ID')
@@ -343,9 +315,9 @@ class apiData(Resource):
     parser.add_argument('extend', type=str,
                         help="extend your data with id and property")
     # parser.add_argument('query',type=str,help="OpenRefine Reconcilation API Call for Single Query") DEPRECATED
-    es_host, excludes, indices, base, doc, indices_list = CONFIG.get(
-        "es_host", "excludes", "indices", "base", "reconcile_doc", "indices_list")
-    es = Elasticsearch(es_host, timeout=10)
+    excludes, indices, base, doc, indices_list = CONFIG.get(
+        "excludes", "indices", "base", "reconcile_doc", "indices_list")
+    es = PooledClient()
     for k, v in indices.items():
         doc["defaultTypes"].append({"id": k, "name": v.get("description")})
     doc["extend"]["property_settings"][1]["default"] = ",".join(indices_list)
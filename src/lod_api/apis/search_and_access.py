@@ -5,12 +5,46 @@ import elasticsearch
 
 
 from lod_api.tools.resource import LodResource
+from lod_api.tools.cache import Refresher
+from lod_api.tools.cache import bypass
+from lod_api.tools.cache import doc_cache
+from lod_api.tools.cache import etag
+from lod_api.tools.cache import negative_cache
+from lod_api.tools.cache import representation_cache
+from lod_api.tools.cache import search_cache
+from lod_api.tools.cache import search_key
+from lod_api.tools.generations import tags
+from lod_api.tools.negative_lookup import missing_id
 from lod_api.tools.helper import ES_wrapper
+from lod_api.tools.es_client import PooledClient
+from lod_api.tools.es_client import get_client
+from lod_api.tools.config_parser import get_config
 from lod_api import CONFIG
 
 api = Namespace(name="search and access", path="/",
                 description="Search and Access Operations")
 
+# background searches of the next pages, see `prefetch_next`
+prefetcher = Refresher("search_prefetch")
+
+
+def prefetch_next(search, index, args, generation, hits):
+    """ Harvesters page through the results in order: after a full page
+        of `hits`, the next page of the search `args` is fetched in the
+        background into `search_cache` by `search`, with the workers and
+        the queue of `search_prefetch` in the config. """
+    options = get_config("search_prefetch", {})
+    size = args.get("size") or 10
+    offset = (args.get("from") or 0) + size
+    if (not options.get("enabled", False) or hits < size
+            or offset + size > options.get("max_offset", 10000)):
+        return
+    next_args = dict(args)
+    next_args["from"] = offset
+    key = search_key(",".join(generation), next_args)
+    prefetcher.submit(key, lambda: search(index, next_args, key, generation,
+                                          refresh=False, prefetch=False))
+
 
 # flaskREST+ BUG, which ignores the last element in <any([…])> list
 #     [see](https://github.com/noirbizarre/flask-restplus/issues/695)
@@ -31,8 +65,8 @@ class searchDoc(LodResource):
     parser.add_argument(
         'filter', type=str, help="filter the search by a defined value in a path. e.g. path_to_property:value", location="args")
 
-    es_host, excludes, indices = CONFIG.get("es_host", "excludes", "indices")
-    es = elasticsearch.Elasticsearch(es_host, timeout=10)
+    excludes, indices = CONFIG.get("excludes", "indices")
+    es = PooledClient()
 
     @api.response(200, 'Success')
     @api.response(404, 'Record(s) not found')
@@ -43,9 +77,25 @@ class searchDoc(LodResource):
         search on one given entity-index
         """
         print(type(self).__name__)
-        retarray = []
         args = self.parser.parse_args()
-        if entity_type in CONFIG.get("indices_list"):
+        generation = tags(entity_type)
+        key = search_key(",".join(generation), args)
+        retformat = self.response.negotiate(args.get("format"), "", flask.request)
+        return self.response.represent(
+            representation_cache, key, retformat, flask.request,
+            lambda: (self.search(entity_type, args, key, generation,
+                                 refresh=bypass(flask.request)), None),
+            tags=generation, refresh=bypass(flask.request))
+
+    def search(self, entity_type, args, key, generation, refresh=False,
+               prefetch=True):
+        """ hits of the search `args` in `entity_type`, the next page is
+            prefetched with `prefetch` """
+        retarray = []
+        cached = None if refresh else search_cache.get(key)
+        if cached is not None:
+            retarray = cached
+        elif entity_type in CONFIG.get("indices_list"):
             search = {}
             search["_source"] = {"excludes": self.excludes}
             if args.get("q") and not args.get("filter"):
@@ -68,7 +118,10 @@ class searchDoc(LodResource):
             if "hits" in res and "hits" in res["hits"]:
                 for hit in res["hits"]["hits"]:
                     retarray.append(hit.get("_source"))
-        return self.response.parse(retarray, args.get("format"), "", flask.request)
+            search_cache.set(key, retarray, tags=generation)
+        if prefetch:
+            prefetch_next(self.search, entity_type, args, generation, len(retarray))
+        return retarray
 
 
 # flaskREST+ BUG, which ignores the last element in <any([…])> list
@@ -83,8 +136,8 @@ class searchDoc(LodResource):
 @api.param('id', 'The ID-String of the record to access. Possible Values (examples):118695940, 130909696')
 class RetrieveDoc(LodResource):
 
-    es_host, excludes, indices = CONFIG.get("es_host", "excludes", "indices")
-    es = elasticsearch.Elasticsearch(es_host, timeout=10)
+    excludes, indices = CONFIG.get("excludes", "indices")
+    es = PooledClient()
     parser = reqparse.RequestParser()
     parser.add_argument(
         'format', type=str, help="set the Content-Type over this Query-Parameter. Allowed: nt, rdf, ttl, nq, jsonl, json", location="args")
@@ -98,7 +151,6 @@ class RetrieveDoc(LodResource):
         get a single record of an entity-index, or search for all records containing this record as an attribute via isAttr parameter
         """
         print(type(self).__name__)
-        retarray = []
         args = self.parser.parse_args()
         name = ""
         ending = ""
@@ -109,6 +161,21 @@ class RetrieveDoc(LodResource):
         else:
             name = id
             ending = ""
+        retformat = self.response.negotiate(args.get("format"), ending, flask.request)
+        # records are cached converted and compressed per index
+        # generation, id, format and content encoding
+        generation = tags(entity_type)
+        key = "{}/{}".format(",".join(generation), name)
+        return self.response.represent(
+            doc_cache, key, retformat, flask.request,
+            lambda: self.fetch(entity_type, name, retformat, key, generation),
+            tags=generation)
+
+    def fetch(self, entity_type, name, retformat, key, generation):
+        """ the record `name` of `entity_type` and its entity tag """
+        # unknown ids are answered without elasticsearch
+        if missing_id(entity_type, name) or negative_cache.get(key):
+            flask.abort(404)
         typ = None
         for index in self.indices:
             if entity_type == self.indices[index]["index"]:
@@ -117,10 +184,12 @@ class RetrieveDoc(LodResource):
         try:
             res = ES_wrapper.call(self.es, action="get", index=entity_type, doc_type=typ,
                                   id=name, _source_excludes=self.excludes)
+        except elasticsearch.NotFoundError:
+            negative_cache.set(key, True, tags=generation)
+            flask.abort(404)
         except elasticsearch.ElasticsearchException:
             flask.abort(404)
-        retarray.append(res.get("_source"))
-        return self.response.parse(retarray, args.get("format"), ending, flask.request)
+        return [res.get("_source")], etag(res, retformat)
 
 
 @api.route('/search', methods=['GET', "PUT", "POST"])
@@ -147,12 +216,34 @@ class ESWrapper(LodResource):
         """
         search over all entity-indices
         """
-        es_host, excludes, indices = CONFIG.get("es_host", "excludes", "indices")
-        es = elasticsearch.Elasticsearch(es_host, timeout=10)
-
         print(type(self).__name__)
-        retarray = []
         args = self.parser.parse_args()
+        searchindex = CONFIG.get("indices_list")
+        if len(searchindex) > 1:
+            searchindex = ','.join(searchindex)
+        else:
+            searchindex = searchindex[0]
+        generation = tags(searchindex)
+        key = search_key(",".join(generation), args)
+        retformat = self.response.negotiate(args.get("format"), "", flask.request)
+        return self.response.represent(
+            representation_cache, key, retformat, flask.request,
+            lambda: (self.search(searchindex, args, key, generation,
+                                 refresh=bypass(flask.request)), None),
+            tags=generation, refresh=bypass(flask.request))
+
+    def search(self, searchindex, args, key, generation, refresh=False,
+               prefetch=True):
+        """ hits of the search `args` over all indices, the next page is
+            prefetched with `prefetch` """
+        excludes = CONFIG.get("excludes")
+        es = get_client()
+        retarray = []
+        cached = None if refresh else search_cache.get(key)
+        if cached is not None:
+            if prefetch:
+                prefetch_next(self.search, searchindex, args, generation, len(cached))
+            return cached
         search = {}
         search["_source"] = {"excludes": excludes}
         if args["q"] and not args["filter"]:
@@ -173,14 +264,12 @@ class ESWrapper(LodResource):
             sort_fields = args["sort"].split(":")
             search["sort"] = [{sort_fields[0] + ".keyword":sort_fields[1]}]
         #    print(json.dumps(search,indent=4))
-        searchindex = CONFIG.get("indices_list")
-        if len(searchindex) > 1:
-            searchindex = ','.join(searchindex)
-        else:
-            searchindex = searchindex[0]
         res = ES_wrapper.call(es, action="search", index=searchindex, body=search,
                               size=args["size"], from_=args["from"], _source_excludes=excludes)
         if "hits" in res and "hits" in res["hits"]:
             for hit in res["hits"]["hits"]:
                 retarray.append(hit.get("_source"))
-        return self.response.parse(retarray, args.get("format"), "", flask.request)
+        search_cache.set(key, retarray, tags=generation)
+        if prefetch:
+            prefetch_next(self.search, searchindex, args, generation, len(retarray))
+        return retarray
@@ -2,6 +2,7 @@ import requests
 import flask
 from flask_restx import Namespace
 
+from lod_api.tools.json_encoder import jsonify
 from lod_api.tools.resource import LodResource
 from lod_api import CONFIG
 
@@ -29,6 +30,6 @@ class GetSourceData(LodResource):
             url = "{}{}".format(self.source_indices[source_index], id)
             res = requests.get(url)
             if res.ok and "_source" in res.json():
-                return flask.jsonify(res.json()["_source"])
+                return jsonify(res.json()["_source"])
             else:
                 flask.abort(404)
@@ -20,8 +20,13 @@ def parse_arguments():
                         help="use flask\'s debug mode")
 
     parser.add_argument("action", nargs="?",
-                        choices=["start", "stop", "restart"],
-                        help="action for daemon start|stop|restart")
+                        choices=["start", "stop", "restart", "build-filters"],
+                        help="action for daemon start|stop|restart, or "
+                             "build-filters to build the filters of the "
+                             "existing ids of all indices, run it after "
+                             "each reindex: the filters only apply to the "
+                             "generation of the indices they were built "
+                             "from")
     return parser
 
 
@@ -64,7 +69,11 @@ def start_api(debug=True, action=None, config_file=None):
 
     read_config(config_file)
     from lod_api import flask_api
+    from lod_api.tools import generations
+    from lod_api.tools import warmup
     if debug:
+        generations.tracker.start()
+        warmup.start(flask_api.app)
         flask_api.run_app()
     else:
         if not action:
@@ -92,6 +101,9 @@ def start_api(debug=True, action=None, config_file=None):
                                             pidfile=pidfile)
             host = lod_api.CONFIG.get("apihost")
             port = lod_api.CONFIG.get("apiport")
+            # fill the caches before serving requests
+            generations.tracker.start()
+            warmup.start(flask_api.app)
             bjoern.run(flask_api.app, host, port)
 
 
@@ -104,6 +116,12 @@ def main():
     else:
         config = None
 
+    if args.action == "build-filters":
+        read_config(config)
+        from lod_api.tools import negative_lookup
+        negative_lookup.build_all()
+        return
+
     try:
         start_api(debug=args.debug, action=args.action,
                   config_file=config)
@@ -1,11 +1,17 @@
 import sys
+import elasticsearch
 from flask import Flask
+from flask import request
 from flask import render_template
 from flask_cors import CORS
 from flask_restx import Api
+from werkzeug.exceptions import HTTPException
 
 from lod_api import CONFIG
 from lod_api.swagger.ui import swagger_ui
+from lod_api.tools import deadline
+from lod_api.tools import resilience
+from lod_api.tools import warmup
 
 
 app = Flask(__name__)
@@ -41,6 +47,64 @@ if CONFIG.get("frontend_template"):
                                specs_url=api.specs_url))
 
 
+def resource_name():
+    """ name of the resource class (e.g. `RetrieveDoc`) serving the
+        current request """
+    view = app.view_functions.get(request.endpoint)
+    return getattr(getattr(view, "view_class", None), "__name__", None)
+
+
+@app.before_request
+def start_deadline():
+    """ time budget of the request according to its resource class, see
+        `lod_api.tools.deadline` """
+    deadline.start(resource_name())
+
+
+@api.errorhandler(deadline.DeadlineExceeded)
+@api.errorhandler(elasticsearch.ConnectionTimeout)
+def deadline_handler(e: Exception):
+    """ the time budget of the request ran out """
+    return {'message': 'Gateway Timeout: ' + str(e)}, 504
+
+
+@api.errorhandler(resilience.CircuitOpenError)
+def circuit_open_handler(e: resilience.CircuitOpenError):
+    """ fail fast while elasticsearch is unavailable for an index """
+    return ({'message': 'Service Unavailable: ' + str(e)}, 503,
+            {'Retry-After': str(e.retry_after)})
+
+
+@api.errorhandler(elasticsearch.ConnectionError)
+def es_connection_handler(e: elasticsearch.ConnectionError):
+    """ elasticsearch could not be reached even after retrying """
+    return {'message': 'Service Unavailable: elasticsearch not reachable'}, 503
+
+
+@app.after_request
+def add_stale_warning(response):
+    """ flag responses served from an outdated cache, see
+        `lod_api.tools.resilience.mark_stale` """
+    if resilience.is_stale():
+        response.headers['Warning'] = '110 - "Response is Stale"'
+    return response
+
+
+@app.after_request
+def count_popular(response):
+    """ histogram of the popular requests to warm up the caches with,
+        see `lod_api.tools.warmup` """
+    warmup.record(request, response, resource_name())
+    return response
+
+
+@api.errorhandler(HTTPException)
+def http_exception_handler(e: HTTPException):
+    """ keep the status of `flask.abort` (e.g. 404 of unknown records)
+        instead of turning it into an internal server error """
+    return {'message': '{}: {}'.format(e.name, e.description)}, e.code
+
+
 @api.errorhandler(Exception)
 def generic_exception_handler(e: Exception):
     def get_type_or_class_name(var) -> str:
@@ -0,0 +1,417 @@
+""" Caches of the api endpoints
+
+    All caches of the endpoints are instances of `Cache`, bounded by
+    their count of entries and by the size of the stored values. Entries
+    expire after `ttl` seconds, the least recently used entries are
+    evicted first. The entries are stored by the backend configured in
+    `cache_backend` (see `lod_api.tools.cache_backends`): in the memory
+    of each worker process, in a sqlite file shared by all workers of a
+    host or on a redis server.
+
+    The caches of the endpoints are configured by a section of the same
+    name in the config, e.g. `doc_cache` for single records:
+        doc_cache:
+          maxsize: 10000        # entries
+          max_bytes: 67108864   # sum of the sizes of the values
+          ttl: 300              # seconds
+          stale: 0              # seconds
+          stale_if_error: 0     # seconds
+    A `maxsize` of 0 disables the cache.
+
+    Caches of expensive answers (e.g. the explore aggregations) are
+    used with `Cache.fetch`: for `stale` seconds after its `ttl` (soft
+    TTL), an entry is still served at once while a bounded pool of
+    background threads refreshes it (see `Refresher`, `cache_refresh` in
+    the config). Only after `ttl` + `stale` seconds (hard TTL) the
+    clients wait for elasticsearch. For `stale_if_error` seconds after
+    the hard TTL, the outdated value is served if elasticsearch is
+    unavailable (circuit breaker open or cluster failure).
+
+    Entries can be tagged with the indices they were read from, together
+    with the generation of these indices (see `lod_api.tools.generations`),
+    `invalidate_all` drops the entries of a tag from all caches.
+
+    Clients bypass the caches with `Cache-Control: no-cache` (see
+    `bypass`): the answer is fetched from elasticsearch and replaces the
+    cached one.
+"""
+import collections
+import hashlib
+import json
+import os
+import sqlite3
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from lod_api.tools import cache_backends
+from lod_api.tools import resilience
+from lod_api.tools.config_parser import get_config
+
+# defaults for the config sections of the caches
+defaults = {
+    "maxsize": 10000,
+    "max_bytes": 64 * 1024 * 1024,
+    "ttl": 300,
+    "stale": 0,
+    "stale_if_error": 0,
+}
+
+
+# defaults for the `cache_backend` config section
+backend_defaults = {
+    "type": "memory",
+    "path": None,
+    "url": None,
+}
+
+# defaults for the `cache_refresh` config section
+refresh_defaults = {
+    "workers": 2,
+    "queue": 100,
+}
+
+# name → cache, all caches of the api
+caches = {}
+
+_backend = None
+_backend_pid = None
+_backend_lock = threading.Lock()
+
+
+def backend_option(name):
+    return get_config("cache_backend", {}).get(name, backend_defaults[name])
+
+
+def get_backend():
+    """ backend configured in `cache_backend`, created once per process """
+    global _backend, _backend_pid
+    with _backend_lock:
+        if _backend is None or _backend_pid != os.getpid():
+            kind = backend_option("type")
+            if kind == "sqlite":
+                _backend = cache_backends.SqliteBackend(backend_option("path"))
+            elif kind == "redis":
+                _backend = cache_backends.RedisBackend(backend_option("url"))
+            else:
+                _backend = cache_backends.MemoryBackend()
+            _backend_pid = os.getpid()
+    return _backend
+
+
+def reset_backend():
+    """ use the configured backend again with the next access """
+    global _backend
+    with _backend_lock:
+        _backend = None
+
+
+# errors of unavailable shared backends, the caches are skipped then
+BACKEND_ERRORS = (OSError, sqlite3.Error, cache_backends.RespError)
+
+
+class Refresher:
+    """ Bounded pool of background threads refreshing stale entries.
+        At most one refresh per key is queued or running at a time,
+        refreshes beyond `queue` pending ones are dropped. The options
+        are read from the config section `section`. """
+
+    def __init__(self, section="cache_refresh"):
+        self.section = section
+        self._executor = None
+        self._pid = None
+        self._pending = set()
+        self._lock = threading.Lock()
+        self.refreshed = 0
+        self.failed = 0
+        self.dropped = 0
+
+    def option(self, name):
+        return get_config(self.section, {}).get(name, refresh_defaults[name])
+
+    def _pool(self):
+        """ the threads of the pool, created once per process """
+        if self._executor is None or self._pid != os.getpid():
+            self._executor = ThreadPoolExecutor(
+                max_workers=self.option("workers"),
+                thread_name_prefix=self.section)
+            self._pending = set()
+            self._pid = os.getpid()
+        return self._executor
+
+    def submit(self, key, fn):
+        """ run `fn` in the background unless a refresh of `key` is
+            already pending, returns whether it was submitted """
+        with self._lock:
+            pool = self._pool()
+            if key in self._pending:
+                return False
+            if len(self._pending) >= self.option("queue"):
+                self.dropped += 1
+                return False
+            self._pending.add(key)
+        pool.submit(self._run, key, fn)
+        return True
+
+    def _run(self, key, fn):
+        try:
+            fn()
+            self.refreshed += 1
+        except Exception as e:
+            self.failed += 1
+            print("{} of {} failed: {}".format(self.section, key, e))
+        finally:
+            with self._lock:
+                self._pending.discard(key)
+
+    def stats(self):
+        return {"pending": len(self._pending),
+                "refreshed": self.refreshed,
+                "failed": self.failed,
+                "dropped": self.dropped}
+
+
+refresher = Refresher()
+
+
+class Cache:
+    """ Cache with expiring entries, bounded by its count of entries and
+        by the size of the stored values. The entries are kept by the
+        configured backend (or `backend`) in a namespace named like the
+        cache. """
+
+    def __init__(self, name, maxsize=None, max_bytes=None, ttl=None,
+                 backend=None, stale=None, stale_if_error=None):
+        self.name = name
+        self._options = {"maxsize": maxsize, "max_bytes": max_bytes,
+                         "ttl": ttl, "stale": stale,
+                         "stale_if_error": stale_if_error}
+        self._backend = backend
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.errors = 0
+        self.stale = 0
+        caches[name] = self
+
+    def option(self, name):
+        """ option given to the constructor, else of the config section
+            named like the cache """
+        if self._options[name] is not None:
+            return self._options[name]
+        return get_config(self.name, {}).get(name, defaults[name])
+
+    @property
+    def backend(self):
+        return self._backend or get_backend()
+
+    @property
+    def enabled(self):
+        return self.option("maxsize") > 0
+
+    def _failed(self, action, e):
+        self.errors += 1
+        print("cache {}: {} failed on {} backend: {}"
+              .format(self.name, action, self.backend.name, e))
+
+    def get(self, key, default=None):
+        """ value of `key` if it is cached and not expired """
+        value = None
+        if self.enabled:
+            try:
+                value = self.backend.get(self.name, key)
+            except BACKEND_ERRORS as e:
+                self._failed("get", e)
+        if value is None:
+            self.misses += 1
+            return default
+        self.hits += 1
+        return value
+
+    def set(self, key, value, ttl=None, tags=()):
+        """ store `value` under `key` tagged with `tags`, evict old
+            entries if necessary """
+        if not self.enabled:
+            return
+        if ttl is None:
+            ttl = self.option("ttl")
+        try:
+            self.evictions += self.backend.set(
+                self.name, key, value, ttl,
+                self.option("maxsize"), self.option("max_bytes"), tags)
+        except BACKEND_ERRORS as e:
+            self._failed("set", e)
+
+    def fetch(self, key, compute, tags=(), cacheable=None, refresh=False):
+        """ Value of `key`, `compute()` gives it on a miss (or with
+            `refresh`). Within `stale` seconds after its `ttl`, the
+            outdated value is returned and refreshed in the background.
+            Values for which `cacheable(value)` is false (e.g. partial
+            results) are returned without being cached. After the hard
+            TTL, the value is returned for `stale_if_error` seconds if
+            `compute()` fails because elasticsearch is unavailable.
+            Entries of `fetch` are meant to be read by `fetch` only. """
+        entry = None if refresh else self.get(key)
+        if entry is None:
+            return self._compute(key, compute, tags, cacheable)
+        now = time.time()
+        if entry.get("expires", now) <= now:
+            try:
+                return self._compute(key, compute, tags, cacheable)
+            except Exception as e:
+                if not (isinstance(e, resilience.CircuitOpenError)
+                        or resilience.is_failure(e)):
+                    raise
+                print("cache {}: serving outdated {}: {}"
+                      .format(self.name, key, e))
+                self.stale += 1
+                resilience.mark_stale()
+                return entry["value"]
+        if entry["fresh"] < now:
+            self.stale += 1
+            refresher.submit(
+                (self.name, key),
+                lambda: self._compute(key, compute, tags, cacheable))
+            resilience.mark_stale()
+        return entry["value"]
+
+    def _compute(self, key, compute, tags, cacheable):
+        value = compute()
+        if cacheable is None or cacheable(value):
+            ttl, stale = self.option("ttl"), self.option("stale")
+            now = time.time()
+            self.set(key, {"value": value, "fresh": now + ttl,
+                           "expires": now + ttl + stale},
+                     ttl=ttl + stale + self.option("stale_if_error"),
+                     tags=tags)
+        return value
+
+    def delete(self, key):
+        try:
+            self.backend.delete(self.name, key)
+        except BACKEND_ERRORS as e:
+            self._failed("delete", e)
+
+    def invalidate(self, tag):
+        """ drop all entries tagged with `tag` """
+        try:
+            return self.backend.invalidate(self.name, tag)
+        except BACKEND_ERRORS as e:
+            self._failed("invalidate", e)
+            return 0
+
+    def clear(self):
+        try:
+            self.backend.clear(self.name)
+        except BACKEND_ERRORS as e:
+            self._failed("clear", e)
+
+    def __len__(self):
+        return self.stats()["entries"]
+
+    def stats(self):
+        ret = {"backend": self.backend.name,
+               "hits": self.hits,
+               "misses": self.misses,
+               "evictions": self.evictions,
+               "errors": self.errors,
+               "stale": self.stale}
+        try:
+            ret.update(self.backend.stats(self.name))
+        except BACKEND_ERRORS as e:
+            self._failed("stats", e)
+        return ret
+
+    def ages(self):
+        """ count of entries per age (see `AGE_BUCKETS`), None if the
+            backend does not know the age of its entries """
+        try:
+            ages = self.backend.ages(self.name)
+        except BACKEND_ERRORS as e:
+            self._failed("ages", e)
+            return None
+        if ages is None:
+            return None
+        histogram = collections.OrderedDict(
+            (label, 0) for _, label in AGE_BUCKETS)
+        for age in ages:
+            for limit, label in AGE_BUCKETS:
+                if age < limit:
+                    histogram[label] += 1
+                    break
+        return histogram
+
+
+# upper limits in seconds and labels of the age distribution of entries
+AGE_BUCKETS = (
+    (10, "<10s"),
+    (60, "<1m"),
+    (600, "<10m"),
+    (3600, "<1h"),
+    (86400, "<1d"),
+    (float("inf"), ">=1d"),
+)
+
+
+def etag(doc, *parts):
+    """ Entity tag of the representation of an elasticsearch document
+        `doc` (result of a `get`) out of its concrete index, `_seq_no`
+        and `_primary_term`, thus it changes with every change of the
+        document. Further `parts` (e.g. the format) distinguish the
+        representations of the same document. Elasticsearch servers
+        without sequence numbers fall back to the `_version`. """
+    if "_seq_no" in doc and "_primary_term" in doc:
+        stamp = "{}.{}".format(doc["_primary_term"], doc["_seq_no"])
+    else:
+        stamp = "v{}".format(doc.get("_version", 0))
+    tag = "|".join([doc.get("_index", ""), doc.get("_id", ""), stamp]
+                   + [str(p) for p in parts])
+    return hashlib.sha1(tag.encode("utf-8")).hexdigest()
+
+
+# query parameters determining the result of a search
+SEARCH_PARAMS = ("q", "filter", "sort", "size", "from")
+
+
+def bypass(request):
+    """ whether the client asks not to be served from a cache """
+    directives = request.headers.get("Cache-Control", "") + "," \
+        + request.headers.get("Pragma", "")
+    return any(d.strip().lower() in ("no-cache", "no-store")
+               for d in directives.split(","))
+
+
+def search_key(index, args):
+    """ Key of a search out of its target `index` and the normalized
+        query parameters `args` """
+    params = {}
+    for name in SEARCH_PARAMS:
+        value = args.get(name)
+        if isinstance(value, str):
+            value = value.strip()
+        if value not in (None, ""):
+            params[name] = value
+    return json.dumps({"index": index, "params": params}, sort_keys=True)
+
+
+def invalidate_all(tag, names=None):
+    """ drop the entries tagged with `tag` from all caches, or only from
+        the caches `names`, returns their count """
+    return sum(cache.invalidate(tag) for name, cache in list(caches.items())
+               if names is None or name in names)
+
+
+def clear_all():
+    """ drop the entries of all caches """
+    for cache in list(caches.values()):
+        cache.clear()
+
+
+doc_cache = Cache("doc_cache")
+search_cache = Cache("search_cache")
+explore_cache = Cache("explore_cache")
+# converted and compressed search results, see `Response.represent`
+representation_cache = Cache("representation_cache")
+# misses of records and authority identifiers, see
+# `lod_api.tools.negative_lookup`
+negative_cache = Cache("negative_cache")
@@ -0,0 +1,443 @@
+""" Storage backends of the api caches (see `lod_api.tools.cache`)
+
+    memory  least recently used entries within the process, each worker
+            holds its own entries
+    sqlite  file shared by all workers of a host (by default on the
+            memory backed /dev/shm), it survives restarts of the api
+    redis   redis server (or any server speaking its protocol) shared by
+            all workers and hosts, the size of the cache is bounded by
+            the `maxmemory` setting of the server
+
+    All backends keep the entries of each cache in a namespace of their
+    own. Entries can be tagged (e.g. with the indices they were read
+    from), `invalidate` drops all entries of a tag. Entries of the shared
+    backends are stored as json, thus they
+    can hold json data and bytes only.
+"""
+import base64
+import collections
+import json
+import os
+import socket
+import sqlite3
+import sys
+import tempfile
+import threading
+import time
+from urllib.parse import urlparse
+
+
+def sizeof(value):
+    """ approximate size of a cached value in bytes """
+    if isinstance(value, dict):
+        return sum(sizeof(k) + sizeof(v) for k, v in value.items())
+    if isinstance(value, (list, tuple)):
+        return sum(sizeof(v) for v in value)
+    return sys.getsizeof(value)
+
+
+def _default(obj):
+    if isinstance(obj, bytes):
+        return {"__bytes__": base64.b64encode(obj).decode("ascii")}
+    raise TypeError("cannot cache {}".format(type(obj).__name__))
+
+
+def _object_hook(obj):
+    if len(obj) == 1 and "__bytes__" in obj:
+        return base64.b64decode(obj["__bytes__"])
+    return obj
+
+
+def encode(value):
+    """ serialize a cached value for the shared backends """
+    return json.dumps(value, default=_default,
+                      separators=(",", ":")).encode("utf-8")
+
+
+def decode(data):
+    return json.loads(data, object_hook=_object_hook)
+
+
+class MemoryBackend:
+    """ Least recently used entries in the memory of the process """
+    name = "memory"
+
+    def __init__(self):
+        # namespace → key → (expires, size, value, tags, stored)
+        self._entries = collections.defaultdict(collections.OrderedDict)
+        self._bytes = collections.Counter()
+        # namespace → tag → keys
+        self._tags = collections.defaultdict(
+            lambda: collections.defaultdict(set))
+        self._lock = threading.Lock()
+
+    def _drop(self, namespace, key):
+        _, size, _, tags, _ = self._entries[namespace].pop(key)
+        self._bytes[namespace] -= size
+        for tag in tags:
+            keys = self._tags[namespace].get(tag)
+            if keys is not None:
+                keys.discard(key)
+                if not keys:
+                    del self._tags[namespace][tag]
+
+    def get(self, namespace, key):
+        with self._lock:
+            entries = self._entries[namespace]
+            entry = entries.get(key)
+            if entry is None:
+                return None
+            if entry[0] < time.time():
+                self._drop(namespace, key)
+                return None
+            entries.move_to_end(key)
+            return entry[2]
+
+    def set(self, namespace, key, value, ttl, maxsize, max_bytes, tags=()):
+        """ store `value`, returns the count of evicted entries """
+        size = sizeof(value)
+        if size > max_bytes:
+            return 0
+        evicted = 0
+        with self._lock:
+            entries = self._entries[namespace]
+            if key in entries:
+                self._drop(namespace, key)
+            now = time.time()
+            entries[key] = (now + ttl, size, value, tuple(tags), now)
+            self._bytes[namespace] += size
+            for tag in tags:
+                self._tags[namespace][tag].add(key)
+            while (len(entries) > maxsize
+                   or self._bytes[namespace] > max_bytes):
+                self._drop(namespace, next(iter(entries)))
+                evicted += 1
+        return evicted
+
+    def delete(self, namespace, key):
+        with self._lock:
+            if key in self._entries[namespace]:
+                self._drop(namespace, key)
+
+    def invalidate(self, namespace, tag):
+        """ drop all entries tagged with `tag`, returns their count """
+        with self._lock:
+            keys = list(self._tags[namespace].pop(tag, ()))
+            for key in keys:
+                self._drop(namespace, key)
+        return len(keys)
+
+    def clear(self, namespace):
+        with self._lock:
+            self._entries.pop(namespace, None)
+            self._bytes.pop(namespace, None)
+            self._tags.pop(namespace, None)
+
+    def stats(self, namespace):
+        return {"entries": len(self._entries[namespace]),
+                "bytes": self._bytes[namespace]}
+
+    def ages(self, namespace):
+        """ seconds since each entry was stored """
+        now = time.time()
+        with self._lock:
+            return [now - entry[4]
+                    for entry in self._entries[namespace].values()]
+
+
+class SqliteBackend:
+    """ Entries in a sqlite database shared by the workers of a host.
+        The count and size of the entries of each namespace are kept up
+        to date by triggers in the `totals` table. """
+    name = "sqlite"
+
+    # seconds within which an entry is not marked as accessed again,
+    # each mark takes the write lock of the database
+    touch = 5
+
+    def __init__(self, path=None):
+        if path is None:
+            directory = "/dev/shm" if os.path.isdir("/dev/shm") \
+                else tempfile.gettempdir()
+            path = os.path.join(directory, "lod-api-cache.sqlite")
+        self.path = path
+        self._local = threading.local()
+        con = self._connection()
+        con.execute("BEGIN IMMEDIATE")
+        try:
+            con.execute("CREATE TABLE IF NOT EXISTS entries ("
+                        " namespace TEXT, key TEXT, value BLOB, size INTEGER,"
+                        " expires REAL, accessed REAL, tags TEXT, stored REAL,"
+                        " PRIMARY KEY (namespace, key))")
+            con.execute("CREATE INDEX IF NOT EXISTS entries_accessed"
+                        " ON entries (namespace, accessed)")
+            # count and size of the entries of each namespace
+            con.execute("CREATE TABLE IF NOT EXISTS totals ("
+                        " namespace TEXT PRIMARY KEY, count INTEGER,"
+                        " bytes INTEGER)")
+            con.execute("CREATE TRIGGER IF NOT EXISTS totals_insert"
+                        " AFTER INSERT ON entries BEGIN"
+                        " INSERT OR IGNORE INTO totals"
+                        " VALUES (new.namespace, 0, 0);"
+                        " UPDATE totals SET count = count + 1,"
+                        " bytes = bytes + new.size"
+                        " WHERE namespace = new.namespace;"
+                        " END")
+            con.execute("CREATE TRIGGER IF NOT EXISTS totals_delete"
+                        " AFTER DELETE ON entries BEGIN"
+                        " UPDATE totals SET count = count - 1,"
+                        " bytes = bytes - old.size"
+                        " WHERE namespace = old.namespace;"
+                        " END")
+            con.execute("COMMIT")
+        except BaseException:
+            con.execute("ROLLBACK")
+            raise
+
+    def _connection(self):
+        """ one connection per thread and process """
+        con = getattr(self._local, "con", None)
+        if con is None or self._local.pid != os.getpid():
+            con = sqlite3.connect(self.path, timeout=5,
+                                  isolation_level=None)
+            con.execute("PRAGMA journal_mode=WAL")
+            con.execute("PRAGMA synchronous=OFF")
+            self._local.con = con
+            self._local.pid = os.getpid()
+        return con
+
+    def get(self, namespace, key):
+        con = self._connection()
+        row = con.execute("SELECT value, expires, accessed FROM entries"
+                          " WHERE namespace = ? AND key = ?",
+                          (namespace, key)).fetchone()
+        if row is None:
+            return None
+        now = time.time()
+        if row[1] < now:
+            self.delete(namespace, key)
+            return None
+        if row[2] is None or now - row[2] > self.touch:
+            con.execute("UPDATE entries SET accessed = ?"
+                        " WHERE namespace = ? AND key = ?",
+                        (now, namespace, key))
+        return decode(row[0])
+
+    def set(self, namespace, key, value, ttl, maxsize, max_bytes, tags=()):
+        data = encode(value)
+        if len(data) > max_bytes:
+            return 0
+        now = time.time()
+        # "|tag1|tag2|" to find the entries of a tag with LIKE
+        tags = "|" + "|".join(tags) + "|"
+        con = self._connection()
+        con.execute("BEGIN IMMEDIATE")
+        try:
+            # no INSERT OR REPLACE, its delete does not fire the trigger
+            con.execute("DELETE FROM entries WHERE namespace = ? AND key = ?",
+                        (namespace, key))
+            con.execute("INSERT INTO entries (namespace, key,"
+                        " value, size, expires, accessed, tags, stored)"
+                        " VALUES (?,?,?,?,?,?,?,?)",
+                        (namespace, key, data, len(data), now + ttl, now,
+                         tags, now))
+            count, size = con.execute(
+                "SELECT count, bytes FROM totals WHERE namespace = ?",
+                (namespace,)).fetchone()
+            evict = []
+            if count > maxsize or size > max_bytes:
+                # least recently accessed entries first
+                for old_key, old_size in con.execute(
+                        "SELECT key, size FROM entries WHERE namespace = ?"
+                        " ORDER BY accessed", (namespace,)):
+                    if count <= maxsize and size <= max_bytes:
+                        break
+                    evict.append((namespace, old_key))
+                    count -= 1
+                    size -= old_size
+                con.executemany("DELETE FROM entries"
+                                " WHERE namespace = ? AND key = ?", evict)
+            con.execute("COMMIT")
+        except BaseException:
+            con.execute("ROLLBACK")
+            raise
+        return len(evict)
+
+    def delete(self, namespace, key):
+        self._connection().execute(
+            "DELETE FROM entries WHERE namespace = ? AND key = ?",
+            (namespace, key))
+
+    def invalidate(self, namespace, tag):
+        pattern = "%|" + tag.replace("%", r"\%").replace("_", r"\_") + "|%"
+        return self._connection().execute(
+            "DELETE FROM entries WHERE namespace = ?"
+            r" AND tags LIKE ? ESCAPE '\'", (namespace, pattern)).rowcount
+
+    def clear(self, namespace):
+        self._connection().execute(
+            "DELETE FROM entries WHERE namespace = ?", (namespace,))
+
+    def stats(self, namespace):
+        row = self._connection().execute(
+            "SELECT count, bytes FROM totals WHERE namespace = ?",
+            (namespace,)).fetchone()
+        count, size = row or (0, 0)
+        return {"entries": count, "bytes": int(size)}
+
+    def ages(self, namespace):
+        now = time.time()
+        return [now - stored for stored, in self._connection().execute(
+            "SELECT stored FROM entries WHERE namespace = ?"
+            " AND stored IS NOT NULL", (namespace,))]
+
+
+class RespError(Exception):
+    """ error reply of a redis server """
+
+
+class RespClient:
+    """ Minimal client of the redis serialization protocol (RESP),
+        one connection per thread and process. """
+
+    def __init__(self, url="redis://127.0.0.1:6379/0", timeout=1.0):
+        url = urlparse(url)
+        self.host = url.hostname or "127.0.0.1"
+        self.port = url.port or 6379
+        self.password = url.password
+        self.db = int(url.path.strip("/") or 0)
+        self.timeout = timeout
+        self._local = threading.local()
+
+    def _connect(self):
+        sock = socket.create_connection((self.host, self.port),
+                                        timeout=self.timeout)
+        self._local.sock = sock
+        self._local.reader = sock.makefile("rb")
+        self._local.pid = os.getpid()
+        if self.password:
+            self._command("AUTH", self.password)
+        if self.db:
+            self._command("SELECT", self.db)
+
+    def _read(self):
+        reader = self._local.reader
+        line = reader.readline()
+        if not line:
+            raise ConnectionError("connection closed by redis server")
+        kind, rest = line[:1], line[1:-2]
+        if kind == b"+":
+            return rest.decode("utf-8")
+        if kind == b"-":
+            raise RespError(rest.decode("utf-8"))
+        if kind == b":":
+            return int(rest)
+        if kind == b"$":
+            length = int(rest)
+            if length < 0:
+                return None
+            data = reader.read(length + 2)
+            return data[:-2]
+        if kind == b"*":
+            length = int(rest)
+            if length < 0:
+                return None
+            return [self._read() for _ in range(length)]
+        raise RespError("unknown reply {!r}".format(line))
+
+    def _command(self, *args):
+        parts = [b"*%d\r\n" % len(args)]
+        for arg in args:
+            if not isinstance(arg, bytes):
+                arg = str(arg).encode("utf-8")
+            parts.append(b"$%d\r\n%s\r\n" % (len(arg), arg))
+        self._local.sock.sendall(b"".join(parts))
+        return self._read()
+
+    def command(self, *args):
+        """ send a command and return its reply, reconnects once if the
+            connection was lost """
+        for attempt in (0, 1):
+            if (getattr(self._local, "sock", None) is None
+                    or self._local.pid != os.getpid()):
+                self._connect()
+            try:
+                return self._command(*args)
+            except (OSError, ConnectionError):
+                self._local.sock = None
+                if attempt:
+                    raise
+
+
+class RedisBackend:
+    """ Entries on a redis server, expired by the server. The size of
+        the cache is bounded by the `maxmemory` of the server. """
+    name = "redis"
+
+    def __init__(self, url=None, prefix="lod-api"):
+        self.client = RespClient(url or "redis://127.0.0.1:6379/0")
+        self.prefix = prefix
+
+    def _key(self, namespace, key):
+        return "{}:{}:{}".format(self.prefix, namespace, key)
+
+    def get(self, namespace, key):
+        data = self.client.command("GET", self._key(namespace, key))
+        return None if data is None else decode(data)
+
+    def _tag(self, namespace, tag):
+        # outside of the keys of the entries, thus not counted by `stats`
+        return "{}-tags:{}:{}".format(self.prefix, namespace, tag)
+
+    def set(self, namespace, key, value, ttl, maxsize, max_bytes, tags=()):
+        data = encode(value)
+        if len(data) > max_bytes:
+            return 0
+        self.client.command("SET", self._key(namespace, key), data,
+                            "PX", max(1, int(ttl * 1000)))
+        for tag in tags:
+            # the keys of a tag are kept as long as the entries
+            self.client.command("SADD", self._tag(namespace, tag),
+                                self._key(namespace, key))
+            self.client.command("PEXPIRE", self._tag(namespace, tag),
+                                max(1, int(ttl * 1000)))
+        return 0
+
+    def delete(self, namespace, key):
+        self.client.command("DEL", self._key(namespace, key))
+
+    def _keys(self, namespace, pattern=None):
+        cursor = "0"
+        pattern = pattern or self._key(namespace, "*")
+        while True:
+            cursor, keys = self.client.command("SCAN", cursor, "MATCH",
+                                               pattern, "COUNT", 1000)
+            yield from keys
+            cursor = cursor.decode("utf-8")
+            if cursor == "0":
+                break
+
+    def invalidate(self, namespace, tag):
+        keys = self.client.command("SMEMBERS", self._tag(namespace, tag))
+        self.client.command("DEL", self._tag(namespace, tag), *keys)
+        return len(keys)
+
+    def clear(self, namespace):
+        keys = list(self._keys(namespace)) \
+            + list(self._keys(namespace, self._tag(namespace, "*")))
+        for i in range(0, len(keys), 500):
+            self.client.command("DEL", *keys[i:i + 500])
+
+    def stats(self, namespace):
+        return {"entries": sum(1 for _ in self._keys(namespace))}
+
+    def ages(self, namespace):
+        """ not known, the server only keeps the expiry of the entries """
+        return None
+
+
+BACKENDS = {
+    "memory": MemoryBackend,
+    "sqlite": SqliteBackend,
+    "redis": RedisBackend,
+}
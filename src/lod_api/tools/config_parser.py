@@ -1,5 +1,17 @@
 import yaml
 
+import lod_api
+
+
+def get_config(attr, default=None):
+    """ Read the optional config item `attr` from the global
+        configuration. Falls back to `default` if the item is not
+        defined or the configuration has not been read (yet).
+    """
+    if lod_api.CONFIG is None:
+        return default
+    return lod_api.CONFIG.get_default(attr, default)
+
 
 class ConfigParser:
     def __init__(self, conf_fname):
@@ -39,3 +51,12 @@ class ConfigParser:
             return ret
         else:
             return None
+
+    def get_default(self, attr, default=None):
+        """ get an optional config item `attr` and fall back to
+            `default` without complaining if it is not defined.
+        """
+        value = self.conf.get(attr)
+        if value is None:
+            return default
+        return value
@@ -0,0 +1,126 @@
+""" Time budgets of the api requests
+
+    Each api request gets a deadline when it starts, according to the
+    budget of its endpoint (resource class, e.g. `RetrieveDoc`) in
+    `es_deadlines` of the config. Every elasticsearch request sent via
+    `ES_wrapper.call` only gets the remaining time of the budget, both as
+    client `request_timeout` and, for searches, as elasticsearch-side
+    `timeout` (`server_share` of the remaining time, thus elasticsearch
+    can answer with partial results before the client gives up).
+
+    Requests are not sent once the budget ran out, `DeadlineExceeded` is
+    raised instead. Endpoints that can do with partial results (e.g. the
+    explore aggregations) catch these errors with `is_timeout`.
+"""
+import json
+import time
+
+import elasticsearch
+import flask
+
+from lod_api.tools.config_parser import get_config
+
+# defaults for the `es_deadlines` config section
+defaults = {
+    "default": 10,
+    "server_share": 0.8,
+    "endpoints": {},
+}
+
+
+def option(name):
+    return get_config("es_deadlines", {}).get(name, defaults[name])
+
+
+class DeadlineExceeded(Exception):
+    """ raised instead of sending a request after the time budget of the
+        api request ran out """
+
+    def __init__(self, budget):
+        self.budget = budget
+        super().__init__("time budget of {} seconds exceeded".format(budget))
+
+
+def budget(endpoint=None):
+    """ time budget in seconds of the resource class `endpoint` """
+    return option("endpoints").get(endpoint, option("default"))
+
+
+def start(endpoint=None, seconds=None):
+    """ set the deadline of the current api request """
+    if seconds is None:
+        seconds = budget(endpoint)
+    flask.g.lod_budget = seconds
+    flask.g.lod_deadline = time.monotonic() + seconds
+
+
+def remaining():
+    """ remaining seconds of the current api request, None outside of
+        requests or without deadline """
+    if not flask.has_request_context():
+        return None
+    deadline = flask.g.get("lod_deadline")
+    if deadline is None:
+        return None
+    return deadline - time.monotonic()
+
+
+def check():
+    """ raises `DeadlineExceeded` if the budget ran out """
+    left = remaining()
+    if left is not None and left <= 0:
+        raise DeadlineExceeded(flask.g.lod_budget)
+
+
+def is_timeout(exc):
+    """ whether `exc` was caused by an exceeded time budget """
+    return isinstance(exc, (DeadlineExceeded, elasticsearch.ConnectionTimeout))
+
+
+# seconds the client timeout may fire before the deadline is reached
+RAN_OUT_TOLERANCE = 0.01
+
+
+def ran_out(exc):
+    """ Whether `exc` is a client timeout caused by the time budget of
+        the api request rather than by elasticsearch: the request
+        timeout was cut to the remaining time (see `apply`), which is
+        used up. """
+    if not isinstance(exc, elasticsearch.ConnectionTimeout):
+        return False
+    left = remaining()
+    return left is not None and left <= RAN_OUT_TOLERANCE
+
+
+def server_timeout(seconds):
+    """ Elasticsearch-side timeout for `seconds`. It is rounded down to
+        whole seconds (tenths below one second), thus the timeouts of
+        repeated queries and their request cache keys rarely differ. """
+    seconds *= option("server_share")
+    if seconds >= 1:
+        return "{}s".format(int(seconds))
+    return "{}ms".format(max(1, int(seconds * 10)) * 100)
+
+
+def apply(action, kwargs):
+    """ Returns a copy of the `kwargs` of an elasticsearch `action` with
+        timeouts according to the remaining time """
+    left = remaining()
+    if left is None:
+        return kwargs
+    left = max(left, 0.001)
+    kwargs = dict(kwargs)
+    kwargs.setdefault("request_timeout", left)
+    if action == "search":
+        kwargs.setdefault("timeout", server_timeout(left))
+    elif action == "msearch" and isinstance(kwargs.get("body"), str):
+        # msearch has no timeout parameter, it belongs into the
+        # queries, which alternate with their headers
+        lines = [line for line in kwargs["body"].split("\n") if line.strip()]
+        for i in range(1, len(lines), 2):
+            query = json.loads(lines[i])
+            if isinstance(query, dict) and "timeout" not in query:
+                query["timeout"] = server_timeout(left)
+                lines[i] = json.dumps(query)
+        kwargs["body"] = "\n".join(lines)
+    return kwargs
@@ -0,0 +1,88 @@
+""" asyncio execution path for independent elasticsearch requests
+
+    Several endpoints (e.g. the explore endpoints) issue elasticsearch
+    requests that do not depend on each other. Instead of running them
+    one after another, they can be gathered with `gather_calls` within a
+    coroutine or with `run_calls` from the synchronous flask handlers.
+    At most `es_concurrency` (see config) requests of one gathering run
+    at the same time. Each request runs with a copy of the caller's
+    context, so that request-bound state stays accessible.
+
+    e.g.
+        responses = run_calls([
+            es_call(es, "search", index="resources", body=query1),
+            es_call(es, "search", index="resources", body=query2),
+        ])
+"""
+import asyncio
+import concurrent.futures
+import contextvars
+import functools
+import os
+import threading
+
+from lod_api.tools.helper import ES_wrapper
+from lod_api.tools.config_parser import get_config
+
+# default for `es_concurrency` of the config
+CONCURRENCY = 8
+
+_executor = None
+_executor_pid = None
+_executor_lock = threading.Lock()
+
+
+def concurrency():
+    """ maximal count of concurrent elasticsearch requests """
+    return get_config("es_concurrency", CONCURRENCY)
+
+
+def executor():
+    """ Thread pool running the blocking elasticsearch client calls,
+        created once per process. """
+    global _executor, _executor_pid
+    with _executor_lock:
+        if _executor is None or _executor_pid != os.getpid():
+            _executor = concurrent.futures.ThreadPoolExecutor(
+                max_workers=concurrency(), thread_name_prefix="es")
+            _executor_pid = os.getpid()
+    return _executor
+
+
+def es_call(es, action, **kwargs):
+    """ bind an `ES_wrapper.call` to be run later on """
+    return functools.partial(ES_wrapper.call, es, action, **kwargs)
+
+
+async def run_async(call):
+    """ run the blocking `call` in the thread pool and await its result """
+    loop = asyncio.get_running_loop()
+    ctx = contextvars.copy_context()
+    return await loop.run_in_executor(executor(), ctx.run, call)
+
+
+async def gather_calls(calls, limit=None, return_exceptions=False):
+    """ Run all `calls` concurrently, but at most `limit` at a time.
+        Returns the results in the order of `calls`. If
+        `return_exceptions` is set, exceptions are returned in place of
+        the results instead of being raised. """
+    semaphore = asyncio.Semaphore(limit or concurrency())
+
+    async def run_limited(call):
+        async with semaphore:
+            return await run_async(call)
+
+    return await asyncio.gather(*[run_limited(call) for call in calls],
+                                return_exceptions=return_exceptions)
+
+
+def run_calls(calls, limit=None, return_exceptions=False):
+    """ synchronous entry point to `gather_calls` for the flask handlers """
+    calls = list(calls)
+    if not calls:
+        return []
+    if len(calls) == 1 and not return_exceptions:
+        # nothing to run concurrently
+        return [calls[0]()]
+    return asyncio.run(gather_calls(calls, limit=limit,
+                                    return_exceptions=return_exceptions))
@@ -0,0 +1,326 @@
+""" Process-wide registry of pooled elasticsearch clients
+
+    All namespaces share the clients of this registry instead of
+    creating an own client (and thus an own connection pool) per
+    resource class or per request. Clients are keyed by host and
+    options and are created lazily on first use. After a fork (see
+    `lod_api.tools.daemonize`) the child process creates new clients
+    instead of sharing the sockets of its parent.
+
+    The options of the clients are read from `es_client` in the
+    configuration file. The responses are decoded with the serializer
+    of `lod_api.tools.es_serializer`.
+
+    Indices can be served by other clusters than `es_host`: the hosts of
+    each cluster are listed in `es_clusters`, `es_routing` assigns
+    indices to them. Clients of clusters with several hosts send each
+    request to the host with the lowest recent latency. Optionally, slow
+    reads are hedged (see `es_hedging`): if a read takes longer than a
+    percentile of the recent latencies, a second request is sent to
+    another host and the first answer wins.
+"""
+import collections
+import concurrent.futures
+import contextvars
+import os
+import random
+import threading
+import time
+
+import elasticsearch
+from elasticsearch.connection_pool import ConnectionSelector
+
+from lod_api.tools import es_serializer
+from lod_api.tools.config_parser import get_config
+
+# connections a request was sent to, and connections a hedged request
+# avoids (those of the request it hedges), see `Hedger`
+_used = contextvars.ContextVar("es_used_connections", default=None)
+_avoid = contextvars.ContextVar("es_avoid_connections", default=())
+
+
+class TimedConnection(elasticsearch.Urllib3HttpConnection):
+    """ Connection to a single host that keeps track of its latency
+        (exponentially weighted moving average) and of its requests in
+        flight. """
+
+    # weight of the latest request in the moving average
+    alpha = 0.2
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.latency = None
+        self.inflight = 0
+        self._inflight_lock = threading.Lock()
+
+    def perform_request(self, *args, **kwargs):
+        used = _used.get()
+        if used is not None:
+            used.append(self)
+        with self._inflight_lock:
+            self.inflight += 1
+        start = time.monotonic()
+        try:
+            return super().perform_request(*args, **kwargs)
+        finally:
+            with self._inflight_lock:
+                self.inflight -= 1
+            duration = time.monotonic() - start
+            if self.latency is None:
+                self.latency = duration
+            else:
+                self.latency += self.alpha * (duration - self.latency)
+
+
+class LatencySelector(ConnectionSelector):
+    """ Selects the connection with the lowest latency, weighted by the
+        requests it has in flight. Connections without measurements are
+        tried first and now and then a random connection is chosen to
+        keep the measurements of all hosts up to date. Hedged requests
+        avoid the connection of the request they hedge. """
+
+    exploration = 0.05
+
+    def select(self, connections):
+        avoid = _avoid.get()
+        if avoid:
+            connections = [c for c in connections if c not in avoid] \
+                or connections
+        unmeasured = [c for c in connections
+                      if getattr(c, "latency", None) is None]
+        if unmeasured:
+            return random.choice(unmeasured)
+        if random.random() < self.exploration:
+            return random.choice(connections)
+        return min(connections, key=lambda c: c.latency * (1 + c.inflight))
+
+
+class ClientRegistry:
+    """ Registry of elasticsearch clients keyed by host and options """
+
+    # defaults for the options in the `es_client` config section
+    defaults = {
+        "timeout": 10,
+        "maxsize": 10,
+        "keep_alive": True,
+        "sniff_on_start": False,
+        "sniff_on_connection_fail": False,
+        "sniffer_timeout": None,
+        "serializer": "auto",
+    }
+
+    def __init__(self):
+        self._clients = {}
+        self._options = {}          # id of client → options of the client
+        self._pid = os.getpid()
+        self._lock = threading.Lock()
+
+    def options(self, **options):
+        """ Merge the configured client options with `options` """
+        ret = dict(self.defaults)
+        ret.update(get_config("es_client", {}))
+        ret.update(options)
+        return ret
+
+    def hosts(self, index=None):
+        """ Hosts of the cluster serving `index` according to `es_routing`
+            and `es_clusters`. Requests spanning indices of different
+            clusters and indices without routing go to `es_host`. """
+        if index:
+            routing = get_config("es_routing", {})
+            clusters = set(routing.get(i) for i in index.split(","))
+            if len(clusters) == 1 and None not in clusters:
+                return get_config("es_clusters", {})[clusters.pop()]
+        return get_config("es_host")
+
+    def _client_kwargs(self, host, options):
+        """ translate registry options into kwargs of the client """
+        kwargs = dict(options)
+        if not kwargs.pop("keep_alive"):
+            kwargs["headers"] = {"Connection": "close"}
+        kwargs["serializer"] = es_serializer.get_serializer(
+            kwargs.pop("serializer"))
+        if isinstance(host, (list, tuple)) and len(host) > 1:
+            kwargs["connection_class"] = TimedConnection
+            kwargs["selector_class"] = LatencySelector
+        return {k: v for k, v in kwargs.items() if v is not None}
+
+    def get(self, host=None, index=None, **options):
+        """ Returns the client for `host` (default: the hosts serving
+            `index`) with the given `options`, creates it if necessary.
+        """
+        if host is None:
+            host = self.hosts(index)
+        options = self.options(**options)
+        key = repr((host, sorted(options.items())))
+
+        with self._lock:
+            if self._pid != os.getpid():
+                # forked process: do not use the connections of the parent
+                self._clients = {}
+                self._options = {}
+                self._pid = os.getpid()
+            client = self._clients.get(key)
+            if client is None:
+                client = elasticsearch.Elasticsearch(
+                    host, **self._client_kwargs(host, options))
+                self._clients[key] = client
+                self._options[id(client)] = options
+        return client
+
+    def route(self, es, index):
+        """ Returns the client of the cluster serving `index` with the
+            options of the pooled client `es`. Clients not created by
+            the registry are returned unchanged. """
+        options = self._options.get(id(es))
+        if options is None or not index or not get_config("es_routing"):
+            return es
+        return self.get(self.hosts(index), **options)
+
+    def clear(self):
+        """ drop all clients of the registry """
+        with self._lock:
+            self._clients = {}
+            self._options = {}
+
+    def __len__(self):
+        return len(self._clients)
+
+
+registry = ClientRegistry()
+
+
+def get_client(host=None, index=None, **options):
+    """ get the pooled client for `host` or `index` out of the
+        process-wide registry """
+    return registry.get(host, index=index, **options)
+
+
+class PooledClient:
+    """ Class attribute that resolves to the pooled client on access,
+        e.g.
+            class searchDoc(LodResource):
+                es = PooledClient()
+    """
+
+    def __init__(self, host=None, **options):
+        self.host = host
+        self.options = options
+
+    def __get__(self, obj, objtype=None):
+        return get_client(self.host, **self.options)
+
+
+class Hedger:
+    """ Sends a second request for reads that take longer than the
+        `percentile` of the recent latencies of their action, if the
+        client has more than one host. The first answer is returned.
+
+        Hedged reads run on a pool of `max_workers` threads. Reads
+        finding no free thread of the pool are not hedged, and only one
+        second request is sent at a time. A request that lost the race
+        can not be interrupted, its answer is dropped. """
+
+    # defaults for the `es_hedging` config section
+    defaults = {
+        "enabled": False,
+        "percentile": 95,
+        "min_delay": 0.05,
+        "max_workers": 8,
+    }
+
+    def __init__(self):
+        self._latencies = collections.defaultdict(
+            lambda: collections.deque(maxlen=500))
+        self._executor = None
+        self._slots = None
+        self._pid = None
+        self._lock = threading.Lock()
+        self._hedging = False   # whether a second request is pending
+        self.hedged = 0         # count of second requests sent
+
+    def _option(self, name):
+        return get_config("es_hedging", {}).get(name, self.defaults[name])
+
+    def _submit(self, fn, used=None, avoid=(), hedge=False):
+        """ run `fn` on a free thread of the pool, None if there is no
+            free thread """
+        with self._lock:
+            if self._executor is None or self._pid != os.getpid():
+                workers = self._option("max_workers")
+                self._executor = concurrent.futures.ThreadPoolExecutor(
+                    max_workers=workers, thread_name_prefix="es-hedge")
+                self._slots = threading.BoundedSemaphore(workers)
+                self._pid = os.getpid()
+            executor, slots = self._executor, self._slots
+        if not slots.acquire(blocking=False):
+            return None
+
+        def run():
+            _used.set(used)
+            _avoid.set(avoid)
+            try:
+                return fn()
+            finally:
+                if hedge:
+                    with self._lock:
+                        self._hedging = False
+                slots.release()
+        ctx = contextvars.copy_context()
+        return executor.submit(ctx.run, run)
+
+    def _hedge(self, fn, avoid):
+        """ send the second request of `fn`, None if one is pending """
+        with self._lock:
+            if self._hedging:
+                return None
+            self._hedging = True
+        future = self._submit(fn, avoid=tuple(avoid), hedge=True)
+        with self._lock:
+            if future is None:
+                self._hedging = False
+            else:
+                self.hedged += 1
+        return future
+
+    def delay(self, action):
+        """ seconds to wait for an answer before hedging a request """
+        latencies = sorted(self._latencies[action])
+        if not latencies:
+            return None
+        pos = int(len(latencies) * self._option("percentile") / 100)
+        return max(self._option("min_delay"),
+                   latencies[min(pos, len(latencies) - 1)])
+
+    def call(self, es, action, fn):
+        """ run the read `fn` of `action` on `es`, hedged if enabled """
+        start = time.monotonic()
+        first = None
+        if self._option("enabled"):
+            hosts = getattr(getattr(es, "transport", None), "hosts", None)
+            delay = self.delay(action) if len(hosts or ()) > 1 else None
+            if delay is not None:
+                used = []
+                first = self._submit(fn, used=used)
+        if first is None:
+            ret = fn()
+            self._latencies[action].append(time.monotonic() - start)
+            return ret
+
+        done, _ = concurrent.futures.wait([first], timeout=delay)
+        pending = [first]
+        if not done:
+            second = self._hedge(fn, used)
+            if second is not None:
+                pending.append(second)
+        while pending:
+            done, _ = concurrent.futures.wait(
+                pending, return_when=concurrent.futures.FIRST_COMPLETED)
+            for future in done:
+                pending.remove(future)
+                if future.exception() is None or not pending:
+                    self._latencies[action].append(time.monotonic() - start)
+                    return future.result()
+
+
+hedger = Hedger()
@@ -0,0 +1,122 @@
+""" Normalization of search requests sent to elasticsearch
+
+    The shard request cache of elasticsearch is keyed by the serialized
+    request, thus identical queries with a different key order miss it.
+    Before search and msearch requests are sent (see `ES_wrapper.call`)
+    their bodies are brought into a canonical form with sorted keys.
+    Aggregation queries without hits (size 0) are explicitly marked with
+    `request_cache`.
+
+    Additionally the requests of one client session get a stable
+    `preference`, thus repeated requests of an explore session are sent
+    to the same shard copies with warm caches. The session is identified
+    by the `session_header` of the request or, if missing, by the address
+    and user agent of the client.
+
+    The options are read from `es_query` in the config.
+"""
+import hashlib
+import json
+
+import flask
+
+from lod_api.tools import es_serializer
+from lod_api.tools.config_parser import get_config
+
+# defaults for the `es_query` config section
+defaults = {
+    "normalize": True,
+    "request_cache": True,
+    "preference": True,
+    "session_header": "X-Session-Id",
+}
+
+
+def option(name):
+    return get_config("es_query", {}).get(name, defaults[name])
+
+
+def canonical(obj):
+    """ copy of `obj` with all keys sorted recursively, list orders are
+        kept as they are significant """
+    if isinstance(obj, dict):
+        return {k: canonical(obj[k]) for k in sorted(obj)}
+    if isinstance(obj, (list, tuple)):
+        return [canonical(x) for x in obj]
+    return obj
+
+
+def dumps(obj):
+    """ canonical serialization of a json object """
+    return es_serializer.dumps_canonical(obj)
+
+
+def is_cacheable(body, size=None):
+    """ whether `body` is an aggregation query without hits """
+    if not isinstance(body, dict):
+        return False
+    if size is None:
+        size = body.get("size")
+    return size == 0 and bool(body.get("aggs") or body.get("aggregations"))
+
+
+def session_preference():
+    """ Stable `preference` for the session of the current request, None
+        outside of a request. It must not start with `_`. """
+    if not flask.has_request_context():
+        return None
+    request = flask.request
+    session = request.headers.get(option("session_header"))
+    if not session:
+        session = "{}|{}".format(request.remote_addr,
+                                 request.headers.get("User-Agent", ""))
+    return "lod-" + hashlib.sha1(session.encode("utf-8")).hexdigest()[:16]
+
+
+def _msearch_lines(body):
+    """ list of json objects out of a msearch body """
+    if isinstance(body, (str, bytes)):
+        if isinstance(body, bytes):
+            body = body.decode("utf-8")
+        return [json.loads(line) for line in body.splitlines()
+                if line.strip()]
+    return list(body)
+
+
+def normalize(action, kwargs):
+    """ Returns a normalized copy of the `kwargs` of an elasticsearch
+        `action` """
+    kwargs = dict(kwargs)
+    if action not in ("search", "msearch"):
+        return kwargs
+    normalize = option("normalize")
+    preference = session_preference() if option("preference") else None
+    request_cache = option("request_cache") and "scroll" not in kwargs
+
+    if action == "search":
+        body = kwargs.get("body")
+        if isinstance(body, dict):
+            if normalize:
+                kwargs["body"] = canonical(body)
+            if request_cache and is_cacheable(body, kwargs.get("size")):
+                kwargs.setdefault("request_cache", True)
+        if preference:
+            kwargs.setdefault("preference", preference)
+        return kwargs
+
+    try:
+        lines = _msearch_lines(kwargs.get("body", ""))
+    except ValueError:
+        # unparsable bodies are sent as they are
+        return kwargs
+    # msearch bodies alternate between header and query
+    for i in range(0, len(lines) - 1, 2):
+        header, query = dict(lines[i]), lines[i + 1]
+        if request_cache and is_cacheable(query):
+            header.setdefault("request_cache", True)
+        if preference:
+            header.setdefault("preference", preference)
+        lines[i] = header
+    serialize = dumps if normalize else json.dumps
+    kwargs["body"] = "\n".join(serialize(line) for line in lines)
+    return kwargs
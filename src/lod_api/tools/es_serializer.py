@@ -0,0 +1,120 @@
+""" JSON serializers for the elasticsearch clients
+
+    The pooled clients (see `lod_api.tools.es_client`) decode every
+    response of elasticsearch, e.g. searches with thousands of hits.
+    Instead of the stdlib `json` module they use a faster codec if one
+    is installed (`pip install lod-api[fast]`). The serializer is chosen
+    with `serializer` in the `es_client` config section:
+        auto    fastest installed codec (default)
+        orjson  orjson, stdlib json if it is not installed
+        json    stdlib json
+    or the dotted path of an own `elasticsearch.serializer.Serializer`
+    class, e.g. `mypackage.serializers.MySerializer`.
+"""
+import importlib
+import json
+
+from elasticsearch.exceptions import SerializationError
+from elasticsearch.serializer import JSONSerializer
+
+from lod_api.tools.config_parser import get_config
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+
+class StdlibSerializer(JSONSerializer):
+    """ serializer of the elasticsearch client, based on stdlib `json` """
+    name = "json"
+
+    def dumps_canonical(self, data):
+        """ compact serialization with sorted keys """
+        return json.dumps(data, sort_keys=True, separators=(",", ":"))
+
+
+class OrjsonSerializer(StdlibSerializer):
+    """ Serializer based on orjson. Data orjson refuses (e.g. integers
+        exceeding 64 bit, lone surrogates) is handled by the stdlib. """
+    name = "orjson"
+
+    def loads(self, s):
+        try:
+            return orjson.loads(s)
+        except orjson.JSONDecodeError:
+            return super().loads(s)
+
+    def _dumps(self, data, option=0):
+        try:
+            return orjson.dumps(
+                data, default=self.default,
+                option=option | orjson.OPT_NON_STR_KEYS).decode("utf-8")
+        except orjson.JSONEncodeError:
+            return None
+
+    def dumps(self, data):
+        # don't serialize strings
+        if isinstance(data, (str, bytes)):
+            return data
+        ret = self._dumps(data)
+        if ret is None:
+            return super().dumps(data)
+        return ret
+
+    def dumps_canonical(self, data):
+        ret = self._dumps(data, orjson.OPT_SORT_KEYS)
+        if ret is None:
+            return super().dumps_canonical(data)
+        return ret
+
+
+SERIALIZERS = {
+    "json": StdlibSerializer,
+    "orjson": OrjsonSerializer,
+}
+
+
+def available():
+    """ names of the serializers whose codec is installed """
+    ret = ["json"]
+    if orjson is not None:
+        ret.insert(0, "orjson")
+    return ret
+
+
+def get_serializer(name="auto"):
+    """ Returns an instance of the serializer `name` """
+    if name in (None, "auto"):
+        name = available()[0]
+    if name in SERIALIZERS:
+        if name not in available():
+            print("json codec '{}' not installed, using stdlib json"
+                  .format(name))
+            name = "json"
+        return SERIALIZERS[name]()
+    module, _, cls = name.rpartition(".")
+    try:
+        return getattr(importlib.import_module(module), cls)()
+    except (ImportError, AttributeError, ValueError) as e:
+        raise SerializationError(
+            "unknown serializer '{}': {}".format(name, e))
+
+
+_serializers = {}
+
+
+def configured():
+    """ the serializer configured in the `es_client` section """
+    name = get_config("es_client", {}).get("serializer", "auto")
+    if name not in _serializers:
+        _serializers[name] = get_serializer(name)
+    return _serializers[name]
+
+
+def dumps_canonical(data):
+    """ compact serialization with sorted keys using the configured codec """
+    serializer = configured()
+    if isinstance(serializer, StdlibSerializer):
+        return serializer.dumps_canonical(data)
+    return json.dumps(data, sort_keys=True, separators=(",", ":"))
@@ -0,0 +1,188 @@
+""" Catalog of the fields contained in the mappings of all indices
+
+    OpenRefine requests property proposals and suggestions on every
+    keystroke. Instead of requesting and walking the mappings of every
+    index for each of these requests, the catalog is built once out of
+    the mappings and answers from memory. It is rebuilt after `ttl`
+    seconds or if the mapping of an index changed. For the latter, the
+    mapping versions of the indices are checked every `check_interval`
+    seconds (see `field_catalog` in the config). Within `stale` seconds
+    after `ttl`, the outdated catalog keeps answering while it is rebuilt
+    in the background (see `lod_api.tools.cache.refresher`).
+"""
+import bisect
+import threading
+import time
+
+import elasticsearch
+
+from lod_api.tools import resilience
+from lod_api.tools.cache import refresher
+from lod_api.tools.helper import ES_wrapper
+from lod_api.tools.config_parser import get_config
+from lod_api.tools.helper import get_fields_with_subfields
+from lod_api.tools.es_client import get_client
+
+
+class FieldCatalog:
+    """ Fields of the configured indices together with a sorted
+        prefix index over the fields of all indices.
+    """
+
+    # defaults for the `field_catalog` config section
+    defaults = {
+        "ttl": 3600,
+        "check_interval": 60,
+        "stale": 0,
+    }
+
+    def __init__(self, es=None):
+        self._es = es
+        self._lock = threading.Lock()
+        self._fields = None          # index → list of fields (mapping order)
+        self._sorted = []            # fields of all indices, sorted
+        self._versions = None        # index → mapping_version
+        self._built = 0
+        self._checked = 0
+        self._stale = False          # last rebuild failed
+
+    def _client(self, index):
+        """ client of the cluster serving `index` """
+        if self._es is not None:
+            return self._es
+        return get_client(index=index)
+
+    def _option(self, name):
+        return get_config("field_catalog", {}).get(name, self.defaults[name])
+
+    def _mapping_versions(self, indices):
+        """ Get the mapping version of all `indices` with one cheap
+            request per cluster serving them (see `es_routing`). Returns
+            None if a cluster does not expose them. """
+        clusters = {}       # id of client → (client, indices)
+        for index in indices:
+            es = self._client(index)
+            clusters.setdefault(id(es), (es, []))[1].append(index)
+        versions = {}
+        for es, cluster_indices in clusters.values():
+            try:
+                state = es.cluster.state(
+                    metric="metadata", index=",".join(cluster_indices),
+                    filter_path="metadata.indices.*.mapping_version")
+            except elasticsearch.ElasticsearchException:
+                return None
+            indices_state = state.get("metadata", {}).get("indices", {})
+            versions.update({k: v.get("mapping_version")
+                             for k, v in indices_state.items()})
+        return versions
+
+    def _build(self, indices):
+        """ walk the mappings of `indices` and collect their fields """
+        fields = {}
+        for index in indices:
+            es = self._client(index)
+            try:
+                mapping = es.indices.get_mapping(index=index)
+            except elasticsearch.NotFoundError:
+                continue
+            # `index` might be an alias pointing to several indices
+            index_fields = []
+            for concrete_index in mapping:
+                if ES_wrapper.server_version(es) < 7:
+                    doc_types = list(mapping[concrete_index]["mappings"])
+                else:
+                    doc_types = [None]
+                for doc_type in doc_types:
+                    props = ES_wrapper.mapping_props(
+                        es, mapping, concrete_index, doc_type=doc_type)
+                    for fld in get_fields_with_subfields("", props):
+                        if fld not in index_fields:
+                            index_fields.append(fld)
+            fields[index] = index_fields
+
+        all_fields = set()
+        for index_fields in fields.values():
+            all_fields.update(index_fields)
+        return fields, sorted(all_fields)
+
+    def _outdated(self, now):
+        return (self._fields is None
+                or now - self._checked >= self._option("check_interval"))
+
+    def refresh(self, force=False):
+        """ Rebuild the catalog if the mappings changed or it is older
+            than `ttl`. This is checked at most every `check_interval`
+            seconds. """
+        now = time.monotonic()
+        if not (force or self._outdated(now)):
+            return
+        # only wait for another thread's refresh if there is no
+        # catalog yet to answer from
+        if not self._lock.acquire(blocking=self._fields is None or force):
+            return
+        try:
+            if not (force or self._outdated(now)):
+                return
+            indices = get_config("indices_list", [])
+            versions = self._mapping_versions(indices)
+            self._checked = now
+            if (force or self._fields is None
+                    or now - self._built >= self._option("ttl")
+                    or versions != self._versions):
+                stale = self._option("stale")
+                if (not force and self._fields is not None and stale
+                        and now - self._built < self._option("ttl") + stale):
+                    # answer from the current catalog while it is
+                    # rebuilt in the background
+                    refresher.submit("field_catalog",
+                                     lambda: self.refresh(force=True))
+                    return
+                try:
+                    fields = self._build(indices)
+                except (elasticsearch.ConnectionError,
+                        resilience.CircuitOpenError):
+                    if self._fields is None:
+                        raise
+                    # answer from the outdated catalog until
+                    # elasticsearch is available again
+                    self._stale = True
+                    return
+                self._fields, self._sorted = fields
+                self._versions = versions
+                self._built = now
+                self._stale = False
+        finally:
+            self._lock.release()
+
+    def _refresh(self):
+        self.refresh()
+        if self._stale:
+            resilience.mark_stale()
+
+    def fields(self, index):
+        """ Fields of `index` in the order of the mapping, None if the
+            index has no mapping """
+        self._refresh()
+        return self._fields.get(index)
+
+    def propose(self, index, limit=None):
+        """ At most `limit` fields of `index` """
+        fields = self.fields(index)
+        if fields is None:
+            return None
+        return fields[:limit]
+
+    def suggest(self, prefix=None, limit=None):
+        """ All fields of all indices starting with `prefix` in sorted
+            order, the prefix range is found by bisection. """
+        self._refresh()
+        fields = self._sorted
+        if prefix:
+            start = bisect.bisect_left(fields, prefix)
+            # "\uffff" sorts behind every other character
+            end = bisect.bisect_left(fields, prefix + "\uffff", lo=start)
+            fields = fields[start:end]
+        return fields[:limit]
+
+
+catalog = FieldCatalog()
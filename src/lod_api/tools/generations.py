@@ -0,0 +1,187 @@
+""" Generations of the indices served by the api
+
+    The pipeline building the indices swaps aliases (e.g. `persons`) to
+    freshly built indices. To never serve cached answers of a replaced
+    index, the caches key their entries on the generation token of the
+    indices they were read from (see `tags`): a hash of the concrete
+    indices behind the name, their uuids and their count of indexing
+    and delete operations. Thus the token changes with each swap of an
+    alias and with each change of the documents of an index.
+
+    The tokens of all indices are polled every `interval` seconds by a
+    background thread of each worker (see `index_generations` in the
+    config). Once the token of an index changed, the entries of its
+    former generation can not be requested any more and are dropped
+    from all caches, so the caches can use long TTLs. An `interval` of
+    0 disables the tracking, the entries expire by their TTL only.
+"""
+import hashlib
+import os
+import threading
+import time
+
+import elasticsearch
+
+from lod_api.tools import cache
+from lod_api.tools.config_parser import get_config
+from lod_api.tools.es_client import get_client
+
+# token of indices that were not polled (yet)
+UNKNOWN = "-"
+
+
+class GenerationTracker:
+    """ Generation tokens of the indices, polled in the background """
+
+    # defaults for the `index_generations` config section
+    defaults = {
+        "interval": 30,
+        "request_timeout": 2,
+        "start_timeout": 30,
+    }
+
+    def __init__(self, es=None):
+        self._es = es
+        self._lock = threading.Lock()
+        self._tokens = {}            # name of index or alias → token
+        self._names = set()          # names to poll
+        self._thread = None
+        self._pid = None
+        self._polled = threading.Event()    # set after the first poll
+
+    def _option(self, name):
+        return get_config("index_generations", {}).get(
+            name, self.defaults[name])
+
+    @property
+    def enabled(self):
+        return self._option("interval") > 0
+
+    def _client(self, index):
+        """ client of the cluster serving `index` """
+        if self._es is not None:
+            return self._es
+        return get_client(index=index)
+
+    def fetch(self, names):
+        """ Get the generation tokens of the indices or aliases `names`
+            with two cheap requests per index: the concrete indices
+            behind an alias and their indexing stats. """
+        tokens = {}
+        timeout = self._option("request_timeout")
+        for name in names:
+            es = self._client(name)
+            try:
+                aliases = es.indices.get_alias(
+                    index=name, request_timeout=timeout)
+                concrete = sorted(aliases)
+                stats = es.indices.stats(
+                    index=",".join(concrete), metric="indexing",
+                    request_timeout=timeout)
+            except elasticsearch.NotFoundError:
+                continue
+            parts = []
+            for index in concrete:
+                index_stats = stats.get("indices", {}).get(index, {})
+                indexing = index_stats.get("primaries", {}).get("indexing", {})
+                parts.append("{}|{}|{}|{}".format(
+                    index, index_stats.get("uuid", ""),
+                    indexing.get("index_total", 0),
+                    indexing.get("delete_total", 0)))
+            tokens[name] = hashlib.sha1(
+                "\n".join(parts).encode("utf-8")).hexdigest()[:12]
+        return tokens
+
+    def poll(self):
+        """ Update the tokens of all known indices. Entries of former
+            generations are dropped from the caches. """
+        names = set(get_config("indices_list", [])) | self._names
+        try:
+            tokens = self.fetch(sorted(names))
+        except Exception as e:
+            print("index generations: polling failed: {}".format(e))
+            return
+        with self._lock:
+            changed = {name: self._tokens.get(name, UNKNOWN)
+                       for name in tokens
+                       if tokens[name] != self._tokens.get(name, UNKNOWN)}
+            self._tokens.update(tokens)
+        for name, old in changed.items():
+            if old != UNKNOWN:
+                print("index generations: {} changed, dropping cached"
+                      " entries".format(name))
+            cache.invalidate_all(tag(name, old))
+
+    def _run(self):
+        self.poll()
+        self._polled.set()
+        while self.enabled:
+            time.sleep(self._option("interval"))
+            self.poll()
+
+    def start(self):
+        """ keep polling in a daemon thread, once per process. The
+            first poll runs in the thread as well, until it is done the
+            tokens are `UNKNOWN`. """
+        if not self.enabled:
+            return
+        with self._lock:
+            if self._pid == os.getpid():
+                return
+            self._pid = os.getpid()
+            self._tokens = {}
+            self._polled = threading.Event()
+        self._thread = threading.Thread(target=self._run, daemon=True,
+                                        name="index-generations")
+        self._thread.start()
+
+    def wait_polled(self, timeout=None):
+        """ Wait for the first poll of this process, at most `timeout`
+            (default: `start_timeout`) seconds, e.g. before the caches
+            are filled. Returns whether the tokens are known. """
+        if not self.enabled:
+            return True
+        self.start()
+        if timeout is None:
+            timeout = self._option("start_timeout")
+        return self._polled.wait(timeout)
+
+    def token(self, name):
+        """ generation token of the index or alias `name` """
+        if not self.enabled:
+            return None
+        self.start()
+        token = self._tokens.get(name)
+        if token is None:
+            # polled with the next round
+            self._names.add(name)
+            return UNKNOWN
+        return token
+
+    def invalidate(self, name, caches=None):
+        """ drop the cached entries of the index `name` of all
+            generations known to this worker, from all caches or only
+            from the caches named in `caches`, returns their count """
+        tokens = {self._tokens.get(name), UNKNOWN, None}
+        return sum(cache.invalidate_all(tag(name, token), caches)
+                   for token in tokens)
+
+
+tracker = GenerationTracker()
+
+
+def tag(name, token):
+    return name if token is None else "{}@{}".format(name, token)
+
+
+def tags(index):
+    """ Tags of the entries read from `index` (comma separated indices
+        or aliases), one per index: its name and generation token """
+    return [tag(name, tracker.token(name)) for name in index.split(",")]
+
+
+def invalidate(index, caches=None):
+    """ drop the cached entries read from `index` (comma separated
+        indices or aliases) from all caches or only from the caches named
+        in `caches`, returns their count """
+    return sum(tracker.invalidate(name, caches) for name in index.split(","))
@@ -1,5 +1,17 @@
+import threading
+import time
+import weakref
+
 import elasticsearch
 
+from lod_api.tools import deadline
+from lod_api.tools import es_client
+from lod_api.tools import es_query
+from lod_api.tools import resilience
+from lod_api.tools import singleflight
+from lod_api.tools.config_parser import get_config
+
+
 def isint(num):
     """ Function tests whether input can be interpreted as
         integer. Returns True if this is the case and False
@@ -51,26 +63,111 @@ class ES_wrapper:
     """ wraps functionality of the python elasticsearch client used in lod-api
 
         In Order to properly react on different elasticsearch versions
-        this wrapper manages the difference in function calls to the es api
+        this wrapper manages the difference in function calls to the es api.
+
+        The version of the elasticsearch server is probed once per client
+        via `es.info()` and cached afterwards. It is probed again after
+        `es_version_probe_interval` seconds (see config) or after the
+        client ran into a connection error. `ES_wrapper.info_calls`
+        counts the probes sent to elasticsearch, it is reported by
+        `/admin/caches`.
     """
-    @staticmethod
-    def call(es, action, **kwargs):
-        """ Call a method of the elasticsearch api on a specified index
-        with multiple variable kwargs as options to each call. """
+    # default interval in seconds after which the version is probed again
+    probe_interval = 300
+    # count of `es.info()` requests issued to probe server versions
+    info_calls = 0
+
+    # client → (server major version, time of probe)
+    _versions = weakref.WeakKeyDictionary()
+    _lock = threading.Lock()
+
+    @classmethod
+    def server_version(cls, es):
+        """ Returns the major version of the elasticsearch server
+            behind the client `es`, using the cached probe if it is
+            still valid. """
+        interval = get_config("es_version_probe_interval", cls.probe_interval)
+        now = time.monotonic()
+        with cls._lock:
+            probe = cls._versions.get(es)
+        if probe and now - probe[1] < interval:
+            return probe[0]
+
         server_version = int(es.info()['version']['number'][0])
+        with cls._lock:
+            cls.info_calls += 1
+            cls._versions[es] = (server_version, now)
+        return server_version
+
+    @classmethod
+    def reset_version(cls, es):
+        """ Forget the probed server version of `es`, so that it is
+            probed again with the next call. """
+        with cls._lock:
+            cls._versions.pop(es, None)
+
+    @classmethod
+    def translate_kwargs(cls, es, kwargs):
+        """ Rename the options in `kwargs` according to the capabilities
+            of the server behind `es` and the installed client. """
+        server_version = cls.server_version(es)
         client_version = elasticsearch.VERSION[0]
         if server_version < 7 and client_version < 7:
             if '_source_excludes' in kwargs:
                 kwargs['_source_exclude'] = kwargs.pop('_source_excludes')
             if '_source_includes' in kwargs:
                 kwargs['_source_include'] = kwargs.pop('_source_includes')
-        return getattr(es, action)(**kwargs)
+        return kwargs
+
+    @classmethod
+    def call(cls, es, action, **kwargs):
+        """ Call a method of the elasticsearch api on a specified index
+        with multiple variable kwargs as options to each call. The call
+        is routed to the cluster serving the index (`lod_api.tools.es_client`)
+        and goes through the resilience layer (retries, circuit breaker) of
+        `lod_api.tools.resilience`, identical reads in flight are
+        coalesced by `lod_api.tools.singleflight`. Search bodies are
+        normalized by `lod_api.tools.es_query` before they are sent. The
+        timeouts are set according to the remaining time budget of the
+        api request (`lod_api.tools.deadline`). """
+        deadline.check()
+        es = es_client.registry.route(es, kwargs.get("index"))
+
+        def send():
+            try:
+                options = cls.translate_kwargs(es, es_query.normalize(
+                    action, deadline.apply(action, kwargs)))
+                if action in resilience.READ_ACTIONS:
+                    return es_client.hedger.call(
+                        es, action, lambda: getattr(es, action)(**options))
+                return getattr(es, action)(**options)
+            except elasticsearch.ConnectionError:
+                # the server behind the client might have been replaced
+                cls.reset_version(es)
+                raise
 
-    @staticmethod
-    def get_mapping_props(es, index, doc_type=None):
+        def send_resilient():
+            return resilience.call(send, index=kwargs.get("index"),
+                                   idempotent=action in resilience.READ_ACTIONS)
+
+        if (action in resilience.READ_ACTIONS
+                and get_config("es_singleflight", True)):
+            # identical reads in flight are sent only once
+            key = singleflight.request_key(es, action, kwargs)
+            return singleflight.flights.do(key, send_resilient)
+        return send_resilient()
+
+    @classmethod
+    def get_mapping_props(cls, es, index, doc_type=None):
         """ Requests the properties of a mapping applied to one index """
-        server_version = int(es.info()['version']['number'][0])
         mapping = es.indices.get_mapping(index=index)
+        return cls.mapping_props(es, mapping, index, doc_type=doc_type)
+
+    @classmethod
+    def mapping_props(cls, es, mapping, index, doc_type=None):
+        """ Extracts the properties of one index out of the `mapping`
+            returned by `es.indices.get_mapping` """
+        server_version = cls.server_version(es)
         if server_version < 7:
             if not doc_type:
                 raise KeyError("doc_type needed in pre-elasticsearch-7 call")
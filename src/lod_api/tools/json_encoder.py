@@ -0,0 +1,174 @@
+""" JSON encoders of the api responses
+
+    The json and jsonl responses of the searches, records, explore and
+    reconcile endpoints serialize thousands of records. Instead of the
+    encoder of flask they use a faster codec if one is installed
+    (`pip install lod-api[fast]`). The encoder is chosen with
+    `json_encoder` in the config:
+        auto    fastest installed codec (default)
+        orjson  orjson, stdlib json if it is not installed
+        json    stdlib json as used by flask
+    or the dotted path of an own subclass of `StdlibEncoder`, e.g.
+    `mypackage.encoders.MyEncoder`.
+"""
+import importlib
+import json
+
+import flask
+
+from lod_api.tools.config_parser import get_config
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+
+class StdlibEncoder:
+    """ encoder based on the json encoder of flask, with the same output
+        as `flask.jsonify` """
+    name = "json"
+
+    def dumps(self, data):
+        """ compact serialization of `data` as bytes, sorted keys if
+            flask sorts them (`sort_keys`) """
+        return flask.json.dumps(data, separators=(",", ":")).encode("utf-8")
+
+    def line(self, data):
+        """ serialization of `data` as one line of json lines """
+        return json.dumps(data, indent=None).encode("utf-8")
+
+
+class OrjsonEncoder(StdlibEncoder):
+    """ Encoder based on orjson. Data orjson refuses (e.g. integers
+        exceeding 64 bit) is handled by the stdlib. """
+    name = "orjson"
+
+    def _dumps(self, data, option=0):
+        if sort_keys():
+            option |= orjson.OPT_SORT_KEYS
+        try:
+            return orjson.dumps(data, default=self.default,
+                                option=option | orjson.OPT_NON_STR_KEYS)
+        except orjson.JSONEncodeError:
+            return None
+
+    @staticmethod
+    def default(o):
+        app = flask.current_app
+        if app and hasattr(app, "json"):
+            return app.json.default(o)
+        return flask.json.JSONEncoder().default(o)
+
+    def dumps(self, data):
+        ret = self._dumps(data)
+        if ret is None:
+            return super().dumps(data)
+        return ret
+
+    def line(self, data):
+        try:
+            return orjson.dumps(data, default=self.default,
+                                option=orjson.OPT_NON_STR_KEYS)
+        except orjson.JSONEncodeError:
+            return super().line(data)
+
+
+ENCODERS = {
+    "json": StdlibEncoder,
+    "orjson": OrjsonEncoder,
+}
+
+
+def available():
+    """ names of the encoders whose codec is installed """
+    ret = ["json"]
+    if orjson is not None:
+        ret.insert(0, "orjson")
+    return ret
+
+
+def get_encoder(name="auto"):
+    """ Returns an instance of the encoder `name` """
+    if name in (None, "auto"):
+        name = available()[0]
+    if name in ENCODERS:
+        if name not in available():
+            print("json codec '{}' not installed, using stdlib json"
+                  .format(name))
+            name = "json"
+        return ENCODERS[name]()
+    module, _, cls = name.rpartition(".")
+    try:
+        return getattr(importlib.import_module(module), cls)()
+    except (ImportError, AttributeError, ValueError) as e:
+        raise ValueError("unknown json encoder '{}': {}".format(name, e))
+
+
+_encoders = {}
+
+
+def configured():
+    """ the encoder configured by `json_encoder` """
+    name = get_config("json_encoder", "auto")
+    if name not in _encoders:
+        _encoders[name] = get_encoder(name)
+    return _encoders[name]
+
+
+def _provider():
+    """ the json provider of the flask app (flask >= 2.2), None for the
+        `JSONIFY_*` config keys of older versions """
+    return getattr(flask.current_app, "json", None)
+
+
+def sort_keys():
+    """ whether flask sorts the keys of the responses """
+    if not flask.current_app:
+        return True
+    provider = _provider()
+    if provider is not None:
+        return provider.sort_keys
+    return flask.current_app.config.get("JSON_SORT_KEYS", True)
+
+
+def mimetype():
+    """ mimetype of the json responses of flask """
+    provider = _provider()
+    if provider is not None:
+        return provider.mimetype
+    return flask.current_app.config["JSONIFY_MIMETYPE"]
+
+
+def pretty():
+    """ whether the responses are pretty printed like `flask.jsonify`
+        does in debug mode, this is left to flask """
+    app = flask.current_app
+    provider = _provider()
+    if provider is not None:
+        return provider.compact is False or \
+            (provider.compact is None and app.debug)
+    return app.debug or app.config["JSONIFY_PRETTYPRINT_REGULAR"]
+
+
+def jsonify(data):
+    """ `flask.jsonify` with the configured encoder """
+    if pretty():
+        return flask.jsonify(data)
+    return flask.current_app.response_class(
+        configured().dumps(data) + b"\n", mimetype=mimetype())
+
+
+def jsonpify(data):
+    """ `jsonify`, padded with the `callback` argument of the request
+        (JSONP) if there is one, as `flask_jsonpify.jsonpify` """
+    callback = flask.request.args.get("callback")
+    if not callback:
+        return jsonify(data)
+    if pretty():
+        body = json.dumps(data, indent=2).encode("utf-8")
+    else:
+        body = configured().dumps(data)
+    return flask.current_app.response_class(
+        callback.encode("utf-8") + b"(" + body + b");",
+        mimetype="application/javascript")
@@ -0,0 +1,131 @@
+""" Local store of the json-ld contexts of the records
+
+    The records refer to their context by URL (e.g. the context of
+    esmarc on github). To convert them to RDF without requests to other
+    hosts, the context documents are read from local files configured in
+    the `jsonld_contexts` config section:
+        contexts:
+          <url of the context>: <path of a local copy>
+    Relative paths are read from the contexts shipped with the api in
+    `lod_api/contexts`, e.g. the context of esmarc, which is configured
+    by default. The conversion of records using contexts missing there
+    fails, unless `remote` is enabled (off by default): then they are
+    fetched once per process. The documents are kept for the lifetime of
+    the process, the parsed contexts are cached by
+    `lod_api.tools.rdf_serializer`.
+"""
+import json
+import os
+import threading
+
+import requests
+
+from lod_api.tools.config_parser import get_config
+
+ESMARC_CONTEXT = \
+    "https://raw.githubusercontent.com/slub/esmarc/master/conf/context.jsonld"
+
+# directory of the contexts shipped with the api
+CONTEXTS_DIR = os.path.join(
+    os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "contexts")
+
+# defaults for the `jsonld_contexts` config section
+defaults = {
+    "contexts": {ESMARC_CONTEXT: "esmarc.jsonld"},
+    "remote": False,
+    "timeout": 5,
+}
+
+
+def option(name):
+    return get_config("jsonld_contexts", {}).get(name, defaults[name])
+
+
+def contexts():
+    """ url → path of the local copies, the configured ones added to
+        the shipped ones """
+    ret = dict(defaults["contexts"])
+    ret.update(get_config("jsonld_contexts", {}).get("contexts") or {})
+    return {url: os.path.join(CONTEXTS_DIR, path)
+            for url, path in ret.items() if path}
+
+
+class ContextUnavailable(LookupError):
+    """ the context is neither configured nor allowed to be fetched """
+
+
+class ContextStore:
+    """ Context documents by their URL, read or fetched once """
+
+    def __init__(self):
+        self._documents = {}    # url → context document
+        self._lock = threading.Lock()
+
+    def _read(self, url):
+        path = contexts().get(url)
+        if path:
+            try:
+                with open(path) as f:
+                    return json.load(f)
+            except OSError as e:
+                raise ContextUnavailable(
+                    "local copy of json-ld context {} not readable: {}"
+                    .format(url, e))
+        if not option("remote"):
+            raise ContextUnavailable(
+                "json-ld context {} is not configured in jsonld_contexts"
+                .format(url))
+        print("jsonld contexts: fetching {}".format(url))
+        res = requests.get(url, timeout=option("timeout"),
+                           headers={"Accept": "application/ld+json, "
+                                              "application/json"})
+        res.raise_for_status()
+        return res.json()
+
+    def get(self, url):
+        """ context document of `url` """
+        document = self._documents.get(url)
+        if document is None:
+            try:
+                document = self._read(url)
+            except (OSError, ValueError, requests.RequestException) as e:
+                raise ContextUnavailable(
+                    "json-ld context {} unavailable: {}".format(url, e))
+            if not isinstance(document, dict) or "@context" not in document:
+                raise ContextUnavailable(
+                    "{} is no json-ld context document".format(url))
+            with self._lock:
+                self._documents[url] = document
+        return document
+
+    def clear(self):
+        with self._lock:
+            self._documents = {}
+
+
+store = ContextStore()
+
+
+def resolve(source):
+    """ the value of a `@context` entry with the referenced contexts
+        replaced by their local copies """
+    if isinstance(source, str):
+        return resolve(store.get(source)["@context"])
+    if isinstance(source, list):
+        resolved = []
+        for item in source:
+            item = resolve(item)
+            resolved.extend(item if isinstance(item, list) else [item])
+        return resolved
+    return source
+
+
+def local(doc):
+    """ `doc` with all its contexts replaced by their local copies, e.g.
+        to be parsed by rdflib without fetching them """
+    if isinstance(doc, list):
+        return [local(item) for item in doc]
+    if not isinstance(doc, dict):
+        return doc
+    return {key: resolve(value) if key == "@context" else local(value)
+            for key, value in doc.items()}
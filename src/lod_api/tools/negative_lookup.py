@@ -0,0 +1,243 @@
+""" Negative lookups of records and authority identifiers
+
+    Link checkers and bots request lots of ids that do not exist. To
+    answer those without elasticsearch, a Bloom filter per index holds
+    the ids of its documents and another one the authority URIs (see
+    `authority_path`) of its documents. The filters are built by
+        lod-api -c <config> build-filters
+    into the directory `path` of the `negative_lookup` config section and
+    are reloaded by the api once they changed on disk.
+
+    A Bloom filter has no false negatives, thus an id missing in the
+    filter does not exist, while an id contained in the filter exists
+    with a probability of 1 - `error_rate`. A filter is only consulted
+    while its index is of the generation it was built from (see
+    `lod_api.tools.generations`), new documents of later generations are
+    unknown to it. Misses that got past the filters are remembered for a
+    short time by `negative_cache` (see `lod_api.tools.cache`).
+"""
+import hashlib
+import json
+import math
+import os
+import tempfile
+import threading
+import time
+
+import elasticsearch
+import elasticsearch.helpers
+
+from lod_api.tools import generations
+from lod_api.tools.config_parser import get_config
+from lod_api.tools.es_client import get_client
+
+# defaults for the `negative_lookup` config section
+defaults = {
+    "enabled": True,
+    "path": os.path.join(tempfile.gettempdir(), "lod-api-filters"),
+    "error_rate": 0.001,
+    "growth": 1.2,
+    "check_interval": 30,
+}
+
+MAGIC = b"LODBLOOM1\n"
+
+
+def option(name):
+    return get_config("negative_lookup", {}).get(name, defaults[name])
+
+
+class BloomFilter:
+    """ Bloom filter of `capacity` strings with a false positive rate of
+        `error_rate`. The `k` bit positions of a string are derived from
+        a single blake2b digest (double hashing). """
+
+    def __init__(self, capacity=1000, error_rate=0.001, bits=None, k=None,
+                 m=None):
+        capacity = max(capacity, 1)
+        if bits is None:
+            self.m = max(8, int(-capacity * math.log(error_rate)
+                                / math.log(2) ** 2))
+            self.k = max(1, round(self.m / capacity * math.log(2)))
+            self.bits = bytearray((self.m + 7) // 8)
+        else:
+            self.bits = bytearray(bits)
+            self.m = m
+            self.k = k
+        self.count = 0
+
+    def _positions(self, item):
+        digest = hashlib.blake2b(item.encode("utf-8"), digest_size=16).digest()
+        h1 = int.from_bytes(digest[:8], "little")
+        h2 = int.from_bytes(digest[8:], "little") | 1
+        return ((h1 + i * h2) % self.m for i in range(self.k))
+
+    def add(self, item):
+        for pos in self._positions(item):
+            self.bits[pos >> 3] |= 1 << (pos & 7)
+        self.count += 1
+
+    def __contains__(self, item):
+        return all(self.bits[pos >> 3] & (1 << (pos & 7))
+                   for pos in self._positions(item))
+
+    def save(self, path, **meta):
+        """ write the filter together with `meta` (e.g. the generation
+            it was built from) atomically to `path` """
+        header = dict(meta, m=self.m, k=self.k, count=self.count)
+        directory = os.path.dirname(os.path.abspath(path))
+        os.makedirs(directory, exist_ok=True)
+        fd, tmp = tempfile.mkstemp(dir=directory, prefix=".bloom")
+        with os.fdopen(fd, "wb") as f:
+            f.write(MAGIC)
+            f.write(json.dumps(header).encode("utf-8") + b"\n")
+            f.write(self.bits)
+        os.replace(tmp, path)
+
+    @classmethod
+    def load(cls, path):
+        """ filter and its meta data out of the file `path` """
+        with open(path, "rb") as f:
+            if f.readline() != MAGIC:
+                raise ValueError("{} is no bloom filter".format(path))
+            header = json.loads(f.readline())
+            bloom = cls(bits=f.read(), k=header["k"], m=header["m"])
+        bloom.count = header["count"]
+        return bloom, header
+
+
+def filter_path(index, kind):
+    """ file of the filter of the `kind` ("ids" or "authorities") of
+        `index` """
+    return os.path.join(option("path"), "{}.{}.bloom".format(index, kind))
+
+
+def strip_scheme(uri):
+    """ authority URIs are compared without http(s)://, as they are
+        searched with both """
+    for scheme in ("https://", "http://"):
+        if uri.startswith(scheme):
+            return uri[len(scheme):]
+    return uri
+
+
+def _values(doc, path):
+    """ all values at the dotted `path` of `doc`, lists are flattened """
+    values = [doc]
+    for key in path.split("."):
+        found = []
+        for value in values:
+            for item in (value if isinstance(value, list) else [value]):
+                if isinstance(item, dict) and key in item:
+                    found.append(item[key])
+        values = found
+    for value in values:
+        yield from (value if isinstance(value, list) else [value])
+
+
+def build(index, es=None):
+    """ build the filters of `index` out of all its documents """
+    es = es or get_client(index=index)
+    token = generations.GenerationTracker(es=es).fetch([index]).get(index)
+    count = es.count(index=index)["count"]
+    capacity = int(count * option("growth")) + 1
+    error_rate = option("error_rate")
+    ids = BloomFilter(capacity, error_rate)
+    authorities = BloomFilter(capacity, error_rate)
+    # the source field of the keyword field searched by the api
+    auth_path = get_config("authority_path", "sameAs.@id.keyword")
+    source_path = auth_path[:-len(".keyword")] \
+        if auth_path.endswith(".keyword") else auth_path
+    for hit in elasticsearch.helpers.scan(
+            es, index=index, query={"query": {"match_all": {}}},
+            _source_includes=[source_path], size=1000):
+        ids.add(hit["_id"])
+        for uri in _values(hit.get("_source", {}), source_path):
+            if isinstance(uri, str):
+                authorities.add(strip_scheme(uri))
+    for kind, bloom in (("ids", ids), ("authorities", authorities)):
+        bloom.save(filter_path(index, kind), index=index, generation=token,
+                   built=time.time())
+    print("negative lookup: built filters of {} ({} documents)"
+          .format(index, ids.count))
+    return ids, authorities
+
+
+def build_all():
+    """ build the filters of all configured indices """
+    for index in get_config("indices_list", []):
+        try:
+            build(index)
+        except elasticsearch.ElasticsearchException as e:
+            print("negative lookup: building the filters of {} failed: {}"
+                  .format(index, e))
+
+
+class FilterStore:
+    """ Filters loaded from disk, reloaded once their file changed """
+
+    def __init__(self):
+        self._filters = {}      # (index, kind) → (mtime, filter, header)
+        self._checked = {}      # (index, kind) → time of the last check
+        self._lock = threading.Lock()
+
+    def get(self, index, kind):
+        """ filter of `index` if it was built from the current generation
+            of the index, else None """
+        key = (index, kind)
+        now = time.monotonic()
+        if now - self._checked.get(key, -math.inf) >= option("check_interval"):
+            with self._lock:
+                self._checked[key] = now
+                self._reload(key)
+        entry = self._filters.get(key)
+        if entry is None:
+            return None
+        _, bloom, header = entry
+        token = generations.tracker.token(index)
+        if token in (None, generations.UNKNOWN) \
+                or header.get("generation") != token:
+            return None
+        return bloom
+
+    def _reload(self, key):
+        path = filter_path(*key)
+        try:
+            mtime = os.stat(path).st_mtime
+        except OSError:
+            self._filters.pop(key, None)
+            return
+        entry = self._filters.get(key)
+        if entry is not None and entry[0] == mtime:
+            return
+        try:
+            bloom, header = BloomFilter.load(path)
+        except (OSError, ValueError) as e:
+            print("negative lookup: loading {} failed: {}".format(path, e))
+            self._filters.pop(key, None)
+            return
+        self._filters[key] = (mtime, bloom, header)
+
+
+store = FilterStore()
+
+
+def missing_id(index, id):
+    """ whether the document `id` does definitely not exist in `index` """
+    if not option("enabled"):
+        return False
+    bloom = store.get(index, "ids")
+    return bloom is not None and id not in bloom
+
+
+def missing_authority(indices, uri):
+    """ whether no document of `indices` (list) links the authority
+        `uri` for sure """
+    if not option("enabled"):
+        return False
+    uri = strip_scheme(uri)
+    for index in indices:
+        bloom = store.get(index, "authorities")
+        if bloom is None or uri in bloom:
+            return False
+    return True
@@ -0,0 +1,275 @@
+""" Serialization of the json-ld records to N-Triples, N-Quads and Turtle
+
+    Parsing every record into an rdflib graph before serializing it is
+    the slowest path of the api. The records of the indices are trees of
+    plain json-ld: nodes with `@id` and `@type`, terms of one context and
+    literal values. Such records are written here triple by triple, one
+    record at a time, with the terms of their (parsed and cached)
+    context. Records using any other json-ld feature (e.g. `@graph`,
+    `@list`, `@reverse`, scoped contexts, relative IRIs) are serialized
+    with rdflib instead. Both read the contexts out of the local store of
+    `lod_api.tools.jsonld_context`.
+"""
+import json
+import re
+import threading
+
+import rdflib
+from rdflib.plugins.shared.jsonld.context import Context
+from rdflib.plugins.shared.jsonld.context import UNDEF
+
+from lod_api.tools import jsonld_context
+
+RDF_TYPE = "http://www.w3.org/1999/02/22-rdf-syntax-ns#type"
+XSD = "http://www.w3.org/2001/XMLSchema#"
+
+# absolute IRIs, which need no escaping in N-Triples
+IRI = re.compile(r'^[A-Za-z][A-Za-z0-9+.-]*:[^\x00-\x20<>"{}|^`\\]*$')
+# prefix and local name of a Turtle prefixed name (a subset of them)
+PN_PREFIX = re.compile(r'^[A-Za-z][A-Za-z0-9_-]*$')
+PN_LOCAL = re.compile(r'^[A-Za-z_][A-Za-z0-9_-]*$')
+INTEGER = re.compile(r'^"(-?\d+)"\^\^<' + XSD + 'integer>$')
+BOOLEAN = re.compile(r'^"(true|false)"\^\^<' + XSD + 'boolean>$')
+
+RDFLIB_FORMATS = {"nt": "nt", "nq": "nquads", "ttl": "turtle"}
+
+
+class Unsupported(ValueError):
+    """ the record uses json-ld features not handled here """
+
+
+_contexts = {}      # context (url or serialized json) → parsed Context
+_lock = threading.Lock()
+
+
+def context(source):
+    """ parsed json-ld context `source` (url, object or list of them),
+        parsed once per process out of the local copies of the
+        referenced contexts """
+    key = source if isinstance(source, str) \
+        else json.dumps(source, sort_keys=True)
+    ctx = _contexts.get(key)
+    if ctx is None:
+        ctx = Context(jsonld_context.resolve(source))
+        with _lock:
+            _contexts[key] = ctx
+    return ctx
+
+
+def _iri(value):
+    if not isinstance(value, str) or not IRI.match(value):
+        raise Unsupported("no absolute IRI: {!r}".format(value))
+    return value
+
+
+def _escape(value):
+    return (value.replace("\\", "\\\\").replace('"', '\\"')
+            .replace("\n", "\\n").replace("\r", "\\r"))
+
+
+def _lexical(value):
+    if isinstance(value, bool):
+        return "true" if value else "false"
+    if isinstance(value, (str, int, float)):
+        return str(value)
+    raise Unsupported("no literal: {!r}".format(value))
+
+
+def _literal(value, datatype=None, language=None):
+    text = '"' + _escape(value) + '"'
+    if language:
+        return text + "@" + language
+    if datatype:
+        return text + "^^<" + _iri(datatype) + ">"
+    return text
+
+
+def _object(value, term, ctx, nodes):
+    """ N-Triples term of the json value `value` of `term`, blank nodes
+        are returned as (None, properties) """
+    coercion = term.type if term else None
+    if isinstance(value, dict):
+        if "@value" in value:
+            if set(value) - {"@value", "@type", "@language"} \
+                    or not isinstance(value["@value"], str):
+                raise Unsupported("value object: {!r}".format(value))
+            language = value.get("@language")
+            if language and " " in language:
+                return None
+            datatype = value.get("@type")
+            return _literal(value["@value"],
+                            datatype and ctx.expand(datatype), language)
+        subject, props = _node(value, ctx, nodes)
+        if subject is None:
+            return (None, props)
+        if props:
+            nodes.append((subject, props))
+        return subject
+    if isinstance(value, list):
+        raise Unsupported("list of lists")
+    if coercion == "@id" and isinstance(value, str):
+        return "<" + _iri(ctx.resolve(value)) + ">"
+    if coercion == "@vocab" and isinstance(value, str):
+        return "<" + _iri(ctx.expand(value) or ctx.resolve_iri(value)) + ">"
+    if coercion:
+        if coercion.startswith("@"):
+            raise Unsupported("coercion {}".format(coercion))
+        return _literal(_lexical(value), ctx.expand(coercion))
+    if isinstance(value, bool):
+        return _literal(_lexical(value), XSD + "boolean")
+    if isinstance(value, int):
+        return _literal(str(value), XSD + "integer")
+    if isinstance(value, float):
+        return _literal(str(value), XSD + "double")
+    if not isinstance(value, str):
+        raise Unsupported("no literal: {!r}".format(value))
+    language = term.language if term and term.language is not UNDEF \
+        else ctx.language
+    if language and " " in language:
+        return None
+    return _literal(value, language=language)
+
+
+def _node(obj, ctx, nodes, root=False):
+    """ subject (None for blank nodes) and properties of the json-ld node
+        `obj`, nodes with an `@id` nested in it are added to `nodes` """
+    subject = None
+    props = []
+    for key, value in obj.items():
+        if key == "@context" and root:
+            continue
+        if key == "@id":
+            subject = "<" + _iri(ctx.resolve(value)) + ">"
+            continue
+        if key == "@type":
+            types = value if isinstance(value, list) else [value]
+            props.append((RDF_TYPE, ["<" + _iri(ctx.expand(t)) + ">"
+                                     for t in types]))
+            continue
+        term = ctx.terms.get(key)
+        if key.startswith("@") or (term and (
+                term.reverse or term.context is not UNDEF
+                or set(term.container or ()) - {"@set"}
+                or not term.id or term.id.startswith("@"))):
+            raise Unsupported("key {}".format(key))
+        predicate = term.id if term else ctx.expand(key)
+        if not predicate:
+            continue    # not mapped by the context, dropped by json-ld
+        objects = [_object(item, term, ctx, nodes)
+                   for item in (value if isinstance(value, list) else [value])
+                   if item is not None]
+        objects = [o for o in objects if o is not None]
+        if objects:
+            props.append((_iri(predicate), objects))
+    return subject, props
+
+
+def nodes(doc):
+    """ ctx and (subject, properties) of all nodes of the record `doc`,
+        raises `Unsupported` for records to be serialized by rdflib """
+    if not isinstance(doc, dict):
+        raise Unsupported("no json-ld object")
+    ctx = context(doc.get("@context", {}))
+    nested = []
+    root = _node(doc, ctx, nested, root=True)
+    return ctx, [root] + nested
+
+
+def _triples(subject, props, bnodes):
+    for predicate, objects in props:
+        for o in objects:
+            if isinstance(o, tuple):
+                label = "_:b{}".format(next(bnodes))
+                yield subject, predicate, label
+                yield from _triples(label, o[1], bnodes)
+            else:
+                yield subject, predicate, o
+
+
+def _lines(doc_nodes, bnodes, graph=""):
+    for subject, props in doc_nodes:
+        if subject is None:
+            subject = "_:b{}".format(next(bnodes))
+        for s, p, o in _triples(subject, props, bnodes):
+            yield "{} <{}> {}{} .\n".format(s, p, o, graph)
+
+
+class Turtle:
+    """ Turtle writer abbreviating IRIs with the prefixes of the first
+        context it is given """
+
+    def __init__(self):
+        self.prefixes = None
+
+    def header(self, ctx):
+        self.prefixes = {}
+        if ctx.vocab:
+            self.prefixes[""] = ctx.vocab
+        for name, term in ctx.terms.items():
+            if term.prefix and term.id and PN_PREFIX.match(name):
+                self.prefixes[name] = term.id
+        return "".join("@prefix {}: <{}> .\n".format(name, ns)
+                       for name, ns in sorted(self.prefixes.items())) + "\n"
+
+    def iri(self, iri):
+        for name, ns in self.prefixes.items():
+            if iri.startswith(ns) and PN_LOCAL.match(iri[len(ns):]):
+                return name + ":" + iri[len(ns):]
+        return "<" + iri + ">"
+
+    def term(self, term, depth):
+        if isinstance(term, tuple):
+            if not term[1]:
+                return "[]"
+            return "[ " + self.props(term[1], depth + 2) + " ]"
+        if term.startswith("<"):
+            return self.iri(term[1:-1])
+        match = INTEGER.match(term) or BOOLEAN.match(term)
+        if match:
+            return match.group(1)
+        return term
+
+    def props(self, props, depth):
+        sep = " ;\n" + " " * (4 * depth)
+        return sep.join(
+            ("a" if p == RDF_TYPE else self.iri(p)) + " "
+            + ", ".join(self.term(o, depth) for o in objects)
+            for p, objects in props)
+
+    def node(self, subject, props):
+        if not props:
+            return ""
+        subject = "[]" if subject is None else self.term(subject, 0)
+        return subject + " " + self.props(props, 1) + " .\n\n"
+
+
+def _rdflib(doc, fmt):
+    """ `doc` serialized by rdflib """
+    g = rdflib.ConjunctiveGraph()
+    g.parse(data=json.dumps(jsonld_context.local(doc)), format="json-ld")
+    data = g.serialize(format=RDFLIB_FORMATS[fmt])
+    return data.decode("utf-8") if isinstance(data, bytes) else data
+
+
+def serialize(docs, fmt):
+    """ generate the records `docs` in `fmt` ("nt", "nq" or "ttl") chunk
+        by chunk, one record at a time """
+    bnodes = iter(range(1, 2 ** 63))
+    turtle = Turtle()
+    for doc in docs:
+        try:
+            ctx, doc_nodes = nodes(doc)
+        except Unsupported:
+            yield _rdflib(doc, fmt)
+            # rdflib may have declared its own prefixes
+            turtle.prefixes = None
+            continue
+        if fmt == "ttl":
+            if turtle.prefixes is None:
+                yield turtle.header(ctx)
+            yield "".join(turtle.node(s, props) for s, props in doc_nodes)
+        elif fmt == "nq":
+            graph = " _:b{}".format(next(bnodes))
+            yield "".join(_lines(doc_nodes, bnodes, graph))
+        else:
+            yield "".join(_lines(doc_nodes, bnodes))
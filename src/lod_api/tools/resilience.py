@@ -0,0 +1,214 @@
+""" Resilience layer for the requests sent to elasticsearch
+
+    Used by `ES_wrapper.call`:
+      - idempotent reads are retried a bounded number of times with a
+        jittered exponential backoff if elasticsearch is unreachable or
+        overloaded
+      - a circuit breaker per index fails fast with `CircuitOpenError`
+        once `breaker_threshold` consecutive requests failed. After
+        `breaker_reset` seconds a single trial request is let through,
+        which closes the breaker again on success.
+      - caches that serve an outdated answer instead of failing (see
+        `stale_if_error` of `lod_api.tools.cache`) call `mark_stale()`,
+        so that the response carries a `Warning` header
+
+    The options are read from `es_resilience` in the config, the state
+    of all breakers is available via `breakers.state()` and reported by
+    the `/admin/caches` endpoint.
+"""
+import random
+import threading
+import time
+
+import elasticsearch
+import flask
+
+from lod_api.tools import deadline
+from lod_api.tools.config_parser import get_config
+
+# actions that can be retried without side effects
+READ_ACTIONS = {"search", "get", "mget", "msearch", "count", "exists",
+                "info", "scroll"}
+
+# status codes of elasticsearch that indicate an overloaded cluster
+RETRY_STATUS = {429, 502, 503, 504}
+
+# defaults for the `es_resilience` config section
+defaults = {
+    "retries": 2,
+    "backoff": 0.05,
+    "backoff_max": 1.0,
+    "breaker_threshold": 5,
+    "breaker_reset": 30,
+}
+
+
+def option(name):
+    return get_config("es_resilience", {}).get(name, defaults[name])
+
+
+class CircuitOpenError(Exception):
+    """ raised instead of sending a request to an index whose circuit
+        breaker is open """
+
+    def __init__(self, index, retry_after):
+        self.index = index
+        self.retry_after = retry_after
+        super().__init__("elasticsearch unavailable for index '{}', retry "
+                         "after {} seconds".format(index, retry_after))
+
+
+def is_failure(exc):
+    """ Whether `exc` indicates an unavailable or overloaded cluster, in
+        contrast to an error in the request itself (e.g. 404, 400) """
+    if isinstance(exc, elasticsearch.ConnectionError):
+        return True
+    if isinstance(exc, elasticsearch.TransportError):
+        return (isinstance(exc.status_code, int)
+                and (exc.status_code >= 500 or exc.status_code in RETRY_STATUS))
+    return False
+
+
+def is_retryable(exc):
+    if isinstance(exc, elasticsearch.ConnectionError):
+        return True
+    if isinstance(exc, elasticsearch.TransportError):
+        return exc.status_code in RETRY_STATUS
+    return False
+
+
+def backoff(attempt):
+    """ jittered exponential backoff in seconds for the retry `attempt` """
+    cap = min(option("backoff_max"), option("backoff") * 2 ** attempt)
+    return random.uniform(0, cap)
+
+
+class CircuitBreaker:
+    CLOSED = "closed"
+    OPEN = "open"
+    HALF_OPEN = "half_open"
+
+    def __init__(self, name):
+        self.name = name
+        self.status = self.CLOSED
+        self.failures = 0           # consecutive failures
+        self.opened = None          # time the breaker was opened
+        self.trips = 0              # count of openings
+        self._trial = False         # trial request running (half open)
+        self._lock = threading.Lock()
+
+    def before_call(self):
+        """ raises `CircuitOpenError` if the request must not be sent """
+        with self._lock:
+            if self.status == self.CLOSED:
+                return
+            remaining = self.opened + option("breaker_reset") - time.monotonic()
+            if remaining > 0 or self._trial:
+                raise CircuitOpenError(self.name, max(1, int(remaining + 1)))
+            # let a single trial request through
+            self.status = self.HALF_OPEN
+            self._trial = True
+
+    def record_success(self):
+        with self._lock:
+            if self.status != self.CLOSED:
+                print("circuit breaker for '{}' closed".format(self.name))
+            self.status = self.CLOSED
+            self.failures = 0
+            self._trial = False
+
+    def record_abandoned(self):
+        """ the request ended without telling anything about the cluster,
+            e.g. the time budget of the api request ran out """
+        with self._lock:
+            self._trial = False
+
+    def record_failure(self):
+        with self._lock:
+            self.failures += 1
+            self._trial = False
+            if (self.status == self.HALF_OPEN
+                    or self.failures >= option("breaker_threshold")):
+                if self.status != self.OPEN:
+                    print("circuit breaker for '{}' opened after {} failures"
+                          .format(self.name, self.failures))
+                    self.trips += 1
+                self.status = self.OPEN
+                self.opened = time.monotonic()
+
+    def state(self):
+        return {"state": self.status,
+                "failures": self.failures,
+                "trips": self.trips}
+
+
+class BreakerRegistry:
+    """ one circuit breaker per index (string) """
+
+    def __init__(self):
+        self._breakers = {}
+        self._lock = threading.Lock()
+
+    def get(self, index):
+        name = index if isinstance(index, str) and index else "_all"
+        with self._lock:
+            if name not in self._breakers:
+                self._breakers[name] = CircuitBreaker(name)
+            return self._breakers[name]
+
+    def state(self):
+        """ state of all breakers for monitoring """
+        with self._lock:
+            breakers = list(self._breakers.values())
+        return {b.name: b.state() for b in breakers}
+
+    def clear(self):
+        with self._lock:
+            self._breakers = {}
+
+
+breakers = BreakerRegistry()
+
+
+def call(fn, index=None, idempotent=False):
+    """ Run `fn` guarded by the circuit breaker of `index`, retry it
+        if it is `idempotent` and failed because of the cluster. """
+    breaker = breakers.get(index)
+    retries = option("retries") if idempotent else 0
+    attempt = 0
+    while True:
+        breaker.before_call()
+        try:
+            ret = fn()
+        except Exception as e:
+            if not is_failure(e):
+                # elasticsearch answered, only the request was bad
+                breaker.record_success()
+                raise
+            if deadline.ran_out(e):
+                # the api request ran out of time, not the cluster
+                breaker.record_abandoned()
+                raise
+            breaker.record_failure()
+            if attempt >= retries or not is_retryable(e):
+                raise
+            delay = backoff(attempt)
+            left = deadline.remaining()
+            if left is not None and left <= delay:
+                # no time left for another attempt
+                raise
+            time.sleep(delay)
+            attempt += 1
+        else:
+            breaker.record_success()
+            return ret
+
+
+def mark_stale():
+    """ flag the current response to be served from an outdated cache """
+    if flask.has_request_context():
+        flask.g.lod_stale = True
+
+
+def is_stale():
+    return flask.has_request_context() and flask.g.get("lod_stale", False)
@@ -1,9 +1,82 @@
 import json
-import gzip
+import hashlib
 import rdflib
-import io
+import zlib
 import flask
 
+from lod_api.tools import json_encoder
+from lod_api.tools import jsonld_context
+from lod_api.tools import rdf_serializer
+from lod_api.tools.config_parser import get_config
+
+# defaults for the `streaming` config section
+defaults = {
+    "stream_items": 1000,
+    "chunk_size": 65536,
+}
+
+
+# defaults for the `compression` config section
+compression_defaults = {
+    "encodings": ["zstd", "br", "gzip"],
+    "min_size": 1024,
+    "gzip_level": 6,
+    "zstd_level": 3,
+    "br_level": 4,
+}
+
+try:
+    import zstandard
+except ImportError:
+    zstandard = None
+
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+
+def option(name):
+    return get_config("streaming", {}).get(name, defaults[name])
+
+
+def compression(name):
+    return get_config("compression", {}).get(name, compression_defaults[name])
+
+
+class BrotliCompressor:
+    """ brotli compressor with the interface of `zlib.compressobj` """
+
+    def __init__(self, quality):
+        self._compressor = brotli.Compressor(quality=quality)
+
+    def compress(self, data):
+        return self._compressor.process(data)
+
+    def flush(self):
+        return self._compressor.finish()
+
+
+def compressor(encoding):
+    """ incremental compressor (`compress` and `flush`) of `encoding` """
+    if encoding == "gzip":
+        return zlib.compressobj(compression("gzip_level"), zlib.DEFLATED,
+                                16 + zlib.MAX_WBITS)
+    if encoding == "zstd":
+        return zstandard.ZstdCompressor(
+            level=compression("zstd_level")).compressobj()
+    if encoding == "br":
+        return BrotliCompressor(compression("br_level"))
+    raise ValueError("unknown content encoding {}".format(encoding))
+
+
+def available_encodings():
+    """ the configured content encodings whose codec is installed, in
+        the order of preference """
+    installed = {"gzip": True, "zstd": zstandard is not None,
+                 "br": brotli is not None}
+    return [enc for enc in compression("encodings") if installed.get(enc)]
+
 # Check if global variable `api` is set from flaskRestPlus
 # if not: create a dummy variable for dealing with the
 # annotations
@@ -17,6 +90,11 @@ import flask
 #     api = mock_api()
 
 
+def _chain(head, chunks):
+    yield from head
+    yield from chunks
+
+
 class Response:
     """ Response class that is mainly used throught Output.parse
         This class takes input data and transforms it according
@@ -25,8 +103,8 @@ class Response:
           - `format` GET parameter OR
           - media type in Request-Header
 
-        In addition a compression with gzip is performed if
-        in accordance with the `Accept-Encoding` header
+        In addition a compression with zstd, brotli or gzip is
+        performed if in accordance with the `Accept-Encoding` header
 
         This class can be extended by adding a format
         in self.format together with a class method
@@ -36,6 +114,7 @@ class Response:
 
     def __init__(self, api):
         self.api = api
+        self.compress = True    # see `render`
 
         self.format = {
             "nt": self.convert_data_to_nt,
@@ -75,30 +154,107 @@ class Response:
         frmt_fct = self.format[frmt_ext]
         frmt_fct = self.api.representation(mtype)(frmt_fct)
 
+    def encoding(self, req):
+        """ content encoding of the response according to the
+            `Accept-Encoding` header of the request `req`: the one with
+            the highest quality of the available encodings, preferred in
+            the configured order """
+        if not req.headers.get("Accept-Encoding"):
+            return "identity"
+        return req.accept_encodings.best_match(available_encodings(),
+                                               "identity")
+
+    def _compress(self, data, encoding):
+        """ compress the bytes `data` with `encoding` """
+        if encoding == "identity":
+            return data
+        comp = compressor(encoding)
+        return comp.compress(data) + comp.flush()
+
+    def _compress_stream(self, chunks, encoding):
+        """ compress the str or bytes `chunks` incrementally with
+            `encoding` """
+        if encoding == "identity":
+            yield from chunks
+            return
+        comp = compressor(encoding)
+        for chunk in chunks:
+            if isinstance(chunk, str):
+                chunk = chunk.encode("utf-8")
+            data = comp.compress(chunk)
+            if data:
+                yield data
+        yield comp.flush()
+
+    def _head(self, res, size):
+        """ read the streamed body of `res` until `size` bytes, returns
+            whether it ended before, then `res` is no longer streamed """
+        chunks = iter(res.response)
+        head, length = [], 0
+        for chunk in chunks:
+            head.append(chunk)
+            length += len(chunk)
+            if length >= size:
+                # continue with the chunks already read
+                res.response = _chain(head, chunks)
+                return False
+        res.set_data("".join(head) if head and isinstance(head[0], str)
+                     else b"".join(head))
+        return True
+
     def _encode(self, req, res):
-        """ Checks if the client has defined `gzip` in its
-            Accept-Encoding Header and compress the HTML
-            responce accordingly
+        """ Compress the response with the content encoding negotiated
+            with the client (see `encoding`), bodies smaller than
+            `min_size` are sent uncompressed. Streamed responses are
+            compressed incrementally.
         """
-        # print(req.headers.get("Accept-Encoding"))
-        if (req.headers.get("Accept-Encoding")
-                and "gzip" in req.headers.get("Accept-Encoding")):
-            # Extends the Response object by the `Content-Encoding` header
-            # and gzip the data from the Response
-            gzip_buffer = io.BytesIO()
-            with gzip.open(gzip_buffer, mode="wb", compresslevel=6) as gzip_file:
-                gzip_file.write(res.data)
-            res.data = gzip_buffer.getvalue()
-            res.headers['Content-Encoding'] = 'gzip'
-            res.headers['Vary'] = 'Accept-Encoding'
+        if not self.compress:
+            return res
+        res.headers['Vary'] = 'Accept-Encoding'
+        encoding = self.encoding(req)
+        if encoding == "identity":
+            return res
+        min_size = compression("min_size")
+        if res.is_streamed and not self._head(res, min_size):
+            res.response = self._compress_stream(res.response, encoding)
+        elif len(res.get_data()) < min_size:
+            return res
+        else:
+            res.data = self._compress(res.data, encoding)
             res.headers['Content-Length'] = res.content_length
+        res.headers['Content-Encoding'] = encoding
         return res
 
+    def _stream(self, request, chunks, mimetype):
+        """ Response sending the str or bytes `chunks` as they are
+            generated, joined to chunks of about `chunk_size` bytes.
+            Without Content-Length they are sent with chunked transfer
+            encoding, thus the whole body is never held in memory. """
+        def joined():
+            size = option("chunk_size")
+            buffer, length = [], 0
+            for chunk in chunks:
+                if isinstance(chunk, str):
+                    chunk = chunk.encode("utf-8")
+                buffer.append(chunk)
+                length += len(chunk)
+                if length >= size:
+                    yield b"".join(buffer)
+                    buffer, length = [], 0
+            if buffer:
+                yield b"".join(buffer)
+        body = joined()
+        if flask.has_request_context():
+            body = flask.stream_with_context(body)
+        return self._encode(request, flask.Response(body, mimetype=mimetype))
+
     def _parse_json(self, data):
-        """ use RDFlib to parse json """
+        """ use RDFlib to parse json, with the local copies of the
+            contexts (see `lod_api.tools.jsonld_context`) """
         g = rdflib.ConjunctiveGraph()
         for elem in data:
-            g.parse(data=json.dumps(elem), format='json-ld')
+            g.parse(data=json.dumps(jsonld_context.local(elem)),
+                    format='json-ld')
         return g
 
     def add(self, frmt_ext, frmt_fct, mediatype=None):
@@ -116,8 +272,8 @@ class Response:
             if self.api:
                 self._register(mediatype, frmt_ext)
 
-    def parse(self, data, get_format, file_ext, request):
-        """ `parse` decides in which form the data should be
+    def negotiate(self, get_format, file_ext, request):
+        """ `negotiate` decides in which form the data should be
            transformed before it is served to the client.
 
            The decision is made according to the following
@@ -153,48 +309,130 @@ class Response:
             retformat = "json"
 
         print(retformat)
+        return retformat
+
+    def parse(self, data, get_format, file_ext, request):
+        """ transform `data` into the format negotiated with the
+            client (see `negotiate`) """
+        retformat = self.negotiate(get_format, file_ext, request)
 
         if data is None:    # returns 404 if data not set
             flask.abort(404)
 
+        return self.convert(data, retformat, request)
+
+    def convert(self, data, retformat, request):
+        """ transform `data` into `retformat` """
         # check out the format string for ?format= or Content-Type Headers
         try:
             return self.format[retformat](data, request)
         except KeyError:
             # return simple json object
-            # return self.convert_data_to_json(data, request)
-            return self._encode(request, flask.jsonify(data))
+            return self.convert_data_to_json(data, request)
+
+    def render(self, data, retformat, request):
+        """ transform `data` into `retformat` without compressing it,
+            e.g. to be cached by `represent` """
+        self.compress = False
+        try:
+            return self.convert(data, retformat, request)
+        finally:
+            self.compress = True
+
+    def represent(self, cache, key, retformat, request, fetch, tags=(),
+                  refresh=False):
+        """ Serve the representation of the data returned by `fetch` in
+            `retformat`, converted and compressed once per content
+            encoding and kept in `cache` under `key`, the format and the
+            encoding. `fetch` returns the data together with its entity
+            tag, without one the tag is derived from the converted body.
+            Requests whose `If-None-Match` matches are answered with
+            304 Not Modified. Results of more than `stream_items` items
+            are streamed without being cached. """
+        encoding = self.encoding(request)
+        plain_key = "{}|{}|identity".format(key, retformat)
+        full_key = "{}|{}|{}".format(key, retformat, encoding)
+        entry = None if refresh else cache.get(full_key)
+        if entry is None:
+            # other encodings are compressed from the plain representation
+            plain = None if refresh else cache.get(plain_key)
+            if plain is None:
+                data, etag = fetch()
+                if isinstance(data, list) and len(data) > option("stream_items"):
+                    return self.convert(data, retformat, request)
+                rendered = self.render(data, retformat, request)
+                body = rendered.get_data()
+                plain = {"body": body,
+                         "content_type": rendered.headers.get("Content-Type"),
+                         "encoding": "identity",
+                         "etag": etag or hashlib.sha1(body).hexdigest()}
+                cache.set(plain_key, plain, tags=tags)
+            entry = plain
+            if encoding != "identity" \
+                    and len(plain["body"]) >= compression("min_size"):
+                entry = dict(plain, encoding=encoding,
+                             body=self._compress(plain["body"], encoding))
+                cache.set(full_key, entry, tags=tags)
+        res = flask.Response(entry["body"], content_type=entry["content_type"])
+        if entry["encoding"] != "identity":
+            res.headers['Content-Encoding'] = entry["encoding"]
+        res.headers['Vary'] = 'Accept-Encoding'
+        res.set_etag(entry["etag"], weak=True)
+        return res.make_conditional(request)
 
     def convert_data_to_json(self, data, request):
-        return self._encode(request, flask.jsonify(data))
+        if not isinstance(data, list) or json_encoder.pretty():
+            return self._encode(request, json_encoder.jsonify(data))
+
+        # the same output as `jsonify`, streamed item by item
+        encoder = json_encoder.configured()
+
+        def chunks():
+            yield b"["
+            for i, item in enumerate(data):
+                if i:
+                    yield b","
+                yield encoder.dumps(item)
+            yield b"]\n"
+        return self._stream(request, chunks(), json_encoder.mimetype())
+
+    def _serialize(self, data, fmt):
+        """ serialize the graph of `data` with rdflib, rdflib before
+            version 6 returns bytes """
+        data_out = self._parse_json(data).serialize(format=fmt)
+        if isinstance(data_out, bytes):
+            data_out = data_out.decode('utf-8')
+        return data_out
+
+    def _stream_rdf(self, data, fmt, mimetype, request):
+        """ stream `data` in `fmt` record by record, see
+            `lod_api.tools.rdf_serializer` """
+        if isinstance(data, dict):
+            data = [data]
+        return self._stream(request, rdf_serializer.serialize(data, fmt),
+                            mimetype)
 
     def convert_data_to_nt(self, data, request):
-        data_out = self._parse_json(data).serialize(format="nt").decode('utf-8')
-        res = flask.Response(data_out, mimetype='application/n-triples')
-        return self._encode(request, res)
+        return self._stream_rdf(data, "nt", 'application/n-triples', request)
 
     def convert_data_to_rdf(self, data, request):
-        data_out = self._parse_json(data).serialize(format="application/rdf+xml").decode('utf-8')
+        data_out = self._serialize(data, "application/rdf+xml")
         res = flask.Response(data_out, mimetype='application/rdf+xml')
         return self._encode(request, res)
 
     def convert_data_to_ttl(self, data, request):
-        data_out = self._parse_json(data).serialize(format="turtle").decode('utf-8')
-        res = flask.Response(data_out, mimetype='text/turtle')
-        return self._encode(request, res)
+        return self._stream_rdf(data, "ttl", 'text/turtle', request)
 
     def convert_data_to_nq(self, data, request):
-        data_out = self._parse_json(data).serialize(format="nquads").decode('utf-8')
-        res = flask.Response(data_out, mimetype='application/n-quads')
-        return self._encode(request, res)
+        return self._stream_rdf(data, "nq", 'application/n-quads', request)
 
     def convert_data_to_jsonl(self, data, request):
-        data_out = ""
-        if isinstance(data, list):
-            for item in data:
-                data_out += json.dumps(item, indent=None) + "\n"
-        elif isinstance(data, dict):
-            data_out += json.dumps(data, indent=None) + "\n"
-
-        res = flask.Response(data_out, mimetype='application/x-jsonlines')
-        return self._encode(request, res)
+        encoder = json_encoder.configured()
+
+        def chunks():
+            if isinstance(data, list):
+                for item in data:
+                    yield encoder.line(item) + b"\n"
+            elif isinstance(data, dict):
+                yield encoder.line(data) + b"\n"
+        return self._stream(request, chunks(), 'application/x-jsonlines')
@@ -0,0 +1,87 @@
+""" Coalescing of identical elasticsearch requests in flight
+
+    Bursts of the explore webapp or of OpenRefine often send the same
+    request several times within milliseconds. With single-flight, only
+    the first of several identical concurrent requests (same client,
+    action, index and normalized body) is sent to elasticsearch, the
+    others wait for it and get a copy of its result (or its exception).
+    `flights.coalesced` counts the requests that were not sent.
+"""
+import copy
+import json
+import threading
+
+
+class _Flight:
+    def __init__(self):
+        self.done = threading.Event()
+        self.result = None
+        self.error = None
+
+
+def _normalize_body(body):
+    """ parse serialized (e.g. msearch) bodies, thus the key does not
+        depend on formatting or key order """
+    if isinstance(body, (str, bytes)):
+        try:
+            return [json.loads(line) for line in body.splitlines()
+                    if line.strip()]
+        except ValueError:
+            return body
+    return body
+
+
+def request_key(es, action, kwargs):
+    """ key of an elasticsearch request, identical for identical requests """
+    kwargs = dict(kwargs)
+    if "body" in kwargs:
+        kwargs["body"] = _normalize_body(kwargs["body"])
+    return "{}:{}:{}".format(id(es), action,
+                             json.dumps(kwargs, sort_keys=True, default=str))
+
+
+class SingleFlight:
+    def __init__(self):
+        self._flights = {}
+        self._lock = threading.Lock()
+        self.calls = 0          # requests sent
+        self.coalesced = 0      # requests that shared the result of another
+
+    def do(self, key, fn):
+        """ Run `fn` unless a call with the same `key` is in flight, in
+            that case wait for it and share its result. """
+        with self._lock:
+            flight = self._flights.get(key)
+            leader = flight is None
+            if leader:
+                flight = _Flight()
+                self._flights[key] = flight
+                self.calls += 1
+            else:
+                self.coalesced += 1
+
+        if not leader:
+            flight.done.wait()
+            if flight.error is not None:
+                raise flight.error
+            # results are shared, keep them independent of each other
+            return copy.deepcopy(flight.result)
+
+        try:
+            flight.result = fn()
+        except Exception as e:
+            flight.error = e
+            raise
+        finally:
+            with self._lock:
+                del self._flights[key]
+            flight.done.set()
+        return flight.result
+
+    def stats(self):
+        return {"calls": self.calls,
+                "coalesced": self.coalesced,
+                "in_flight": len(self._flights)}
+
+
+flights = SingleFlight()
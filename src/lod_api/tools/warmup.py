@@ -0,0 +1,206 @@
+""" Warmup of the api caches with the most popular requests
+
+    Successful GET requests of the cached endpoints (`endpoints` of the
+    `warmup` config section) are counted in a histogram of their path,
+    query string and `Accept` header. The histogram is merged into a
+    compact json file every `interval` seconds, older counts decay with
+    every merge so the histogram follows the current popularity. The
+    workers of a host merge into the same file, one at a time. The
+    access log of a former deployment (`seed_log`) seeds the histogram
+    if there is none yet.
+
+    When the api starts, the `top` most popular requests are replayed
+    against the app before it starts listening, for at most `budget`
+    seconds, thus the caches hold the hottest records, searches and
+    explore topic sets right away. The replay is repeated every
+    `interval` seconds to keep them cached.
+"""
+import collections
+import fcntl
+import json
+import os
+import re
+import tempfile
+import threading
+import time
+
+from lod_api.tools import generations
+from lod_api.tools.config_parser import get_config
+
+# defaults for the `warmup` config section
+defaults = {
+    "path": os.path.join(tempfile.gettempdir(), "lod-api-popularity.json"),
+    "top": 200,
+    "keep": 2000,
+    "decay": 0.9,
+    "interval": 600,
+    "budget": 60,
+    "seed_log": None,
+    "endpoints": ["RetrieveDoc", "searchDoc", "ESWrapper",
+                  "aggregateTopics", "correlateTopics"],
+}
+
+# header of the replayed requests, these are not counted
+WARMUP_HEADER = "X-Lod-Warmup"
+
+
+def option(name):
+    return get_config("warmup", {}).get(name, defaults[name])
+
+
+def request_key(path, query="", accept=""):
+    """ key of a request in the histogram """
+    target = path + ("?" + query if query else "")
+    return json.dumps([target, accept or ""])
+
+
+class Popularity:
+    """ Histogram of the requests, merged into the file `path` """
+
+    def __init__(self, path=None):
+        self._path = path
+        self._counts = collections.Counter()    # since the last merge
+        self._lock = threading.Lock()
+
+    @property
+    def path(self):
+        return self._path or option("path")
+
+    def record(self, path, query="", accept=""):
+        """ count a request. Requests of unique urls (e.g. of link
+            checkers) would grow the recent counts until the next merge,
+            thus they are trimmed to the `2 * keep` most popular requests
+            once they hold `4 * keep` requests. """
+        keep = option("keep")
+        with self._lock:
+            self._counts[request_key(path, query, accept)] += 1
+            if len(self._counts) > 4 * keep:
+                self._counts = collections.Counter(
+                    dict(self._counts.most_common(2 * keep)))
+
+    def load(self):
+        """ counts of the file, empty if there is none (yet) """
+        try:
+            with open(self.path) as f:
+                return collections.Counter(json.load(f))
+        except (OSError, ValueError):
+            return collections.Counter()
+
+    def save(self):
+        """ merge the recent counts into the file, the counts of the
+            file decay and only the `keep` most popular requests are
+            kept. The file is locked while it is merged, thus the
+            counts of other workers are not overwritten. """
+        with self._lock:
+            recent, self._counts = self._counts, collections.Counter()
+        directory = os.path.dirname(os.path.abspath(self.path))
+        with open(self.path + ".lock", "w") as lock:
+            fcntl.flock(lock, fcntl.LOCK_EX)
+            counts = self.load()
+            decay = option("decay")
+            for key in counts:
+                counts[key] *= decay
+            counts.update(recent)
+            counts = dict(counts.most_common(option("keep")))
+            fd, tmp = tempfile.mkstemp(dir=directory, prefix=".popularity")
+            with os.fdopen(fd, "w") as f:
+                json.dump({k: round(v, 3) for k, v in counts.items()}, f)
+            os.replace(tmp, self.path)
+
+    def top(self, n=None):
+        """ the `n` most popular requests as (path with query, accept) """
+        counts = self.load()
+        with self._lock:
+            counts.update(self._counts)
+        return [tuple(json.loads(key))
+                for key, _ in counts.most_common(n or option("top"))]
+
+
+popularity = Popularity()
+
+# request line of the common/combined log format
+LOG_LINE = re.compile(r'"GET (?P<target>\S+) HTTP/[\d.]+" (?P<status>\d{3}) ')
+
+
+def seed_from_log(logfile, pop=None):
+    """ count the successful GET requests of an access log `logfile`
+        (common or combined log format), returns their count """
+    pop = pop or popularity
+    count = 0
+    with open(logfile, errors="replace") as f:
+        for line in f:
+            match = LOG_LINE.search(line)
+            if match and match.group("status") == "200":
+                path, _, query = match.group("target").partition("?")
+                pop.record(path, query)
+                count += 1
+    return count
+
+
+def record(request, response, endpoint):
+    """ count `request` if it was answered successfully by one of the
+        cached endpoints """
+    if (request.method == "GET" and response.status_code == 200
+            and endpoint in option("endpoints")
+            and not request.headers.get(WARMUP_HEADER)):
+        popularity.record(request.path,
+                          request.query_string.decode("utf-8", "replace"),
+                          request.headers.get("Accept", ""))
+
+
+def warm(app, budget=None, pop=None):
+    """ replay the most popular requests against `app` for at most
+        `budget` seconds, returns the count of replayed requests """
+    pop = pop or popularity
+    budget = option("budget") if budget is None else budget
+    end = time.monotonic() + budget
+    client = app.test_client()
+    count = 0
+    for target, accept in pop.top():
+        if time.monotonic() >= end:
+            print("warmup: budget of {} seconds exhausted".format(budget))
+            break
+        headers = {WARMUP_HEADER: "1"}
+        if accept:
+            headers["Accept"] = accept
+        try:
+            client.get(target, headers=headers)
+            count += 1
+        except Exception as e:
+            print("warmup: {} failed: {}".format(target, e))
+    print("warmup: replayed {} requests".format(count))
+    return count
+
+
+def _run(app):
+    while option("interval") > 0:
+        time.sleep(option("interval"))
+        try:
+            popularity.save()
+        except OSError as e:
+            print("warmup: saving {} failed: {}".format(popularity.path, e))
+        warm(app)
+
+
+def start(app):
+    """ warm the caches of `app` before it serves requests and keep the
+        popular requests cached in a daemon thread """
+    if option("top") <= 0:
+        return
+    seed_log = option("seed_log")
+    if seed_log and not os.path.exists(popularity.path):
+        try:
+            print("warmup: seeded with {} requests of {}".format(
+                seed_from_log(seed_log), seed_log))
+            popularity.save()
+        except OSError as e:
+            print("warmup: seeding from {} failed: {}".format(seed_log, e))
+    # the entries are tagged with the generations of the indices, those
+    # stored before their first poll would be dropped by it
+    if not generations.tracker.wait_polled():
+        print("warmup: generations of the indices unknown, the warmed"
+              " entries are dropped with their first poll")
+    warm(app)
+    if option("interval") > 0:
+        threading.Thread(target=_run, args=(app,), daemon=True,
+                         name="warmup").start()
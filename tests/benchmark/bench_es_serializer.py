@@ -0,0 +1,59 @@
+""" Benchmark of the json serializers of the elasticsearch clients
+
+    Decodes and encodes a search response built out of the records in
+    `tests/data/ldj` with each installed serializer, e.g.
+        python tests/benchmark/bench_es_serializer.py --hits 10000
+"""
+import argparse
+import json
+import os
+import timeit
+
+from lod_api.tools import es_serializer
+
+ldj_dir = os.path.join(os.path.dirname(__file__), "..", "data", "ldj")
+
+
+def search_response(hits):
+    """ serialized search response with `hits` records out of tests/data/ldj """
+    records = []
+    for name in sorted(os.listdir(ldj_dir)):
+        with open(os.path.join(ldj_dir, name)) as f:
+            records.extend(json.loads(line) for line in f)
+    return json.dumps({
+        "took": 42,
+        "timed_out": False,
+        "hits": {
+            "total": {"value": hits, "relation": "eq"},
+            "max_score": 1.0,
+            "hits": [{"_index": "bench", "_id": str(i), "_score": 1.0,
+                      "_source": records[i % len(records)]}
+                     for i in range(hits)],
+        }
+    })
+
+
+def main():
+    p = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    p.add_argument("--hits", type=int, default=10000,
+                   help="count of hits in the search response")
+    p.add_argument("--repeat", type=int, default=5,
+                   help="best of the given number of runs")
+    args = p.parse_args()
+
+    raw = search_response(args.hits)
+    print("search response: {} hits, {:.1f} MB"
+          .format(args.hits, len(raw.encode("utf-8")) / 1e6))
+    for name in reversed(es_serializer.available()):
+        serializer = es_serializer.get_serializer(name)
+        data = serializer.loads(raw)
+        loads = min(timeit.repeat(lambda: serializer.loads(raw),
+                                  number=1, repeat=args.repeat))
+        dumps = min(timeit.repeat(lambda: serializer.dumps(data),
+                                  number=1, repeat=args.repeat))
+        print("{:8s} loads {:8.1f} ms   dumps {:8.1f} ms"
+              .format(name, loads * 1000, dumps * 1000))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,137 @@
+""" Benchmark of the json encoders of the api responses
+
+    Encodes the result of the explore `AggregationManager` and a search
+    response, both built out of the records in `tests/data/ldj`, with
+    `flask.jsonify` and each installed encoder as json, json lines and
+    JSONP, e.g.
+        python tests/benchmark/bench_json_encoder.py --hits 100
+"""
+import argparse
+import json
+import os
+import timeit
+
+import elasticsearch
+import flask
+
+import lod_api
+from lod_api.cli import read_config
+
+ldj_dir = os.path.join(os.path.dirname(__file__), "..", "data", "ldj")
+config = os.path.join(lod_api.__path__[0], "..", "..", "apiconfig.yml.example")
+
+
+def ldj_records(name=None):
+    records = []
+    for filename in sorted(os.listdir(ldj_dir)):
+        if name in (None, filename):
+            with open(os.path.join(ldj_dir, filename)) as f:
+                records.extend(json.loads(line) for line in f)
+    return records
+
+
+def search_payload(hits):
+    """ records of a search with `hits` hits """
+    records = ldj_records()
+    return [records[i % len(records)] for i in range(hits)]
+
+
+class Elasticmock:
+    """ answers the aggregation searches of the explore endpoints with
+        records of tests/data/ldj/resources and their mentions """
+    resources = []
+    hits = 20
+
+    def __init__(self, *args, **kwargs):
+        pass
+
+    def info(self):
+        return {"version": {"number": "7"}}
+
+    def _response(self, i):
+        hits = [self.resources[(i * self.hits + j) % len(self.resources)]
+                for j in range(self.hits)]
+        mentions = {}
+        for hit in hits:
+            for mention in hit.get("mentions", []):
+                if mention.get("@id"):
+                    mentions[mention["@id"]] = \
+                        mentions.get(mention["@id"], 0) + 1
+        return {
+            "timed_out": False,
+            "hits": {"total": {"value": 100 + i},
+                     "hits": [{"_score": 1.0 / (j + 1), "_source": hit}
+                              for j, hit in enumerate(hits)]},
+            "aggregations": {
+                "mentions": {"buckets": [
+                    {"key": k, "doc_count": v} for k, v in mentions.items()]},
+                "datePublished": {"buckets": [
+                    {"key_as_string": "{}-01-01".format(1900 + y),
+                     "doc_count": y} for y in range(100)]},
+            }}
+
+    def msearch(self, body, **kwargs):
+        count = body.strip().count("\n") // 2 + 1
+        return {"responses": [self._response(i) for i in range(count)]}
+
+
+def aggregation_payload(topics):
+    """ `AggregationManager.result` of the aggregation of `topics` """
+    from lod_api.apis import explore
+    from lod_api.tools.es_client import get_client
+    Elasticmock.resources = ldj_records("resources")
+    elasticsearch.Elasticsearch = Elasticmock
+    am = explore.AggregationManager(get_client(index="resources"), {
+        "topicMatch": (explore.topic_aggs_query_topicMatch,
+                       explore.topic_maggs_query_topicMatch),
+        "phraseMatch": (explore.topic_aggs_query_phraseMatch,
+                        explore.topic_maggs_query_phraseMatch)})
+    am.add_agg_subjects(["topic {}".format(i) for i in range(topics)])
+    am.run_aggs()
+    return am.result
+
+
+def main():
+    p = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    p.add_argument("--hits", type=int, default=100,
+                   help="count of hits in the search response")
+    p.add_argument("--topics", type=int, default=10,
+                   help="count of topics aggregated by explore")
+    p.add_argument("--number", type=int, default=100,
+                   help="encodings per run")
+    p.add_argument("--repeat", type=int, default=5,
+                   help="best of the given number of runs")
+    args = p.parse_args()
+
+    read_config(config)
+    from lod_api.tools import json_encoder
+    payloads = {
+        "aggregations": aggregation_payload(args.topics),
+        "search": search_payload(args.hits),
+    }
+    app = flask.Flask(__name__)
+
+    def best(fn):
+        return min(timeit.repeat(fn, number=args.number,
+                                 repeat=args.repeat)) / args.number
+
+    with app.test_request_context("/?callback=cb"):
+        for name, payload in payloads.items():
+            size = len(json.dumps(payload).encode("utf-8"))
+            print("{}: {:.1f} kB".format(name, size / 1e3))
+            items = payload if isinstance(payload, list) else [payload]
+            print("{:8s} json {:8.3f} ms".format(
+                "jsonify", best(lambda: flask.jsonify(payload)) * 1000))
+            for enc in reversed(json_encoder.available()):
+                encoder = json_encoder.get_encoder(enc)
+                lod_api.CONFIG.conf["json_encoder"] = enc
+                dumps = best(lambda: encoder.dumps(payload))
+                lines = best(lambda: [encoder.line(i) for i in items])
+                jsonp = best(lambda: json_encoder.jsonpify(payload))
+                print("{:8s} json {:8.3f} ms   jsonl {:8.3f} ms   "
+                      "jsonp {:8.3f} ms".format(enc, dumps * 1000,
+                                                lines * 1000, jsonp * 1000))
+
+
+if __name__ == "__main__":
+    main()
@@ -56,6 +56,31 @@ def apiconfig():
     """ get configuration of the LOD-API, can be used in all tests """
     return lod_api.CONFIG
 
+@pytest.fixture(autouse=True)
+def es_client_registry():
+    """ start every test with an empty registry of elasticsearch
+        clients, thus mocked clients are not shared between tests """
+    from lod_api.tools.es_client import registry
+    registry.clear()
+    yield registry
+    registry.clear()
+
+@pytest.fixture(autouse=True)
+def api_caches():
+    """ start every test with empty caches """
+    from lod_api.tools import cache
+    cache.clear_all()
+    yield cache
+    cache.clear_all()
+
+@pytest.fixture(autouse=True)
+def index_generations(monkeypatch):
+    """ do not poll the generations of the indices, the cache entries
+        are keyed by the index names only """
+    if lod_api.CONFIG is not None:
+        monkeypatch.setitem(lod_api.CONFIG.conf, "index_generations",
+                            {"interval": 0})
+
 @pytest.fixture
 def app():
     from lod_api.flask_api import app
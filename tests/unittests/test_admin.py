@@ -0,0 +1,85 @@
+import pytest
+from lod_api.tools import cache
+from lod_api.tools import generations
+from lod_api.tools import resilience
+from lod_api.tools import singleflight
+from lod_api.tools.helper import ES_wrapper
+
+
+@pytest.fixture
+def admin_token(apiconfig, monkeypatch):
+    monkeypatch.setitem(apiconfig.conf, "admin", {"token": "secret"})
+    return {"Authorization": "Bearer secret"}
+
+
+@pytest.mark.unit
+def test_admin_protected(client, apiconfig, monkeypatch):
+    # without configured token
+    assert client.get("/admin/caches").status_code == 403
+    monkeypatch.setitem(apiconfig.conf, "admin", {"token": "secret"})
+    assert client.get("/admin/caches").status_code == 403
+    assert client.delete("/admin/caches", headers={
+        "Authorization": "Bearer wrong"}).status_code == 403
+
+
+@pytest.mark.unit
+def test_admin_cache_stats(client, admin_token):
+    cache.doc_cache.set("persons/1/json", {"body": b"{}"})
+    cache.doc_cache.get("persons/1/json")
+    cache.doc_cache.get("persons/2/json")
+
+    response = client.get("/admin/caches", headers=admin_token)
+    assert response.status_code == 200
+    stats = response.json["caches"]["doc_cache"]
+    assert stats["entries"] == 1 and stats["bytes"] > 0
+    assert stats["hits"] >= 1 and stats["misses"] >= 1
+    assert stats["ages"]["<10s"] == 1
+    assert set(response.json["caches"]) >= {"doc_cache", "search_cache",
+                                            "explore_cache"}
+    assert response.json["singleflight"] == singleflight.flights.stats()
+    assert response.json["version_probes"] == ES_wrapper.info_calls
+
+
+@pytest.mark.unit
+def test_admin_breaker_state(client, admin_token, monkeypatch):
+    monkeypatch.setattr(resilience, "breakers", resilience.BreakerRegistry())
+    resilience.breakers.get("persons").record_failure()
+    response = client.get("/admin/caches", headers=admin_token)
+    assert response.json["breakers"] == {
+        "persons": {"state": "closed", "failures": 1, "trips": 0}}
+
+
+@pytest.mark.unit
+def test_admin_flush(client, admin_token):
+    persons = generations.tags("persons")
+    geo = generations.tags("geo")
+    cache.doc_cache.set("persons/1/json", {"body": b"{}"}, tags=persons)
+    cache.doc_cache.set("geo/1/json", {"body": b"{}"}, tags=geo)
+    cache.search_cache.set("persons,geo", [], tags=persons + geo)
+
+    response = client.delete("/admin/caches?index=persons",
+                             headers=admin_token)
+    assert response.status_code == 200
+    assert response.json["dropped"] == 2
+    assert cache.doc_cache.get("geo/1/json") is not None
+
+    assert client.delete("/admin/caches?cache=nocache",
+                         headers=admin_token).status_code == 404
+    response = client.delete("/admin/caches?cache=doc_cache",
+                             headers=admin_token)
+    assert response.json["cleared"] == ["doc_cache"]
+    assert len(cache.doc_cache) == 0
+
+
+@pytest.mark.unit
+def test_admin_flush_index_of_caches(client, admin_token):
+    persons = generations.tags("persons")
+    cache.doc_cache.set("persons/1/json", {"body": b"{}"}, tags=persons)
+    cache.search_cache.set("persons", [], tags=persons)
+
+    response = client.delete("/admin/caches?index=persons&cache=search_cache",
+                             headers=admin_token)
+    assert response.status_code == 200
+    assert response.json["dropped"] == 1
+    assert cache.search_cache.get("persons") is None
+    assert cache.doc_cache.get("persons/1/json") is not None
@@ -0,0 +1,169 @@
+import time
+import pytest
+import elasticsearch
+from lod_api.tools import cache
+from lod_api.tools import cache_backends
+from lod_api.tools import resilience
+
+
+@pytest.fixture(autouse=True)
+def local_caches(monkeypatch):
+    """ do not register the caches of the tests """
+    monkeypatch.setattr(cache, "caches", dict(cache.caches))
+
+
+@pytest.mark.unit
+@pytest.mark.helper
+def test_lru_cache_bounds():
+    lru = cache.Cache("test_lru", maxsize=2, max_bytes=10000, ttl=60,
+                      backend=cache_backends.MemoryBackend())
+    lru.set("a", 1)
+    lru.set("b", 2)
+    assert lru.get("a") == 1
+    lru.set("c", 3)
+    # "b" was used least recently
+    assert lru.get("b") is None
+    assert lru.get("a") == 1 and lru.get("c") == 3
+    assert lru.stats()["evictions"] == 1
+
+    lru = cache.Cache("test_lru", maxsize=100, max_bytes=300, ttl=60,
+                      backend=cache_backends.MemoryBackend())
+    lru.set("big", b"x" * 1000)
+    assert lru.get("big") is None
+    for i in range(10):
+        lru.set(i, b"x" * 50)
+    assert lru.stats()["bytes"] <= 300
+    assert lru.get(9) is not None and lru.get(0) is None
+
+
+@pytest.mark.unit
+@pytest.mark.helper
+def test_lru_cache_ttl():
+    lru = cache.Cache("test_lru", maxsize=10, max_bytes=10000, ttl=0.01,
+                      backend=cache_backends.MemoryBackend())
+    lru.set("a", 1)
+    lru.set("b", 2, ttl=60)
+    time.sleep(0.02)
+    assert lru.get("a") is None
+    assert lru.get("b") == 2
+    assert len(lru) == 1
+
+
+@pytest.mark.unit
+@pytest.mark.helper
+def test_etag():
+    doc = {"_index": "persons-1", "_id": "118695940",
+           "_seq_no": 3, "_primary_term": 1}
+    assert cache.etag(doc, "json") == cache.etag(dict(doc), "json")
+    assert cache.etag(doc, "json") != cache.etag(doc, "nt")
+    assert cache.etag(doc, "json") != cache.etag(dict(doc, _seq_no=4), "json")
+    assert cache.etag(doc, "json") != cache.etag(
+        dict(doc, _index="persons-2"), "json")
+
+
+class Elasticmock:
+    gets = 0
+
+    def __init__(self, *args, **kwargs):
+        pass
+
+    def info(self):
+        return {"version": {"number": [7]}}
+
+    def get(self, **kwargs):
+        Elasticmock.gets += 1
+        return {"_index": kwargs["index"], "_id": kwargs["id"],
+                "_seq_no": 7, "_primary_term": 1, "found": True,
+                "_source": {"@id": "https://data.slub-dresden.de/persons/"
+                                   + kwargs["id"],
+                            "preferredName": "Person"}}
+
+
+@pytest.mark.unit
+@pytest.mark.api_search
+def test_retrieve_doc_cached(client, apiconfig, monkeypatch):
+    monkeypatch.setattr(elasticsearch, "Elasticsearch", Elasticmock)
+    # compress the small test record
+    monkeypatch.setitem(apiconfig.conf, "compression", {"min_size": 0})
+    monkeypatch.setattr(Elasticmock, "gets", 0)
+
+    response = client.get("/persons/118695940")
+    assert response.status_code == 200
+    assert response.json[0]["preferredName"] == "Person"
+    etag = response.headers["ETag"]
+    assert etag.startswith('W/"')
+
+    response = client.get("/persons/118695940",
+                          headers={"If-None-Match": etag})
+    assert response.status_code == 304
+    assert response.data == b""
+
+    response = client.get("/persons/118695940",
+                          headers={"Accept-Encoding": "gzip"})
+    assert response.status_code == 200
+    assert response.headers["Content-Encoding"] == "gzip"
+    assert response.headers["ETag"] == etag
+    assert Elasticmock.gets == 1
+
+    response = client.get("/persons/118695940?format=jsonl")
+    assert response.status_code == 200
+    assert response.headers["ETag"] != etag
+    assert Elasticmock.gets == 2
+
+
+@pytest.mark.unit
+@pytest.mark.helper
+def test_stale_if_error(app):
+    sie = cache.Cache("test_sie", maxsize=10, max_bytes=10000, ttl=0.01,
+                      stale_if_error=60, backend=cache_backends.MemoryBackend())
+
+    def unavailable():
+        raise resilience.CircuitOpenError("resources", 30)
+
+    def bad_request():
+        raise ValueError("bad request")
+
+    assert sie.fetch("a", lambda: {"count": 1}) == {"count": 1}
+    time.sleep(0.02)
+    with app.test_request_context("/"):
+        # expired, but elasticsearch is unavailable
+        assert sie.fetch("a", unavailable) == {"count": 1}
+        assert resilience.is_stale()
+        assert sie.stale == 1
+        with pytest.raises(ValueError):
+            sie.fetch("a", bad_request)
+    assert sie.fetch("a", lambda: {"count": 2}) == {"count": 2}
+    with pytest.raises(resilience.CircuitOpenError):
+        sie.fetch("b", unavailable)
+
+
+@pytest.mark.unit
+@pytest.mark.helper
+def test_stale_while_revalidate():
+    swr = cache.Cache("test_swr", maxsize=10, max_bytes=10000, ttl=0.05,
+                      stale=60, backend=cache_backends.MemoryBackend())
+    computed = []
+
+    def compute():
+        computed.append(1)
+        time.sleep(0.05)
+        return {"count": len(computed)}
+
+    assert swr.fetch("a", compute) == {"count": 1}
+    assert swr.fetch("a", compute) == {"count": 1}
+    time.sleep(0.06)
+    # outdated: served at once, refreshed once in the background
+    assert swr.fetch("a", compute) == {"count": 1}
+    assert swr.fetch("a", compute) == {"count": 1}
+    assert swr.stale == 2
+    for _ in range(50):
+        if not cache.refresher.stats()["pending"]:
+            break
+        time.sleep(0.02)
+    assert len(computed) == 2
+    assert swr.fetch("a", compute) == {"count": 2}
+
+    # partial results are not cached
+    assert swr.fetch("b", lambda: {"partial": True},
+                     cacheable=lambda r: not r.get("partial"))
+    assert swr.get("b") is None
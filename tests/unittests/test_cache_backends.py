@@ -0,0 +1,235 @@
+import socketserver
+import threading
+import time
+import pytest
+from lod_api.tools import cache
+from lod_api.tools import cache_backends
+
+value = {"body": b"<x> <y> <z> .\n", "hits": [{"@id": "1", "name": "Dresden"}]}
+
+
+class RespStandin(socketserver.ThreadingTCPServer):
+    """ local stand-in of a redis server with the commands used by the
+        redis backend """
+    allow_reuse_address = True
+    daemon_threads = True
+
+    def __init__(self):
+        self.data = {}          # key → (value, expires)
+        super().__init__(("127.0.0.1", 0), RespHandler)
+
+
+class RespHandler(socketserver.StreamRequestHandler):
+    def read_command(self):
+        line = self.rfile.readline()
+        if not line:
+            return None
+        args = []
+        for _ in range(int(line[1:])):
+            length = int(self.rfile.readline()[1:])
+            args.append(self.rfile.read(length + 2)[:-2])
+        return args
+
+    def bulk(self, value):
+        if value is None:
+            return b"$-1\r\n"
+        return b"$%d\r\n%s\r\n" % (len(value), value)
+
+    def handle(self):
+        data = self.server.data
+        while True:
+            args = self.read_command()
+            if args is None:
+                return
+            cmd = args[0].upper()
+            now = time.time()
+            if cmd == b"SET":
+                expires = now + int(args[4]) / 1000 if len(args) > 4 else None
+                data[args[1]] = (args[2], expires)
+                reply = b"+OK\r\n"
+            elif cmd == b"GET":
+                entry = data.get(args[1])
+                if entry and entry[1] is not None and entry[1] < now:
+                    entry = None
+                reply = self.bulk(entry[0] if entry else None)
+            elif cmd == b"DEL":
+                count = sum(data.pop(k, None) is not None for k in args[1:])
+                reply = b":%d\r\n" % count
+            elif cmd == b"SCAN":
+                prefix = args[3].rstrip(b"*")
+                keys = [k for k in data if k.startswith(prefix)]
+                reply = b"*2\r\n" + self.bulk(b"0") + b"*%d\r\n" % len(keys) \
+                    + b"".join(self.bulk(k) for k in keys)
+            elif cmd == b"SADD":
+                members = data.get(args[1], (set(), None))[0]
+                members.update(args[2:])
+                data[args[1]] = (members, None)
+                reply = b":%d\r\n" % (len(args) - 2)
+            elif cmd == b"SMEMBERS":
+                members = data.get(args[1], (set(), None))[0]
+                reply = b"*%d\r\n" % len(members) \
+                    + b"".join(self.bulk(m) for m in members)
+            elif cmd == b"PEXPIRE":
+                if args[1] in data:
+                    data[args[1]] = (data[args[1]][0], now + int(args[2]) / 1000)
+                reply = b":1\r\n"
+            elif cmd == b"SELECT":
+                reply = b"+OK\r\n"
+            else:
+                reply = b"-ERR unknown command\r\n"
+            self.wfile.write(reply)
+
+
+@pytest.fixture(autouse=True)
+def local_caches(monkeypatch):
+    """ do not register the caches of the tests """
+    monkeypatch.setattr(cache, "caches", dict(cache.caches))
+
+
+@pytest.fixture
+def resp_server():
+    server = RespStandin()
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    yield server
+    server.shutdown()
+    server.server_close()
+
+
+@pytest.mark.unit
+@pytest.mark.helper
+def test_codec():
+    assert cache_backends.decode(cache_backends.encode(value)) == value
+
+
+@pytest.mark.unit
+@pytest.mark.helper
+def test_sqlite_backend_shared(tmp_path):
+    path = str(tmp_path / "cache.sqlite")
+    # two workers with a backend each share the same file
+    worker1 = cache.Cache("test_shared", maxsize=3, max_bytes=10000, ttl=60,
+                          backend=cache_backends.SqliteBackend(path))
+    worker2 = cache.Cache("test_shared", maxsize=3, max_bytes=10000, ttl=60,
+                          backend=cache_backends.SqliteBackend(path))
+    worker1.set("a", value)
+    assert worker2.get("a") == value
+
+    for key in ("b", "c", "d"):
+        time.sleep(0.001)
+        worker2.set(key, {"key": key})
+    # "a" was accessed least recently
+    assert worker1.get("a") is None
+    assert worker1.get("d") == {"key": "d"}
+    assert worker1.stats()["entries"] == 3
+    assert worker2.evictions == 1
+
+    worker1.set("e", {"key": "e"}, ttl=-1)
+    assert worker2.get("e") is None
+    worker1.clear()
+    assert len(worker2) == 0
+
+
+@pytest.mark.unit
+@pytest.mark.helper
+def test_sqlite_backend_totals(tmp_path, monkeypatch):
+    backend = cache_backends.SqliteBackend(str(tmp_path / "cache.sqlite"))
+    backend.set("test_totals", "a", "old", 60, 10, 10000)
+    old = len(cache_backends.encode("old"))
+    assert backend.stats("test_totals") == {"entries": 1, "bytes": old}
+    backend.set("test_totals", "b", value, 60, 10, 10000)
+    backend.set("test_totals", "b", {"key": "b"}, 60, 10, 10000)
+    size = len(cache_backends.encode({"key": "b"}))
+    assert backend.stats("test_totals") == {"entries": 2, "bytes": old + size}
+    backend.delete("test_totals", "a")
+    assert backend.stats("test_totals") == {"entries": 1, "bytes": size}
+    backend.clear("test_totals")
+    assert backend.stats("test_totals") == {"entries": 0, "bytes": 0}
+
+    # reads mark the entries as accessed at most every `touch` seconds
+    backend.set("test_totals", "c", value, 60, 10, 10000)
+    accessed = "SELECT accessed FROM entries WHERE key = 'c'"
+    stored = backend._connection().execute(accessed).fetchone()[0]
+    assert backend.get("test_totals", "c") == value
+    assert backend._connection().execute(accessed).fetchone()[0] == stored
+    monkeypatch.setattr(backend, "touch", -1)
+    time.sleep(0.001)
+    assert backend.get("test_totals", "c") == value
+    assert backend._connection().execute(accessed).fetchone()[0] > stored
+
+
+@pytest.mark.unit
+@pytest.mark.helper
+def test_redis_backend(resp_server):
+    url = "redis://127.0.0.1:{}/0".format(resp_server.server_address[1])
+    redis = cache.Cache("test_redis", maxsize=10, max_bytes=10000, ttl=60,
+                        backend=cache_backends.RedisBackend(url))
+    redis.set("a", value)
+    assert redis.get("a") == value
+    assert redis.get("b") is None
+    redis.set("b", {"key": "b"}, ttl=0.001)
+    time.sleep(0.01)
+    assert redis.get("b") is None
+    assert redis.stats()["entries"] == 2
+    redis.delete("a")
+    assert redis.get("a") is None
+    redis.clear()
+    assert resp_server.data == {}
+
+
+@pytest.mark.unit
+@pytest.mark.helper
+def test_backend_unavailable(resp_server):
+    url = "redis://127.0.0.1:{}/0".format(resp_server.server_address[1])
+    backend = cache_backends.RedisBackend(url)
+    redis = cache.Cache("test_redis", maxsize=10, max_bytes=10000, ttl=60,
+                        backend=backend)
+    redis.set("a", value)
+    resp_server.shutdown()
+    resp_server.server_close()
+    backend.client.port = 1         # nothing listens there
+    backend.client._local.sock = None
+    # requests are answered without the cache
+    redis.set("a", value)
+    assert redis.get("a") is None
+    assert redis.errors == 2
+
+
+@pytest.mark.unit
+@pytest.mark.helper
+def test_configured_backend(apiconfig, monkeypatch, tmp_path):
+    monkeypatch.setitem(apiconfig.conf, "cache_backend",
+                        {"type": "sqlite",
+                         "path": str(tmp_path / "cache.sqlite")})
+    # the backend of the config is restored afterwards
+    monkeypatch.setattr(cache, "_backend", None)
+    assert cache.doc_cache.stats()["backend"] == "sqlite"
+    cache.doc_cache.set("persons/1/json", value)
+    assert cache.doc_cache.get("persons/1/json") == value
+
+
+@pytest.mark.unit
+@pytest.mark.helper
+@pytest.mark.parametrize("kind", ["memory", "sqlite", "redis"])
+def test_invalidate_tag(kind, resp_server, tmp_path):
+    if kind == "sqlite":
+        backend = cache_backends.SqliteBackend(str(tmp_path / "c.sqlite"))
+    elif kind == "redis":
+        backend = cache_backends.RedisBackend(
+            "redis://127.0.0.1:{}/0".format(resp_server.server_address[1]))
+    else:
+        backend = cache_backends.MemoryBackend()
+    tagged = cache.Cache("test_tags", maxsize=10, max_bytes=10000, ttl=60,
+                         backend=backend)
+    tagged.set("persons@1/a", value, tags=["persons@1"])
+    tagged.set("persons@1,geo@1/b", value, tags=["persons@1", "geo@1"])
+    tagged.set("geo@1/c", value, tags=["geo@1"])
+    tagged.set("persons@10/d", value, tags=["persons@10"])
+    assert tagged.invalidate("persons@1") == 2
+    assert tagged.get("persons@1/a") is None
+    assert tagged.get("persons@1,geo@1/b") is None
+    assert tagged.get("geo@1/c") == value
+    assert tagged.get("persons@10/d") == value
+    assert tagged.stats()["entries"] == 2
+    tagged.clear()
+    if kind == "redis":
+        assert resp_server.data == {}
@@ -0,0 +1,72 @@
+import json
+import time
+import pytest
+import elasticsearch
+from lod_api.tools import deadline
+
+
+class Elasticmock:
+    def __init__(self, *args, **kwargs):
+        pass
+
+    def info(self):
+        return {"version": {"number": [7]}}
+
+    def get(self, **kwargs):
+        raise elasticsearch.NotFoundError(404, "not found", {})
+
+
+@pytest.mark.unit
+@pytest.mark.helper
+def test_budget_per_endpoint(apiconfig, monkeypatch):
+    monkeypatch.setitem(apiconfig.conf, "es_deadlines",
+                        {"default": 5, "endpoints": {"RetrieveDoc": 1}})
+    assert deadline.budget("RetrieveDoc") == 1
+    assert deadline.budget("searchDoc") == 5
+    assert deadline.budget() == 5
+
+
+@pytest.mark.unit
+@pytest.mark.helper
+def test_apply_remaining_time(app):
+    kwargs = {"index": "resources", "body": {"size": 0}}
+    # no deadline outside of requests
+    assert deadline.remaining() is None
+    assert deadline.apply("search", kwargs) == kwargs
+    deadline.check()
+
+    with app.test_request_context():
+        deadline.start(seconds=2)
+        search = deadline.apply("search", kwargs)
+        assert 1.5 < search["request_timeout"] <= 2
+        assert search["timeout"] == "1s"
+        get = deadline.apply("get", {"index": "resources", "id": "1"})
+        assert "timeout" not in get and "request_timeout" in get
+
+        msearch = deadline.apply("msearch", {"body": '{}\n{"size": 0}\n'})
+        header, query = msearch["body"].split("\n")
+        assert json.loads(header) == {}
+        assert json.loads(query) == {"size": 0, "timeout": "1s"}
+
+        deadline.start(seconds=0.5)
+        assert deadline.apply("search", kwargs)["timeout"] == "300ms"
+
+        deadline.start(seconds=0)
+        time.sleep(0.001)
+        with pytest.raises(deadline.DeadlineExceeded):
+            deadline.check()
+
+
+@pytest.mark.unit
+@pytest.mark.helper
+def test_request_deadline(app, apiconfig, monkeypatch):
+    monkeypatch.setitem(apiconfig.conf, "es_deadlines",
+                        {"endpoints": {"RetrieveDoc": 1.5}})
+    monkeypatch.setattr(elasticsearch, "Elasticsearch", Elasticmock)
+    budgets = []
+    monkeypatch.setattr(deadline, "start",
+                        lambda endpoint: budgets.append(
+                            deadline.budget(endpoint)))
+    with app.test_client() as client:
+        client.get("/resources/123")
+    assert budgets == [1.5]
@@ -0,0 +1,75 @@
+import contextvars
+import threading
+import time
+import pytest
+from lod_api.tools import es_async
+
+
+class Elasticmock:
+    "fakes a slow elasticsearch and tracks concurrent requests"
+    def __init__(self):
+        self.running = 0
+        self.max_running = 0
+        self.lock = threading.Lock()
+
+    def info(self):
+        return {"version": {"number": [7]}}
+
+    def search(self, index, body=None):
+        with self.lock:
+            self.running += 1
+            self.max_running = max(self.running, self.max_running)
+        time.sleep(0.05)
+        with self.lock:
+            self.running -= 1
+        if body == "fail":
+            raise ValueError("search failed")
+        return {"index": index, "body": body}
+
+
+@pytest.mark.unit
+@pytest.mark.helper
+def test_run_calls_concurrent():
+    es = Elasticmock()
+    calls = [es_async.es_call(es, "search", index="resources", body=i)
+             for i in range(4)]
+    start = time.monotonic()
+    res = es_async.run_calls(calls, limit=4)
+    # ran concurrently instead of one after another
+    assert time.monotonic() - start < 0.15
+    assert es.max_running > 1
+    # results in order of the calls
+    assert [r["body"] for r in res] == [0, 1, 2, 3]
+
+
+@pytest.mark.unit
+@pytest.mark.helper
+def test_run_calls_limit():
+    es = Elasticmock()
+    calls = [es_async.es_call(es, "search", index="resources", body=i)
+             for i in range(6)]
+    es_async.run_calls(calls, limit=2)
+    assert es.max_running <= 2
+
+
+@pytest.mark.unit
+@pytest.mark.helper
+def test_run_calls_exceptions():
+    es = Elasticmock()
+    calls = [es_async.es_call(es, "search", index="resources", body="fail"),
+             es_async.es_call(es, "search", index="resources", body=1)]
+    res = es_async.run_calls(calls, return_exceptions=True)
+    assert isinstance(res[0], ValueError)
+    assert res[1]["body"] == 1
+    with pytest.raises(ValueError):
+        es_async.run_calls(calls)
+    assert es_async.run_calls([]) == []
+
+
+@pytest.mark.unit
+@pytest.mark.helper
+def test_run_calls_context():
+    var = contextvars.ContextVar("var", default=None)
+    var.set("request")
+    res = es_async.run_calls([var.get, var.get])
+    assert res == ["request", "request"]
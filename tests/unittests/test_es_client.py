@@ -0,0 +1,173 @@
+import os
+import time
+import pytest
+import elasticsearch
+from lod_api.tools import es_client
+
+
+class Elasticmock:
+    def __init__(self, *args, **kwargs):
+        self.args = args
+        self.kwargs = kwargs
+
+
+@pytest.mark.unit
+@pytest.mark.helper
+def test_registry_shares_clients(monkeypatch):
+    monkeypatch.setattr(elasticsearch, "Elasticsearch", Elasticmock)
+    registry = es_client.ClientRegistry()
+
+    client = registry.get("localhost")
+    assert registry.get("localhost") is client
+    assert registry.get("otherhost") is not client
+    assert registry.get("localhost", timeout=2) is not client
+    assert len(registry) == 3
+
+
+@pytest.mark.unit
+@pytest.mark.helper
+def test_registry_client_options(apiconfig, monkeypatch):
+    monkeypatch.setattr(elasticsearch, "Elasticsearch", Elasticmock)
+    monkeypatch.setitem(apiconfig.conf, "es_client",
+                        {"maxsize": 42, "keep_alive": False})
+    registry = es_client.ClientRegistry()
+
+    client = registry.get()
+    assert client.args == (apiconfig.get("es_host"),)
+    assert client.kwargs["maxsize"] == 42
+    assert client.kwargs["timeout"] == 10
+    assert client.kwargs["headers"] == {"Connection": "close"}
+    assert "keep_alive" not in client.kwargs
+    assert "sniffer_timeout" not in client.kwargs
+
+
+@pytest.mark.unit
+@pytest.mark.helper
+def test_registry_after_fork(monkeypatch):
+    monkeypatch.setattr(elasticsearch, "Elasticsearch", Elasticmock)
+    registry = es_client.ClientRegistry()
+
+    client = registry.get("localhost")
+    # pretend to be a forked child process
+    monkeypatch.setattr(os, "getpid", lambda: registry._pid + 1)
+    assert registry.get("localhost") is not client
+
+
+@pytest.mark.unit
+@pytest.mark.helper
+def test_pooled_client_attribute(monkeypatch):
+    monkeypatch.setattr(elasticsearch, "Elasticsearch", Elasticmock)
+
+    class Resource:
+        es = es_client.PooledClient("localhost")
+
+    assert Resource().es is Resource.es
+    assert Resource.es is es_client.get_client("localhost")
+
+
+@pytest.mark.unit
+@pytest.mark.helper
+def test_registry_routing(apiconfig, monkeypatch):
+    monkeypatch.setattr(elasticsearch, "Elasticsearch", Elasticmock)
+    monkeypatch.setitem(apiconfig.conf, "es_clusters",
+                        {"replicas": ["replica1", "replica2"]})
+    monkeypatch.setitem(apiconfig.conf, "es_routing",
+                        {"resources": "replicas", "persons": "replicas"})
+    registry = es_client.ClientRegistry()
+
+    default = registry.get()
+    assert registry.route(default, "persons") is registry.get(index="persons")
+    assert registry.route(default, "resources,persons").args == (
+        ["replica1", "replica2"],)
+    assert registry.route(default, "resources,geo") is default
+    assert registry.route(default, "geo") is default
+    client = registry.route(default, "persons")
+    assert client.kwargs["selector_class"] is es_client.LatencySelector
+    # clients not created by the registry are not routed
+    assert registry.route(Elasticmock(), "persons").args == ()
+
+
+class Connection:
+    def __init__(self, latency, inflight=0):
+        self.latency = latency
+        self.inflight = inflight
+
+
+@pytest.mark.unit
+@pytest.mark.helper
+def test_latency_selector(monkeypatch):
+    selector = es_client.LatencySelector({})
+    monkeypatch.setattr(selector, "exploration", 0)
+
+    fast, slow, new = Connection(0.01), Connection(0.1), Connection(None)
+    assert selector.select([fast, slow, new]) is new
+    assert selector.select([fast, slow]) is fast
+    busy = Connection(0.01, inflight=20)
+    assert selector.select([busy, slow]) is slow
+    # hedged requests avoid the connection of the request they hedge
+    token = es_client._avoid.set((fast,))
+    try:
+        assert selector.select([fast, slow]) is slow
+        assert selector.select([fast]) is fast
+    finally:
+        es_client._avoid.reset(token)
+
+
+class Transport:
+    hosts = [{"host": "replica1"}, {"host": "replica2"}]
+
+
+class Client:
+    transport = Transport()
+
+
+@pytest.mark.unit
+@pytest.mark.helper
+def test_hedged_reads(apiconfig, monkeypatch):
+    import threading
+    monkeypatch.setitem(apiconfig.conf, "es_hedging",
+                        {"enabled": True, "percentile": 50, "min_delay": 0.01})
+    hedger = es_client.Hedger()
+    hedger.call(Client(), "get", lambda: "warm up")
+    assert hedger.delay("get") == 0.01
+
+    # the first request hangs, the hedged second request answers
+    release = threading.Event()
+    calls = []
+
+    def read():
+        calls.append(1)
+        if len(calls) == 1:
+            release.wait(5)
+            return "slow"
+        return "fast"
+
+    assert hedger.call(Client(), "get", read) == "fast"
+    assert hedger.hedged == 1
+    assert not hedger._hedging
+    release.set()
+
+    # no second request while one is pending
+    hedger._hedging = True
+    assert hedger.call(Client(), "get",
+                       lambda: time.sleep(0.1) or "slow") == "slow"
+    assert hedger.hedged == 1
+    hedger._hedging = False
+
+    # fast answers are not hedged
+    assert hedger.call(Client(), "get", lambda: "direct") == "direct"
+    assert hedger.hedged == 1
+
+
+@pytest.mark.unit
+@pytest.mark.helper
+def test_hedging_disabled(apiconfig, monkeypatch):
+    monkeypatch.setitem(apiconfig.conf, "es_hedging", {"enabled": False})
+    hedger = es_client.Hedger()
+    hedger.call(Client(), "get", lambda: None)
+
+    def delay(action):
+        raise AssertionError("percentile computed")
+    monkeypatch.setattr(hedger, "delay", delay)
+    assert hedger.call(Client(), "get", lambda: "direct") == "direct"
+    assert hedger.hedged == 0
@@ -0,0 +1,66 @@
+import json
+import pytest
+from lod_api.tools import es_query
+
+
+agg_query = {"size": 0,
+             "query": {"match": {"name": "Dresden"}},
+             "aggs": {"genres": {"terms": {"size": 20,
+                                           "field": "genre.keyword"}}}}
+
+
+@pytest.mark.unit
+@pytest.mark.helper
+def test_search_normalized():
+    reordered = {"aggs": {"genres": {"terms": {"field": "genre.keyword",
+                                               "size": 20}}},
+                 "query": {"match": {"name": "Dresden"}},
+                 "size": 0}
+    kwargs1 = es_query.normalize("search", {"index": "resources",
+                                            "body": agg_query})
+    kwargs2 = es_query.normalize("search", {"index": "resources",
+                                            "body": reordered})
+    assert json.dumps(kwargs1["body"]) == json.dumps(kwargs2["body"])
+    assert kwargs1["request_cache"] is True
+    # outside of a request there is no session
+    assert "preference" not in kwargs1
+
+    hits_query = dict(agg_query, size=10)
+    kwargs = es_query.normalize("search", {"body": hits_query})
+    assert "request_cache" not in kwargs
+    kwargs = es_query.normalize("search", {"body": hits_query, "size": 0})
+    assert kwargs["request_cache"] is True
+    kwargs = es_query.normalize("search", {"body": agg_query, "scroll": "1s"})
+    assert "request_cache" not in kwargs
+
+    kwargs = {"index": "resources", "id": "1"}
+    assert es_query.normalize("get", kwargs) == kwargs
+
+
+@pytest.mark.unit
+@pytest.mark.helper
+def test_msearch_normalized():
+    body = '{}\n{"query": {"match_all": {}}, "size": 10}\n{}\n' \
+           + json.dumps(agg_query)
+    lines = es_query.normalize("msearch", {"body": body})["body"].split("\n")
+    assert lines[0] == "{}"
+    assert lines[1] == '{"query":{"match_all":{}},"size":10}'
+    assert json.loads(lines[2]) == {"request_cache": True}
+    assert json.loads(lines[3]) == agg_query
+
+
+@pytest.mark.unit
+@pytest.mark.helper
+def test_session_preference(app):
+    with app.test_request_context(headers={"X-Session-Id": "abc"}):
+        preference = es_query.session_preference()
+        kwargs = es_query.normalize("msearch", {"body": '{}\n{"size": 1}'})
+    assert preference.startswith("lod-")
+    assert json.loads(kwargs["body"].split("\n")[0]) == {
+        "preference": preference}
+    with app.test_request_context(headers={"X-Session-Id": "abc"}):
+        assert es_query.session_preference() == preference
+    with app.test_request_context(headers={"X-Session-Id": "xyz"}):
+        assert es_query.session_preference() != preference
+    with app.test_request_context(headers={"User-Agent": "OpenRefine"}):
+        assert es_query.session_preference() != preference
@@ -0,0 +1,66 @@
+import json
+import os
+import pytest
+import elasticsearch
+from lod_api.tools import es_client
+from lod_api.tools import es_serializer
+
+ldj_dir = os.path.join(os.path.dirname(__file__), "..", "data", "ldj")
+
+
+def ldj_records():
+    for name in sorted(os.listdir(ldj_dir)):
+        with open(os.path.join(ldj_dir, name)) as f:
+            for line in f:
+                yield line
+
+
+@pytest.mark.unit
+@pytest.mark.helper
+@pytest.mark.skipif(es_serializer.orjson is None, reason="orjson not installed")
+def test_orjson_serializer_matches_stdlib():
+    fast = es_serializer.get_serializer("orjson")
+    std = es_serializer.get_serializer("json")
+    assert isinstance(fast, es_serializer.OrjsonSerializer)
+    for line in ldj_records():
+        record = std.loads(line)
+        assert fast.loads(line) == record
+        assert json.loads(fast.dumps(record)) == record
+        assert fast.dumps_canonical(record) == std.dumps_canonical(record) \
+            or json.loads(fast.dumps_canonical(record)) == record
+
+    # data orjson refuses is serialized by the stdlib
+    assert fast.loads("[18446744073709551616]") == [2 ** 64]
+    assert fast.dumps({"n": 2 ** 64, 1: "int key"}) == \
+        '{"n":18446744073709551616,"1":"int key"}'
+    assert fast.dumps('{"already": "serialized"}') == \
+        '{"already": "serialized"}'
+
+
+@pytest.mark.unit
+@pytest.mark.helper
+def test_serializer_fallback(monkeypatch):
+    monkeypatch.setattr(es_serializer, "orjson", None)
+    assert es_serializer.available() == ["json"]
+    assert type(es_serializer.get_serializer()) is es_serializer.StdlibSerializer
+    assert type(es_serializer.get_serializer("orjson")) is \
+        es_serializer.StdlibSerializer
+    custom = es_serializer.get_serializer(
+        "elasticsearch.serializer.JSONSerializer")
+    assert type(custom) is elasticsearch.serializer.JSONSerializer
+    with pytest.raises(elasticsearch.SerializationError):
+        es_serializer.get_serializer("nonexisting")
+
+
+class Elasticmock:
+    def __init__(self, *args, **kwargs):
+        self.kwargs = kwargs
+
+
+@pytest.mark.unit
+@pytest.mark.helper
+def test_registry_serializer(apiconfig, monkeypatch):
+    monkeypatch.setattr(elasticsearch, "Elasticsearch", Elasticmock)
+    monkeypatch.setitem(apiconfig.conf, "es_client", {"serializer": "json"})
+    client = es_client.ClientRegistry().get()
+    assert type(client.kwargs["serializer"]) is es_serializer.StdlibSerializer
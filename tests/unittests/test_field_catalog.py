@@ -0,0 +1,152 @@
+import pytest
+from lod_api.tools.field_catalog import FieldCatalog
+
+
+class Elasticmock:
+    "fakes the mapping and cluster state api of elasticsearch 7"
+    def __init__(self):
+        self.mapping_calls = 0
+        self.mapping_version = 1
+        self.mappings = {
+                "persons": {"name": {}, "birthDate": {},
+                            "birthPlace": {"properties": {"name": {}}}},
+                "geo": {"name": {}, "adressRegion": {}},
+                }
+        self.indices = self
+        self.cluster = self
+
+    def info(self):
+        return {"version": {"number": [7]}}
+
+    def get_mapping(self, index):
+        self.mapping_calls += 1
+        # an alias resolves to the concrete index name
+        return {index + "-2021": {"mappings": {
+                    "properties": self.mappings[index]}}}
+
+    def state(self, **kwargs):
+        return {"metadata": {"indices": {
+                    index + "-2021": {"mapping_version": self.mapping_version}
+                    for index in self.mappings}}}
+
+
+@pytest.fixture
+def catalog(apiconfig, monkeypatch):
+    monkeypatch.setitem(apiconfig.conf, "indices_list", ["persons", "geo"])
+    monkeypatch.setitem(apiconfig.conf, "field_catalog",
+                        {"ttl": 3600, "check_interval": 0})
+    return FieldCatalog(es=Elasticmock())
+
+
+@pytest.mark.unit
+@pytest.mark.helper
+def test_field_catalog_propose(catalog):
+    assert catalog.propose("persons") == [
+            "name", "birthDate", "birthPlace", "birthPlace.name"]
+    assert catalog.propose("persons", 2) == ["name", "birthDate"]
+    assert catalog.propose("topics") is None
+
+
+@pytest.mark.unit
+@pytest.mark.helper
+def test_field_catalog_suggest(catalog):
+    assert catalog.suggest() == ["adressRegion", "birthDate", "birthPlace",
+                                 "birthPlace.name", "name"]
+    assert catalog.suggest("birth") == ["birthDate", "birthPlace",
+                                        "birthPlace.name"]
+    assert catalog.suggest("birthPlace.") == ["birthPlace.name"]
+    assert catalog.suggest("birth", limit=1) == ["birthDate"]
+    assert catalog.suggest("x") == []
+
+
+@pytest.mark.unit
+@pytest.mark.helper
+def test_field_catalog_rebuild_on_mapping_change(catalog):
+    es = catalog._es
+    catalog.suggest("b")
+    catalog.suggest("b")
+    assert es.mapping_calls == 2        # one call per index
+
+    es.mappings["geo"]["birthDate"] = {}
+    es.mapping_version = 2
+    assert catalog.propose("geo") == ["name", "adressRegion", "birthDate"]
+    assert es.mapping_calls == 4
+
+
+@pytest.mark.unit
+@pytest.mark.helper
+def test_field_catalog_stale_on_failure(catalog, app):
+    import elasticsearch
+    from lod_api.tools import resilience
+
+    es = catalog._es
+    assert catalog.suggest("name") == ["name"]
+
+    def unavailable(**kwargs):
+        raise elasticsearch.ConnectionError("N/A", "unavailable", Exception())
+    es.get_mapping = unavailable
+    es.mapping_version = 2
+    with app.test_request_context("/reconcile/suggest/property"):
+        # served from the outdated catalog and flagged as stale
+        assert catalog.suggest("name") == ["name"]
+        assert resilience.is_stale()
+
+
+@pytest.mark.unit
+@pytest.mark.helper
+def test_field_catalog_rebuild_in_background(catalog, apiconfig, monkeypatch):
+    import time
+    from lod_api.tools.cache import refresher
+    monkeypatch.setitem(apiconfig.conf, "field_catalog",
+                        {"ttl": 3600, "check_interval": 0, "stale": 600})
+    es = catalog._es
+    assert catalog.propose("geo") == ["name", "adressRegion"]
+
+    es.mappings["geo"]["birthDate"] = {}
+    es.mapping_version = 2
+    # the outdated catalog answers while it is rebuilt
+    assert catalog.propose("geo") == ["name", "adressRegion"]
+    for _ in range(50):
+        if not refresher.stats()["pending"]:
+            break
+        time.sleep(0.02)
+    assert catalog.propose("geo") == ["name", "adressRegion", "birthDate"]
+
+
+@pytest.mark.unit
+@pytest.mark.helper
+def test_field_catalog_routed(apiconfig, monkeypatch):
+    import elasticsearch
+    monkeypatch.setitem(apiconfig.conf, "indices_list", ["persons", "geo"])
+    monkeypatch.setitem(apiconfig.conf, "field_catalog",
+                        {"ttl": 3600, "check_interval": 0})
+    monkeypatch.setitem(apiconfig.conf, "es_clusters",
+                        {"replicas": ["replica1", "replica2"]})
+    monkeypatch.setitem(apiconfig.conf, "es_routing", {"persons": "replicas"})
+    clusters = {}
+
+    class RoutedMock(Elasticmock):
+        """ one cluster per host, answering for its own indices """
+        def __init__(self, hosts, **kwargs):
+            super().__init__()
+
+        def state(self, index, **kwargs):
+            return {"metadata": {"indices": {
+                        i + "-2021": {"mapping_version": self.mapping_version}
+                        for i in index.split(",")}}}
+
+    def cluster(hosts, **kwargs):
+        return clusters.setdefault(repr(hosts), RoutedMock(hosts))
+    monkeypatch.setattr(elasticsearch, "Elasticsearch", cluster)
+
+    catalog = FieldCatalog()
+    assert catalog.propose("persons") == [
+            "name", "birthDate", "birthPlace", "birthPlace.name"]
+    replicas = clusters[repr(["replica1", "replica2"])]
+    assert replicas.mapping_calls == 1
+
+    # the mapping of persons changes on the cluster serving it
+    replicas.mappings["persons"]["deathDate"] = {}
+    replicas.mapping_version = 2
+    assert "deathDate" in catalog.propose("persons")
+    assert replicas.mapping_calls == 2
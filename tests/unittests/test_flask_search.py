@@ -1,3 +1,5 @@
+import json
+
 import pytest
 from lod_api.apis.search_and_access import *
 
@@ -33,3 +35,192 @@ def test_search(client, monkeypatch):
             {"@id": "2", "content": "second_hit"}
             ]
 
+
+class ElasticmockCounting(Elasticmock):
+    searches = 0
+
+    def search(self, *args, **kwargs):
+        ElasticmockCounting.searches += 1
+        return super().search(*args, **kwargs)
+
+
+@pytest.mark.unit
+@pytest.mark.api_search
+def test_search_cached(client, monkeypatch):
+    monkeypatch.setattr(elasticsearch, "Elasticsearch", ElasticmockCounting)
+    monkeypatch.setattr(ElasticmockCounting, "searches", 0)
+
+    first = client.get("/search?q=Dresden&size=2")
+    assert first.status_code == 200
+    # same normalized parameters, other format
+    response = client.get("/search?size=2&q=Dresden%20&format=jsonl")
+    assert response.status_code == 200
+    assert ElasticmockCounting.searches == 1
+
+    response = client.get("/search?q=Dresden&size=3")
+    assert ElasticmockCounting.searches == 2
+
+    response = client.get("/search?q=Dresden&size=2",
+                          headers={"Cache-Control": "no-cache"})
+    assert response.json == first.json
+    assert ElasticmockCounting.searches == 3
+
+    client.get("/persons/search?q=Dresden")
+    client.get("/persons/search?q=Dresden")
+    client.get("/geo/search?q=Dresden")
+    assert ElasticmockCounting.searches == 5
+
+
+@pytest.mark.unit
+@pytest.mark.api_search
+def test_search_representation_cached(client, apiconfig, monkeypatch):
+    from lod_api.tools.response import Response
+    monkeypatch.setattr(elasticsearch, "Elasticsearch", ElasticmockCounting)
+    monkeypatch.setitem(apiconfig.conf, "compression", {"min_size": 0})
+    monkeypatch.setattr(ElasticmockCounting, "searches", 0)
+    calls = {"convert": 0, "compress": 0}
+    convert, compress = Response.convert, Response._compress
+
+    def counting_convert(self, *args):
+        calls["convert"] += 1
+        return convert(self, *args)
+
+    def counting_compress(self, *args):
+        calls["compress"] += 1
+        return compress(self, *args)
+
+    monkeypatch.setattr(Response, "convert", counting_convert)
+    monkeypatch.setattr(Response, "_compress", counting_compress)
+
+    gzip = {"Accept-Encoding": "gzip"}
+    first = client.get("/persons/search?q=Dresden&format=jsonl", headers=gzip)
+    assert first.headers["Content-Encoding"] == "gzip"
+    second = client.get("/persons/search?q=Dresden&format=jsonl", headers=gzip)
+    assert second.data == first.data
+    assert calls == {"convert": 1, "compress": 1}
+
+    # the plain representation is not converted again
+    plain = client.get("/persons/search?q=Dresden&format=jsonl")
+    assert "Content-Encoding" not in plain.headers
+    assert plain.data.count(b"\n") == 2
+    assert calls == {"convert": 1, "compress": 1}
+
+    response = client.get("/persons/search?q=Dresden&format=jsonl",
+                          headers={"If-None-Match": plain.headers["ETag"]})
+    assert response.status_code == 304
+    assert ElasticmockCounting.searches == 1
+
+
+@pytest.mark.unit
+@pytest.mark.api_search
+def test_search_prefetch_next_page(client, apiconfig, monkeypatch):
+    import time
+    from lod_api.apis import search_and_access
+    monkeypatch.setattr(elasticsearch, "Elasticsearch", ElasticmockCounting)
+    monkeypatch.setattr(ElasticmockCounting, "searches", 0)
+    monkeypatch.setitem(apiconfig.conf, "search_prefetch", {"enabled": True})
+
+    def wait():
+        for _ in range(50):
+            if not search_and_access.prefetcher.stats()["pending"]:
+                break
+            time.sleep(0.02)
+
+    client.get("/persons/search?q=Dresden&size=2")
+    wait()
+    assert ElasticmockCounting.searches == 2
+    # the second page was prefetched, the third one is prefetched now
+    client.get("/persons/search?q=Dresden&size=2&from=2")
+    wait()
+    assert ElasticmockCounting.searches == 3
+    assert search_and_access.prefetcher.stats()["refreshed"] >= 2
+
+    # no full page, no further pages
+    client.get("/persons/search?q=Dresden&size=5")
+    wait()
+    assert ElasticmockCounting.searches == 4
+
+
+@pytest.mark.unit
+@pytest.mark.api_search
+def test_search_streamed(client, apiconfig, monkeypatch):
+    import gzip
+    import json
+    monkeypatch.setattr(elasticsearch, "Elasticsearch", ElasticmockCounting)
+    monkeypatch.setattr(ElasticmockCounting, "searches", 0)
+    # results of more than one item are streamed uncached
+    monkeypatch.setitem(apiconfig.conf, "streaming", {"stream_items": 1})
+    monkeypatch.setitem(apiconfig.conf, "compression", {"min_size": 0})
+
+    response = client.get("/persons/search?q=Dresden&format=jsonl")
+    assert response.is_streamed
+    assert "Content-Length" not in response.headers
+    assert [json.loads(line) for line in response.data.splitlines()] == [
+            {"@id": "1", "content": "first_hit"},
+            {"@id": "2", "content": "second_hit"}
+            ]
+
+    response = client.get("/persons/search?q=Dresden",
+                          headers={"Accept-Encoding": "gzip"})
+    assert response.is_streamed
+    assert response.headers["Content-Encoding"] == "gzip"
+    assert gzip.decompress(response.data) == \
+        b'[{"@id":"1","content":"first_hit"},' \
+        b'{"@id":"2","content":"second_hit"}]\n'
+    # the hits are cached, the representations are not
+    assert ElasticmockCounting.searches == 1
+    assert len(representation_cache) == 0
+
+
+@pytest.mark.unit
+@pytest.mark.api_search
+def test_search_compression(client, apiconfig, monkeypatch):
+    import gzip
+    from lod_api.tools import response as response_module
+    monkeypatch.setattr(elasticsearch, "Elasticsearch", Elasticmock)
+
+    # small bodies are not compressed, streamed or not
+    for stream_items in (1, 1000):
+        monkeypatch.setitem(apiconfig.conf, "streaming",
+                            {"stream_items": stream_items})
+        response = client.get("/persons/search?q=Dresden&size=2",
+                              headers={"Accept-Encoding": "gzip"})
+        assert "Content-Encoding" not in response.headers
+        assert response.headers["Vary"] == "Accept-Encoding"
+        assert len(response.json) == 2
+
+    monkeypatch.setitem(apiconfig.conf, "compression", {"min_size": 10})
+    # zstd and brotli are only used if they are installed
+    monkeypatch.setattr(response_module, "zstandard", None)
+    monkeypatch.setattr(response_module, "brotli", None)
+    response = client.get("/persons/search?q=Dresden&size=3",
+                          headers={"Accept-Encoding": "zstd, br, gzip"})
+    assert response.headers["Content-Encoding"] == "gzip"
+    assert len(json.loads(gzip.decompress(response.data))) == 2
+    response = client.get("/persons/search?q=Dresden&size=3",
+                          headers={"Accept-Encoding": "gzip;q=0, zstd"})
+    assert "Content-Encoding" not in response.headers
+
+
+@pytest.mark.unit
+@pytest.mark.api_search
+@pytest.mark.parametrize("encoding,module", [("zstd", "zstandard"),
+                                             ("br", "brotli")])
+def test_search_compression_negotiated(client, apiconfig, monkeypatch,
+                                       encoding, module):
+    codec = pytest.importorskip(module)
+    monkeypatch.setattr(elasticsearch, "Elasticsearch", Elasticmock)
+    monkeypatch.setitem(apiconfig.conf, "compression", {"min_size": 0})
+    for stream_items in (1, 1000):
+        monkeypatch.setitem(apiconfig.conf, "streaming",
+                            {"stream_items": stream_items})
+        response = client.get(
+            "/persons/search?q=Dresden&size={}".format(stream_items),
+            headers={"Accept-Encoding": "gzip;q=0.8, " + encoding})
+        assert response.headers["Content-Encoding"] == encoding
+        if module == "zstandard":
+            data = codec.ZstdDecompressor().decompressobj().decompress(
+                response.data)
+        else:
+            data = codec.decompress(response.data)
+        assert len(json.loads(data)) == 2
@@ -0,0 +1,107 @@
+import threading
+import pytest
+import elasticsearch
+from lod_api.tools import cache
+from lod_api.tools import cache_backends
+from lod_api.tools import generations
+
+
+class IndicesMock:
+    """ aliases and indexing stats of a cluster """
+
+    def __init__(self):
+        self.aliases = {"persons": ["persons-1"], "geo": ["geo-1"]}
+        self.index_total = {"persons-1": 10, "persons-2": 10, "geo-1": 5}
+
+    def get_alias(self, index, **kwargs):
+        if index not in self.aliases:
+            raise elasticsearch.NotFoundError(404, "index_not_found_exception")
+        return {i: {"aliases": {index: {}}} for i in self.aliases[index]}
+
+    def stats(self, index, metric, **kwargs):
+        return {"indices": {
+            i: {"uuid": "uuid-" + i,
+                "primaries": {"indexing": {"index_total": self.index_total[i],
+                                           "delete_total": 0}}}
+            for i in index.split(",")}}
+
+
+class ElasticMock:
+    def __init__(self):
+        self.indices = IndicesMock()
+
+
+@pytest.fixture(autouse=True)
+def local_caches(monkeypatch):
+    """ do not register the caches of the tests """
+    monkeypatch.setattr(cache, "caches", dict(cache.caches))
+
+
+@pytest.mark.unit
+@pytest.mark.helper
+def test_generation_tokens(apiconfig, monkeypatch):
+    monkeypatch.setitem(apiconfig.conf, "indices_list", ["persons", "geo"])
+    es = ElasticMock()
+    tracker = generations.GenerationTracker(es=es)
+    tokens = tracker.fetch(["persons", "geo", "missing"])
+    assert set(tokens) == {"persons", "geo"}
+    assert tokens == tracker.fetch(["persons", "geo"])
+
+    # new documents change the token of their index only
+    es.indices.index_total["geo-1"] += 1
+    changed = tracker.fetch(["persons", "geo"])
+    assert changed["persons"] == tokens["persons"]
+    assert changed["geo"] != tokens["geo"]
+
+    # swap of an alias to an index with the same count of documents
+    es.indices.aliases["persons"] = ["persons-2"]
+    assert tracker.fetch(["persons"])["persons"] != tokens["persons"]
+
+
+@pytest.mark.unit
+@pytest.mark.helper
+def test_generation_swap_invalidates(apiconfig, monkeypatch):
+    monkeypatch.setitem(apiconfig.conf, "indices_list", ["persons", "geo"])
+    monkeypatch.setitem(apiconfig.conf, "index_generations",
+                        {"interval": 3600})
+    es = ElasticMock()
+    tracker = generations.GenerationTracker(es=es)
+    monkeypatch.setattr(generations, "tracker", tracker)
+    docs = cache.Cache("test_generations", maxsize=10, max_bytes=10000,
+                       ttl=3600, backend=cache_backends.MemoryBackend())
+
+    # the first poll runs in the background
+    polling = threading.Event()
+    fetch = tracker.fetch
+
+    def blocked(names):
+        polling.wait(5)
+        return fetch(names)
+    monkeypatch.setattr(tracker, "fetch", blocked)
+    assert generations.tags("persons") == ["persons@" + generations.UNKNOWN]
+    assert not tracker.wait_polled(0.01)
+    polling.set()
+    assert tracker.wait_polled(5)
+    persons = generations.tags("persons")
+    geo = generations.tags("geo")
+    assert persons[0].startswith("persons@")
+    assert persons[0] != "persons@" + generations.UNKNOWN
+    docs.set(persons[0] + "/1", {"name": "a"}, tags=persons)
+    docs.set(geo[0] + "/1", {"name": "b"}, tags=geo)
+    tracker.poll()
+    assert generations.tags("persons") == persons
+
+    es.indices.aliases["persons"] = ["persons-2"]
+    tracker.poll()
+    assert generations.tags("persons") != persons
+    # only the entries of the swapped index are dropped
+    assert docs.get(persons[0] + "/1") is None
+    assert docs.get(geo[0] + "/1") == {"name": "b"}
+
+
+@pytest.mark.unit
+@pytest.mark.helper
+def test_generation_tracking_disabled():
+    # disabled for the tests, see conftest.py
+    assert generations.tags("persons,geo") == ["persons", "geo"]
+    assert generations.tracker.wait_polled(0)
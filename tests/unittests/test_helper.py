@@ -125,5 +125,59 @@ def test_ES_wrapper_get_mapping_props():
     assert helper.ES_wrapper.get_mapping_props(es7, index="test") == "someother"
 
 
+class elasticsearch_counting_fake:
+    "fakes elasticsearch 6 and counts the version probes"
+    def __init__(self):
+        self.info_count = 0
+        self.kwargs = None
+
+    def info(self):
+        self.info_count += 1
+        return {"version": {"number": [6]}}
+
+    def search(self, **kwargs):
+        self.kwargs = kwargs
+        return {"hits": {"hits": []}}
+
+
+@pytest.mark.unit
+@pytest.mark.helper
+def test_ES_wrapper_version_probe_cached():
+    es = elasticsearch_counting_fake()
+    info_calls = helper.ES_wrapper.info_calls
+    for _ in range(5):
+        helper.ES_wrapper.call(es, "search", index="test")
+    assert es.info_count == 1
+    assert helper.ES_wrapper.info_calls == info_calls + 1
+
+    # probe again after the version has been reset, e.g. after
+    # a connection error
+    helper.ES_wrapper.reset_version(es)
+    helper.ES_wrapper.call(es, "search", index="test")
+    assert es.info_count == 2
+
+
+@pytest.mark.unit
+@pytest.mark.helper
+def test_ES_wrapper_version_probe_interval(apiconfig, monkeypatch):
+    es = elasticsearch_counting_fake()
+    monkeypatch.setitem(apiconfig.conf, "es_version_probe_interval", 0)
+    helper.ES_wrapper.call(es, "search", index="test")
+    helper.ES_wrapper.call(es, "search", index="test")
+    assert es.info_count == 2
+
+
+@pytest.mark.unit
+@pytest.mark.helper
+def test_ES_wrapper_translate_kwargs(monkeypatch):
+    es = elasticsearch_counting_fake()
+    monkeypatch.setattr(helper.elasticsearch, "VERSION", (6, 8, 0))
+    helper.ES_wrapper.call(es, "search", index="test",
+                           _source_excludes=["a"], _source_includes=["b"])
+    assert es.kwargs == {"index": "test",
+                         "_source_exclude": ["a"],
+                         "_source_include": ["b"]}
+
+
 if __name__ == "__main__":
     pytest.main()
@@ -0,0 +1,86 @@
+import json
+import os
+import pytest
+from lod_api.tools import json_encoder
+
+ldj_dir = os.path.join(os.path.dirname(__file__), "..", "data", "ldj")
+
+
+def ldj_records():
+    for name in sorted(os.listdir(ldj_dir)):
+        with open(os.path.join(ldj_dir, name)) as f:
+            for line in f:
+                yield json.loads(line)
+
+
+@pytest.mark.unit
+@pytest.mark.helper
+@pytest.mark.skipif(json_encoder.orjson is None, reason="orjson not installed")
+def test_orjson_encoder_matches_stdlib(app):
+    fast = json_encoder.get_encoder("orjson")
+    std = json_encoder.get_encoder("json")
+    assert isinstance(fast, json_encoder.OrjsonEncoder)
+    with app.app_context():
+        for record in ldj_records():
+            assert json.loads(fast.dumps(record)) == record
+            assert json.loads(fast.line(record)) == record
+            assert b"\n" not in fast.line(record)
+        # orjson refuses integers exceeding 64 bit
+        assert fast.dumps({"b": 2 ** 70, "a": 1}) \
+            == std.dumps({"b": 2 ** 70, "a": 1}) \
+            == b'{"a":1,"b":1180591620717411303424}'
+
+
+@pytest.mark.unit
+@pytest.mark.helper
+def test_configured_encoder(apiconfig, monkeypatch):
+    monkeypatch.setitem(apiconfig.conf, "json_encoder", "json")
+    assert isinstance(json_encoder.configured(), json_encoder.StdlibEncoder)
+    monkeypatch.setitem(apiconfig.conf, "json_encoder",
+                        "lod_api.tools.json_encoder.OrjsonEncoder")
+    assert isinstance(json_encoder.configured(), json_encoder.OrjsonEncoder)
+    with pytest.raises(ValueError):
+        json_encoder.get_encoder("lod_api.tools.json_encoder.Missing")
+
+
+@pytest.mark.unit
+@pytest.mark.helper
+def test_jsonpify(app):
+    data = {"result": [{"id": "1", "name": "Dresden"}]}
+    with app.test_request_context("/reconcile/?callback=cb"):
+        res = json_encoder.jsonpify(data)
+        assert res.mimetype == "application/javascript"
+        body = res.get_data()
+        assert body.startswith(b"cb(") and body.endswith(b");")
+        assert json.loads(body[3:-2]) == data
+    with app.test_request_context("/reconcile/"):
+        res = json_encoder.jsonpify(data)
+        assert res.mimetype == "application/json"
+        assert res.json == data
+
+
+class JSONProvider:
+    """ the attributes of the json provider of flask >= 2.2 """
+    mimetype = "application/vnd.test+json"
+    compact = None
+    sort_keys = False
+
+    @staticmethod
+    def default(o):
+        return sorted(o)
+
+
+@pytest.mark.unit
+@pytest.mark.helper
+@pytest.mark.skipif(json_encoder.orjson is None, reason="orjson not installed")
+def test_json_provider(app, apiconfig, monkeypatch):
+    monkeypatch.setitem(apiconfig.conf, "json_encoder", "orjson")
+    monkeypatch.setattr(app, "json", JSONProvider(), raising=False)
+    monkeypatch.delitem(app.config, "JSONIFY_MIMETYPE")
+    monkeypatch.delitem(app.config, "JSONIFY_PRETTYPRINT_REGULAR")
+    with app.test_request_context("/"):
+        assert not json_encoder.pretty()
+        assert not json_encoder.sort_keys()
+        res = json_encoder.jsonify({"b": {2, 1}, "a": 1})
+        assert res.mimetype == "application/vnd.test+json"
+        assert json.loads(res.get_data()) == {"b": [1, 2], "a": 1}
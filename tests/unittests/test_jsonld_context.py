@@ -0,0 +1,111 @@
+import json
+import os
+
+import elasticsearch
+import pytest
+import rdflib
+import requests
+from rdflib.compare import isomorphic
+
+from lod_api.tools import jsonld_context
+from lod_api.tools import rdf_serializer
+from lod_api.tools.jsonld_context import ContextUnavailable
+
+URL = "https://example.org/lod-api-test/context.jsonld"
+CONTEXT = {"@context": {"@vocab": "http://schema.org/",
+                        "dnb": "https://d-nb.info/standards/elementset/gnd#",
+                        "preferredName": "dnb:preferredName"}}
+DOC = {"@context": URL, "@id": "http://example.org/1", "preferredName": "one"}
+MOCKOUT = os.path.join(os.path.dirname(__file__), "..", "data", "mockout",
+                       "TestMockDataResponseFormat-resources-1358199159-{}.dat")
+
+
+@pytest.fixture
+def offline(apiconfig, monkeypatch, tmp_path):
+    """ contexts only out of the local copy of `URL` """
+    path = tmp_path / "context.jsonld"
+    path.write_text(json.dumps(CONTEXT))
+    monkeypatch.setitem(apiconfig.conf, "jsonld_contexts",
+                        {"contexts": {URL: str(path)}, "remote": False})
+
+    def no_network(*args, **kwargs):
+        raise AssertionError("context fetched remotely")
+    monkeypatch.setattr(requests, "get", no_network)
+    jsonld_context.store.clear()
+    yield path
+    jsonld_context.store.clear()
+
+
+@pytest.mark.unit
+def test_local_contexts(offline):
+    assert jsonld_context.resolve(URL) == CONTEXT["@context"]
+    assert jsonld_context.resolve([URL, {"name": "http://schema.org/name"}]) \
+        == [CONTEXT["@context"], {"name": "http://schema.org/name"}]
+    assert jsonld_context.local({"a": [DOC]}) == \
+        {"a": [dict(DOC, **CONTEXT)]}
+    # read once
+    offline.unlink()
+    assert jsonld_context.resolve(URL) == CONTEXT["@context"]
+
+    with pytest.raises(ContextUnavailable):
+        jsonld_context.resolve("https://example.org/lod-api-test/unknown")
+
+
+@pytest.mark.unit
+@pytest.mark.parametrize("fmt", ["nt", "ttl"])
+def test_serialize_offline(offline, fmt):
+    data = "".join(rdf_serializer.serialize([DOC], fmt))
+    assert "https://d-nb.info/standards/elementset/gnd#" in data
+    # the rdflib fallback uses the local copy as well
+    graphs = {"@context": URL, "@graph": [DOC]}
+    data = "".join(rdf_serializer.serialize([graphs], fmt))
+    assert "one" in data
+
+
+@pytest.mark.unit
+def test_remote_disabled_by_default(apiconfig, monkeypatch, tmp_path):
+    monkeypatch.setitem(apiconfig.conf, "jsonld_contexts",
+                        {"contexts": {URL: str(tmp_path / "missing.jsonld")}})
+
+    def no_network(*args, **kwargs):
+        raise AssertionError("context fetched remotely")
+    monkeypatch.setattr(requests, "get", no_network)
+    jsonld_context.store.clear()
+    for url in (URL, "https://example.org/lod-api-test/unknown"):
+        with pytest.raises(ContextUnavailable):
+            jsonld_context.resolve(url)
+
+
+class Elasticmock:
+    """ answers with the record of tests/data/mockout """
+
+    def __init__(self, *args, **kwargs):
+        pass
+
+    def info(self):
+        return {"version": {"number": [7]}}
+
+    def get(self, **kwargs):
+        with open(MOCKOUT.format("json")) as f:
+            record = json.load(f)[0]
+        return {"_index": kwargs["index"], "_id": kwargs["id"],
+                "_seq_no": 1, "_primary_term": 1, "found": True,
+                "_source": record}
+
+
+@pytest.mark.unit
+def test_shipped_esmarc_context(client, monkeypatch):
+    """ the RDF formats work with the example config, without network """
+    def no_network(*args, **kwargs):
+        raise AssertionError("context fetched remotely")
+    monkeypatch.setattr(requests, "get", no_network)
+    monkeypatch.setattr(elasticsearch, "Elasticsearch", Elasticmock)
+    jsonld_context.store.clear()
+
+    response = client.get("/resources/1358199159?format=nt")
+    assert response.status_code == 200
+    with open(MOCKOUT.format("nt")) as f:
+        expected = f.read()
+    graph = rdflib.Graph().parse(data=response.get_data(as_text=True),
+                                 format="nt")
+    assert isomorphic(graph, rdflib.Graph().parse(data=expected, format="nt"))
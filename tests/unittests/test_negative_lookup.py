@@ -0,0 +1,110 @@
+import pytest
+import elasticsearch
+import elasticsearch.helpers
+from lod_api.tools import generations
+from lod_api.tools import negative_lookup
+from lod_api.tools.negative_lookup import BloomFilter
+
+docs = [{"_id": "118695940",
+         "_source": {"sameAs": [{"@id": "https://d-nb.info/gnd/118695940"},
+                                {"@id": "http://viaf.org/viaf/27064953"}]}},
+        {"_id": "130909696", "_source": {}}]
+
+
+class IndicesMock:
+    def get_alias(self, index, **kwargs):
+        return {index + "-1": {"aliases": {index: {}}}}
+
+    def stats(self, index, metric, **kwargs):
+        return {"indices": {index: {"uuid": "u", "primaries": {
+            "indexing": {"index_total": 2, "delete_total": 0}}}}}
+
+
+class Elasticmock:
+    gets = 0
+
+    def __init__(self, *args, **kwargs):
+        self.indices = IndicesMock()
+
+    def info(self):
+        return {"version": {"number": [7]}}
+
+    def count(self, index, **kwargs):
+        return {"count": len(docs)}
+
+    def get(self, **kwargs):
+        Elasticmock.gets += 1
+        raise elasticsearch.NotFoundError(404, "not found", {})
+
+
+@pytest.fixture
+def filters(apiconfig, monkeypatch, tmp_path):
+    monkeypatch.setitem(apiconfig.conf, "negative_lookup",
+                        {"path": str(tmp_path), "check_interval": 0})
+    monkeypatch.setitem(apiconfig.conf, "index_generations",
+                        {"interval": 3600})
+    monkeypatch.setattr(elasticsearch.helpers, "scan",
+                        lambda es, **kwargs: iter(docs))
+    es = Elasticmock()
+    monkeypatch.setattr(generations, "tracker",
+                        generations.GenerationTracker(es=es))
+    monkeypatch.setattr(negative_lookup, "store",
+                        negative_lookup.FilterStore())
+    negative_lookup.build("persons", es=es)
+    return es
+
+
+@pytest.mark.unit
+@pytest.mark.helper
+def test_bloom_filter(tmp_path):
+    bloom = BloomFilter(1000, 0.01)
+    for i in range(1000):
+        bloom.add(str(i))
+    assert all(str(i) in bloom for i in range(1000))
+    false_positives = sum(str(i) in bloom for i in range(1000, 11000))
+    assert false_positives < 300
+
+    bloom.save(str(tmp_path / "test.bloom"), generation="abc")
+    loaded, header = BloomFilter.load(str(tmp_path / "test.bloom"))
+    assert header["generation"] == "abc" and loaded.count == 1000
+    assert all(str(i) in loaded for i in range(1000))
+
+
+@pytest.mark.unit
+@pytest.mark.helper
+def test_negative_lookup(filters):
+    assert not negative_lookup.missing_id("persons", "118695940")
+    assert negative_lookup.missing_id("persons", "1")
+    # no filter built for this index
+    assert not negative_lookup.missing_id("geo", "1")
+
+    assert not negative_lookup.missing_authority(
+        ["persons"], "http://d-nb.info/gnd/118695940")
+    assert negative_lookup.missing_authority(["persons"], "d-nb.info/gnd/1")
+    assert not negative_lookup.missing_authority(["persons", "geo"],
+                                                 "d-nb.info/gnd/1")
+
+
+@pytest.mark.unit
+@pytest.mark.helper
+def test_negative_lookup_outdated(filters):
+    filters.indices.stats = lambda index, metric, **kwargs: {"indices": {
+        index: {"uuid": "u", "primaries": {"indexing": {"index_total": 3}}}}}
+    generations.tracker.poll()
+    # new documents might be unknown to the filter
+    assert not negative_lookup.missing_id("persons", "1")
+
+
+@pytest.mark.unit
+@pytest.mark.api_search
+def test_retrieve_unknown_id(client, filters, monkeypatch):
+    monkeypatch.setattr(elasticsearch, "Elasticsearch", Elasticmock)
+    monkeypatch.setattr(Elasticmock, "gets", 0)
+    # definite miss of the filter
+    assert client.get("/persons/1").status_code == 404
+    assert Elasticmock.gets == 0
+    # passes the filter, the miss of elasticsearch is remembered
+    monkeypatch.setattr(BloomFilter, "__contains__", lambda self, item: True)
+    assert client.get("/persons/2").status_code == 404
+    assert client.get("/persons/2").status_code == 404
+    assert Elasticmock.gets == 1
@@ -0,0 +1,121 @@
+import glob
+import json
+import os
+
+import pytest
+import rdflib
+
+from lod_api.tools import rdf_serializer
+
+data_dir = os.path.join(os.path.dirname(__file__), "..", "data")
+mockout = os.path.join(data_dir, "mockout")
+
+# the terms of the records in tests/data, without the remote context
+CONTEXT = {
+    "@vocab": "http://schema.org/",
+    "dnb": "https://d-nb.info/standards/elementset/gnd#",
+    "preferredName": "dnb:preferredName",
+}
+# exercising coercions and languages
+RICH_CONTEXT = dict(
+    CONTEXT,
+    **{"@language": "de",
+       "xsd": "http://www.w3.org/2001/XMLSchema#",
+       "inLanguage": {"@id": "http://schema.org/inLanguage",
+                      "@language": None},
+       "isBasedOn": {"@id": "http://schema.org/isBasedOn", "@type": "@id"},
+       "birthDate": {"@id": "http://schema.org/birthDate",
+                     "@type": "xsd:gYear"},
+       "genre": {"@id": "http://schema.org/genre", "@type": "@vocab"}})
+
+
+def records(context):
+    """ records of tests/data/mockout and the first records of each file
+        of tests/data/ldj, with the local `context` """
+    docs = []
+    for path in sorted(glob.glob(os.path.join(mockout, "*-json.dat"))):
+        with open(path) as f:
+            docs.extend(json.load(f))
+    for path in sorted(glob.glob(os.path.join(data_dir, "ldj", "*"))):
+        with open(path) as f:
+            docs.extend(json.loads(line) for line, _ in zip(f, range(10)))
+    for doc in docs:
+        doc["@context"] = context
+    return docs
+
+
+def graph(data, fmt):
+    """ triples of the serialization `data`, without graph names """
+    dataset = rdflib.ConjunctiveGraph()
+    dataset.parse(data=data, format=fmt)
+    g = rdflib.Graph()
+    for triple in dataset.triples((None, None, None)):
+        g.add(triple)
+    return g
+
+
+def canonical(g):
+    """ triples of `g` with blank nodes replaced by their properties,
+        comparable for the trees of blank nodes of the records """
+    signatures = {}
+
+    def term(t):
+        if not isinstance(t, rdflib.BNode):
+            return t.n3()
+        if t not in signatures:
+            signatures[t] = "[" + ";".join(sorted(
+                p.n3() + " " + term(o) for p, o in g.predicate_objects(t))) + "]"
+        return signatures[t]
+    return sorted(term(s) + " " + p.n3() + " " + term(o) for s, p, o in g)
+
+
+def rdflib_graph(doc):
+    return graph(json.dumps(doc), "json-ld")
+
+
+@pytest.mark.unit
+def test_mockout_nt():
+    with open(os.path.join(
+            mockout,
+            "TestMockDataResponseFormat-resources-1358199159-json.dat")) as f:
+        docs = json.load(f)
+    docs[0]["@context"] = CONTEXT
+    with open(os.path.join(
+            mockout,
+            "TestMockDataResponseFormat-resources-1358199159-nt.dat")) as f:
+        expected = graph(f.read(), "nt")
+    data = "".join(rdf_serializer.serialize(docs, "nt"))
+    assert canonical(graph(data, "nt")) == canonical(expected)
+
+
+@pytest.mark.unit
+@pytest.mark.parametrize("context", [CONTEXT, RICH_CONTEXT])
+def test_conformance(context):
+    for doc in records(context):
+        rdf_serializer.nodes(doc)       # serialized natively
+        expected = canonical(rdflib_graph(doc))
+        for fmt, rdflib_fmt in (("nt", "nt"), ("nq", "nquads"),
+                                ("ttl", "turtle")):
+            data = "".join(rdf_serializer.serialize([doc], fmt))
+            assert canonical(graph(data, rdflib_fmt)) == expected, doc
+
+
+@pytest.mark.unit
+def test_fallback():
+    native = {"@context": CONTEXT, "@id": "http://example.org/1",
+              "name": "one", "numberOfPages": 16, "geo": {"latitude": 51.05}}
+    graphs = {"@context": CONTEXT, "@graph": [
+                 {"@id": "http://example.org/2", "name": "two"}]}
+    relative = {"@context": CONTEXT, "@id": "3", "name": "three"}
+    for doc in (graphs, relative):
+        with pytest.raises(rdf_serializer.Unsupported):
+            rdf_serializer.nodes(doc)
+
+    docs = [native, graphs, native, relative]
+    expected = rdflib.Graph()
+    for doc in docs:
+        for triple in rdflib_graph(doc):
+            expected.add(triple)
+    for fmt, rdflib_fmt in (("nt", "nt"), ("ttl", "turtle")):
+        data = "".join(rdf_serializer.serialize(docs, fmt))
+        assert canonical(graph(data, rdflib_fmt)) == canonical(expected)
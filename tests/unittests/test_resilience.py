@@ -0,0 +1,123 @@
+import pytest
+import elasticsearch
+from lod_api.tools import deadline
+from lod_api.tools import resilience
+from lod_api.tools.helper import ES_wrapper
+
+
+class Elasticmock:
+    "fakes an elasticsearch which fails the first `failures` requests"
+    def __init__(self, failures=0, error=None):
+        self.failures = failures
+        self.error = error or elasticsearch.ConnectionError(
+            "N/A", "connection refused", Exception())
+        self.calls = 0
+
+    def info(self):
+        return {"version": {"number": [7]}}
+
+    def search(self, **kwargs):
+        self.calls += 1
+        if self.calls <= self.failures:
+            raise self.error
+        return {"hits": {"hits": []}}
+
+    def index(self, **kwargs):
+        return self.search(**kwargs)
+
+
+@pytest.fixture(autouse=True)
+def resilience_config(apiconfig, monkeypatch):
+    monkeypatch.setitem(apiconfig.conf, "es_resilience", {
+        "retries": 2, "breaker_threshold": 3, "breaker_reset": 30})
+    monkeypatch.setattr(resilience.time, "sleep", lambda x: None)
+    resilience.breakers.clear()
+    yield
+    resilience.breakers.clear()
+
+
+@pytest.mark.unit
+@pytest.mark.helper
+def test_retry_reads():
+    es = Elasticmock(failures=2)
+    assert ES_wrapper.call(es, "search", index="persons") == {"hits": {"hits": []}}
+    assert es.calls == 3
+    assert resilience.breakers.state()["persons"]["state"] == "closed"
+
+
+@pytest.mark.unit
+@pytest.mark.helper
+def test_no_retry_for_writes_and_bad_requests():
+    es = Elasticmock(failures=1)
+    with pytest.raises(elasticsearch.ConnectionError):
+        ES_wrapper.call(es, "index", index="persons")
+    assert es.calls == 1
+
+    es = Elasticmock(failures=1, error=elasticsearch.NotFoundError(
+        404, "not found", {}))
+    with pytest.raises(elasticsearch.NotFoundError):
+        ES_wrapper.call(es, "search", index="persons")
+    assert es.calls == 1
+    assert resilience.breakers.state()["persons"]["failures"] == 0
+
+
+@pytest.mark.unit
+@pytest.mark.helper
+def test_circuit_breaker(monkeypatch):
+    es = Elasticmock(failures=100)
+    with pytest.raises(elasticsearch.ConnectionError):
+        ES_wrapper.call(es, "search", index="persons")
+    assert es.calls == 3
+    assert resilience.breakers.state()["persons"]["state"] == "open"
+
+    # fail fast without touching elasticsearch
+    with pytest.raises(resilience.CircuitOpenError):
+        ES_wrapper.call(es, "search", index="persons")
+    assert es.calls == 3
+    # other indices are not affected
+    assert ES_wrapper.call(Elasticmock(), "search", index="geo")
+
+    # a single trial request after the reset time closes the breaker
+    now = resilience.time.monotonic()
+    monkeypatch.setattr(resilience.time, "monotonic", lambda: now + 31)
+    es.failures = 0
+    ES_wrapper.call(es, "search", index="persons")
+    assert resilience.breakers.state()["persons"] == {
+            "state": "closed", "failures": 0, "trips": 1}
+
+
+@pytest.mark.unit
+@pytest.mark.helper
+def test_deadline_timeouts_not_counted(app, monkeypatch):
+    timeout = elasticsearch.ConnectionTimeout("TIMEOUT", "timed out",
+                                              Exception())
+    with app.test_request_context("/search"):
+        deadline.start(seconds=10)
+        # timed out with time left: the cluster is slow
+        es = Elasticmock(failures=1, error=timeout)
+        with pytest.raises(elasticsearch.ConnectionTimeout):
+            ES_wrapper.call(es, "index", index="persons")
+        assert resilience.breakers.state()["persons"]["failures"] == 1
+
+        # timed out because the budget of the api request ran out
+        breaker = resilience.breakers.get("persons")
+        breaker._trial = True
+        es = Elasticmock(failures=1, error=timeout)
+        deadline.start(seconds=0)
+        with pytest.raises(elasticsearch.ConnectionTimeout):
+            resilience.call(lambda: es.search(), index="persons",
+                            idempotent=True)
+        assert es.calls == 1
+        assert resilience.breakers.state()["persons"]["failures"] == 1
+        assert not breaker._trial
+
+
+@pytest.mark.offline
+@pytest.mark.api_search
+def test_circuit_open_response(client, monkeypatch):
+    def search(*args, **kwargs):
+        raise resilience.CircuitOpenError("persons", 12)
+    monkeypatch.setattr(ES_wrapper, "call", search)
+    response = client.get("/search")
+    assert response.status_code == 503
+    assert response.headers["Retry-After"] == "12"
@@ -0,0 +1,93 @@
+import threading
+import time
+import pytest
+from lod_api.tools import singleflight
+from lod_api.tools.helper import ES_wrapper
+
+
+class Elasticmock:
+    "fakes a slow elasticsearch and counts the searches"
+    def __init__(self):
+        self.calls = 0
+
+    def info(self):
+        return {"version": {"number": [7]}}
+
+    def msearch(self, **kwargs):
+        self.calls += 1
+        time.sleep(0.1)
+        return {"responses": [{"hits": {"hits": []}}]}
+
+
+@pytest.mark.unit
+@pytest.mark.helper
+def test_request_key_normalized():
+    es = object()
+    key1 = singleflight.request_key(
+            es, "msearch", {"index": "resources",
+                            "body": '{}\n{"size": 0, "query": {}}\n'})
+    key2 = singleflight.request_key(
+            es, "msearch", {"index": "resources",
+                            "body": '{}\n{"query":{},"size":0}'})
+    assert key1 == key2
+    assert key1 != singleflight.request_key(
+            es, "msearch", {"index": "persons",
+                            "body": '{}\n{"size": 0, "query": {}}\n'})
+    assert key1 != singleflight.request_key(
+            es, "search", {"index": "resources",
+                           "body": '{}\n{"size": 0, "query": {}}\n'})
+
+
+@pytest.mark.unit
+@pytest.mark.helper
+def test_coalesce_identical_requests():
+    es = Elasticmock()
+    coalesced = singleflight.flights.coalesced
+    results = []
+
+    def search():
+        results.append(ES_wrapper.call(es, "msearch", index="resources",
+                                       body='{}\n{"size": 0}\n'))
+    threads = [threading.Thread(target=search) for _ in range(5)]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+
+    assert es.calls == 1
+    assert singleflight.flights.coalesced == coalesced + 4
+    assert results == [{"responses": [{"hits": {"hits": []}}]}] * 5
+    # shared results are independent copies
+    assert len(set(id(r) for r in results)) == 5
+
+    # requests after the flight landed are sent again
+    search()
+    assert es.calls == 2
+
+
+@pytest.mark.unit
+@pytest.mark.helper
+def test_coalesce_exceptions():
+    flights = singleflight.SingleFlight()
+    started = threading.Event()
+    errors = []
+
+    def fail():
+        started.set()
+        time.sleep(0.1)
+        raise ValueError("failed")
+
+    def follow():
+        started.wait()
+        try:
+            flights.do("key", fail)
+        except ValueError as e:
+            errors.append(e)
+
+    follower = threading.Thread(target=follow)
+    follower.start()
+    with pytest.raises(ValueError):
+        flights.do("key", fail)
+    follower.join()
+    assert len(errors) == 1
+    assert flights.stats() == {"calls": 1, "coalesced": 1, "in_flight": 0}
@@ -0,0 +1,172 @@
+import threading
+import time
+import pytest
+import elasticsearch
+from lod_api.tools import cache
+from lod_api.tools import generations
+from lod_api.tools import warmup
+
+
+class Elasticmock:
+    gets = 0
+
+    def __init__(self, *args, **kwargs):
+        pass
+
+    def info(self):
+        return {"version": {"number": [7]}}
+
+    def get(self, **kwargs):
+        Elasticmock.gets += 1
+        return {"_index": kwargs["index"], "_id": kwargs["id"],
+                "_seq_no": 1, "_primary_term": 1, "found": True,
+                "_source": {"@id": kwargs["id"], "name": "Dresden"}}
+
+
+@pytest.fixture
+def popularity(tmp_path, monkeypatch):
+    pop = warmup.Popularity(str(tmp_path / "popularity.json"))
+    monkeypatch.setattr(warmup, "popularity", pop)
+    return pop
+
+
+@pytest.mark.unit
+@pytest.mark.helper
+def test_popularity_histogram(popularity, apiconfig, monkeypatch):
+    monkeypatch.setitem(apiconfig.conf, "warmup", {"keep": 2, "decay": 0.5})
+    for _ in range(3):
+        popularity.record("/persons/1")
+    popularity.record("/search", "q=Dresden")
+    popularity.save()
+    assert popularity.top() == [("/persons/1", ""), ("/search?q=Dresden", "")]
+
+    # former counts decay, only the `keep` most popular are kept
+    for _ in range(2):
+        popularity.record("/geo/2", "", "text/turtle")
+    popularity.save()
+    assert popularity.top() == [("/geo/2", "text/turtle"), ("/persons/1", "")]
+    assert popularity.top(1) == [("/geo/2", "text/turtle")]
+
+
+@pytest.mark.unit
+@pytest.mark.helper
+def test_popularity_bounded(popularity, apiconfig, monkeypatch):
+    monkeypatch.setitem(apiconfig.conf, "warmup", {"keep": 2})
+    for _ in range(3):
+        popularity.record("/persons/1")
+    # a link checker requesting unique urls
+    for i in range(100):
+        popularity.record("/resources/{}".format(i))
+        assert len(popularity._counts) <= 8
+    assert popularity.top(1) == [("/persons/1", "")]
+
+
+@pytest.mark.unit
+@pytest.mark.helper
+def test_popularity_workers(popularity, apiconfig, monkeypatch):
+    monkeypatch.setitem(apiconfig.conf, "warmup", {"decay": 1})
+    # workers of a host merge their counts into the same file
+    workers = [warmup.Popularity(popularity.path) for _ in range(4)]
+
+    def count(worker, n):
+        for i in range(20):
+            worker.record("/persons/{}".format(n))
+            worker.save()
+    threads = [threading.Thread(target=count, args=(w, n))
+               for n, w in enumerate(workers)]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    assert popularity.load() == {warmup.request_key("/persons/{}".format(n)):
+                                 20 for n in range(4)}
+
+
+@pytest.mark.unit
+@pytest.mark.helper
+def test_seed_from_log(popularity, tmp_path):
+    log = tmp_path / "access.log"
+    log.write_text(
+        '127.0.0.1 - - [18/Oct/2026:10:00:00 +0200] "GET /persons/1 HTTP/1.1" 200 512\n'
+        '127.0.0.1 - - [18/Oct/2026:10:00:01 +0200] "GET /persons/1 HTTP/1.1" 200 512\n'
+        '127.0.0.1 - - [18/Oct/2026:10:00:02 +0200] "GET /persons/2 HTTP/1.1" 404 12\n'
+        '127.0.0.1 - - [18/Oct/2026:10:00:03 +0200] "GET /search?q=a HTTP/1.1" 200 90\n')
+    assert warmup.seed_from_log(str(log)) == 3
+    assert popularity.top() == [("/persons/1", ""), ("/search?q=a", "")]
+
+
+@pytest.mark.unit
+@pytest.mark.api_search
+def test_warm_fills_caches(app, client, popularity, monkeypatch):
+    monkeypatch.setattr(elasticsearch, "Elasticsearch", Elasticmock)
+    monkeypatch.setattr(Elasticmock, "gets", 0)
+    client.get("/persons/1")
+    client.get("/persons/1")
+    client.get("/doc/api/")     # not a cached endpoint
+    assert popularity.top() == [("/persons/1", "")]
+    assert Elasticmock.gets == 1
+
+    cache.clear_all()
+    assert warmup.warm(app, budget=10) == 1
+    assert Elasticmock.gets == 2
+    # replays are not counted
+    assert popularity.top() == [("/persons/1", "")]
+    assert popularity._counts[warmup.request_key("/persons/1")] == 2
+    client.get("/persons/1")
+    assert Elasticmock.gets == 2
+
+
+@pytest.mark.unit
+@pytest.mark.helper
+def test_start_seeds_from_log(app, popularity, apiconfig, monkeypatch,
+                              tmp_path):
+    log = tmp_path / "access.log"
+    log.write_text('127.0.0.1 - - [18/Oct/2026:10:00:00 +0200]'
+                   ' "GET /doc/api/ HTTP/1.1" 200 512\n')
+    monkeypatch.setitem(apiconfig.conf, "warmup",
+                        {"seed_log": str(log), "interval": 0, "budget": 0})
+    warmup.start(app)
+    assert popularity.load() == {warmup.request_key("/doc/api/"): 1}
+
+
+class IndicesMock:
+    """ one concrete index behind every alias """
+
+    def get_alias(self, index, **kwargs):
+        return {index + "-1": {"aliases": {index: {}}}}
+
+    def stats(self, index, metric, **kwargs):
+        return {"indices": {i: {"uuid": i} for i in index.split(",")}}
+
+
+class GenerationsElasticmock(Elasticmock):
+    indices = IndicesMock()
+
+
+@pytest.mark.unit
+@pytest.mark.api_search
+def test_warm_survives_first_poll(app, client, popularity, apiconfig,
+                                  monkeypatch):
+    monkeypatch.setattr(elasticsearch, "Elasticsearch",
+                        GenerationsElasticmock)
+    monkeypatch.setattr(Elasticmock, "gets", 0)
+    monkeypatch.setitem(apiconfig.conf, "index_generations",
+                        {"interval": 3600})
+    monkeypatch.setitem(apiconfig.conf, "warmup", {"interval": 0})
+    tracker = generations.GenerationTracker(es=GenerationsElasticmock())
+    monkeypatch.setattr(generations, "tracker", tracker)
+    fetch = tracker.fetch
+
+    def slow(names):
+        time.sleep(0.2)
+        return fetch(names)
+    monkeypatch.setattr(tracker, "fetch", slow)
+    popularity.record("/persons/1")
+
+    # the start of the api, see `lod_api.cli.start_api`
+    tracker.start()
+    warmup.start(app)
+    assert Elasticmock.gets == 1
+    tracker.poll()
+    client.get("/persons/1")
+    assert Elasticmock.gets == 1